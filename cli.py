@@ -0,0 +1,369 @@
+"""
+A command line interface for bulk maintenance of the decks in the decks directory, without starting the GUI.
+
+Usage: python -m cli [--decks-directory DIRECTORY] <command> [options]
+Run "python -m cli --help" or "python -m cli <command> --help" for the available commands and their options.
+
+Deck files are processed one card at a time, so memory use stays flat regardless of the size of the collection. Every
+rewrite holds the deck file's lock, so it is safe to run while the app is open; the app will pick up the changes.
+"""
+import os
+import sys
+import argparse
+import itertools
+from datetime import datetime, timedelta
+from typing import Iterator
+from uuid import uuid4
+
+import utils
+import tracing
+from models.Deck import Deck
+from models.Flashcard import Flashcard
+from services.Exporters import EXPORT_FORMATS, export_cards
+from services.Importers import open_anki_package, iter_anki_cards
+from services.SyncClient import SyncClient, SyncState, card_snapshot, apply_sync_result
+
+
+def iter_deck_files(directory: str, deck_names: list[str] = None) -> Iterator[tuple[str, str]]:
+    """
+    Find the deck files in the decks directory
+    :param directory: The decks directory
+    :param deck_names: The names of the decks to include, or None to include all decks
+    :return: An iterator of (deck name, deck file) tuples, sorted by deck name
+    """
+    for filename in sorted(os.listdir(directory)):
+        filepath = utils.deck_filepath_from_filename(directory, filename)
+        deck_name = utils.split_deck_filename(filename)[0]
+        if not (utils.is_valid_filename(filename) and utils.is_valid_path(directory, filepath)):
+            continue
+        if deck_names is None or deck_name in deck_names:
+            yield deck_name, filepath
+
+
+def find_deck_file(directory: str, deck_name: str, file_format: str) -> str:
+    """
+    Find the file of a deck, which may be compressed, or get the file a new deck should be written to
+    :param directory: The decks directory
+    :param deck_name: The name of the deck
+    :param file_format: The format of a new deck file, one of utils.DECK_FILE_FORMATS
+    :return: The deck file
+    """
+    for _, filepath in iter_deck_files(directory, [deck_name]):
+        return filepath
+    return utils.deck_filepath_from_filename(directory, f"{deck_name}{utils.deck_file_extension(file_format)}")
+
+
+def matches_tags(card: Flashcard, tags: list[str]) -> bool:
+    """
+    Check whether a card has at least one of the given tags
+    :param card: The card to check
+    :param tags: The tags to look for, or None to match every card
+    :return: True if the card matches, False otherwise
+    """
+    return tags is None or any(tag in card.tags for tag in tags)
+
+
+def command_stats(args) -> int:
+    """ Print the number of new, due and mature cards and the average easiness factor of each deck. """
+    now = datetime.now()
+    columns = ["Deck", "Cards", "New", "Due", "Mature", "Avg EF"]
+    print("{:<30} {:>8} {:>8} {:>8} {:>8} {:>8}".format(*columns))
+
+    totals = [0, 0, 0, 0, 0.0]
+    for deck_name, filepath in iter_deck_files(args.decks_directory, args.deck):
+        counts = [0, 0, 0, 0, 0.0]
+        for card in utils.iter_cards_from_csv(filepath):
+            if not matches_tags(card, args.tag):
+                continue
+            counts[0] += 1
+            counts[1] += card.repetitions == 0
+            counts[2] += card.next_review_date <= now and card.repetitions > 0
+            counts[3] += card.interval >= 21
+            counts[4] += card.easiness_factor
+        totals = [total + count for total, count in zip(totals, counts)]
+        average_ef = counts[4] / counts[0] if counts[0] else 0
+        print(f"{deck_name:<30} {counts[0]:>8} {counts[1]:>8} {counts[2]:>8} {counts[3]:>8} {average_ef:>8.2f}")
+
+    average_ef = totals[4] / totals[0] if totals[0] else 0
+    print(f"{'Total':<30} {totals[0]:>8} {totals[1]:>8} {totals[2]:>8} {totals[3]:>8} {average_ef:>8.2f}")
+    return 0
+
+
+def command_reschedule(args) -> int:
+    """ Reset cards, shift their due dates or set their easiness factor. """
+    if not (args.reset or args.shift_days or args.set_ef is not None):
+        print("Nothing to do, pass --reset, --shift-days or --set-ef", file=sys.stderr)
+        return 1
+    now = datetime.now()
+
+    def reschedule(card: Flashcard) -> bool:
+        if not matches_tags(card, args.tag):
+            return False
+        if args.reset:
+            card.repetitions = 0
+            card.interval = 0
+            card.easiness_factor = 2.5
+            card.stability = None
+            card.difficulty = None
+            card.lapses = 0
+            card.next_review_date = now
+        if args.shift_days:
+            card.next_review_date += timedelta(days=args.shift_days)
+        if args.set_ef is not None:
+            card.easiness_factor = max(1.3, args.set_ef)
+        return True
+
+    return rewrite_decks(args, reschedule, "rescheduled")
+
+
+def command_retag(args) -> int:
+    """ Add, remove or rename tags. """
+    def retag(card: Flashcard) -> bool:
+        if not matches_tags(card, args.tag):
+            return False
+        old_tags = list(card.tags)
+        if args.rename:
+            old_tag, new_tag = args.rename
+            card.tags = [new_tag if tag == old_tag else tag for tag in card.tags]
+        card.tags = [tag for tag in card.tags if tag not in (args.remove or [])]
+        for tag in args.add or []:
+            if tag not in card.tags:
+                card.tags.append(tag)
+        # Drop the empty tag left by cards that had no tags, once they have a real one
+        if len(card.tags) > 1:
+            card.tags = [tag for tag in card.tags if tag]
+        return card.tags != old_tags
+
+    return rewrite_decks(args, retag, "retagged")
+
+
+def rewrite_decks(args, transform, verb: str) -> int:
+    """
+    Stream every selected deck through a transform and report how many cards it changed
+    :param args: The parsed command line arguments, including the deck selection
+    :param transform: A function that changes a card in place, and returns True if it changed anything
+    :param verb: How to describe the change in the report
+    :return: The exit code
+    """
+    total = 0
+    for deck_name, filepath in iter_deck_files(args.decks_directory, args.deck):
+        if args.dry_run:
+            changed_cards = sum(transform(card) for card in utils.iter_cards_from_csv(filepath))
+        else:
+            changed_cards = utils.rewrite_deck_file(filepath, transform)
+        total += changed_cards
+        print(f"{deck_name}: {changed_cards} cards {verb}")
+    print(f"Total: {total} cards {verb}{' (dry run)' if args.dry_run else ''}")
+    return 0
+
+
+def command_merge(args) -> int:
+    """ Merge the cards of one or more decks into a target deck. """
+    target = find_deck_file(args.decks_directory, args.into, args.deck_file_format)
+    sources = [filepath for deck_name, filepath in iter_deck_files(args.decks_directory, args.sources)
+               if filepath != target]
+    if not sources:
+        print("No source decks found", file=sys.stderr)
+        return 1
+
+    # Only the card IDs are kept in memory, to skip cards that already exist in the target
+    seen_ids = set()
+
+    def skip_duplicates(cards):
+        for card in cards:
+            if card.id not in seen_ids:
+                seen_ids.add(card.id)
+                yield card
+
+    def remember(card: Flashcard) -> bool:
+        seen_ids.add(card.id)
+        return False
+
+    extra_cards = (card for source in sources for card in skip_duplicates(utils.iter_cards_from_csv(source)))
+    utils.rewrite_deck_file(target, remember, extra_cards)
+
+    # The merged decks are kept under a different extension, so they are no longer loaded but can still be restored
+    for source in sources:
+        os.replace(source, f"{source}.merged")
+        print(f"Merged {source} into {target}")
+    return 0
+
+
+def command_export(args) -> int:
+    """ Export the selected cards, including their scheduling state, as TSV, JSON Lines or an Anki package. """
+    cards = ((deck_name, card) for deck_name, filepath in iter_deck_files(args.decks_directory, args.deck)
+             for card in utils.iter_cards_from_csv(filepath) if matches_tags(card, args.tag))
+    exporter, is_text = EXPORT_FORMATS[args.format]
+    if args.output == '-':
+        if not is_text:
+            print(f"The {args.format} format can't be written to stdout, pass --output", file=sys.stderr)
+            return 1
+        count = exporter(cards, sys.stdout)
+    else:
+        count = export_cards(cards, args.output, args.format)
+    print(f"Exported {count} cards", file=sys.stderr)
+    return 0
+
+
+def command_import(args) -> int:
+    """
+    Import the cards of an Anki package into deck files, creating a deck file for each Anki deck. Cards that are already
+    in the deck file, e.g. from importing the same package before, are updated instead of being added again.
+    """
+    utils.ensure_directory(args.decks_directory)
+    total_added = total_updated = 0
+    with open_anki_package(args.package) as connection:
+        # The cards are read grouped by deck, so each deck file is rewritten once
+        cards = (deck_card for batch in iter_anki_cards(connection) for deck_card in batch)
+        for deck_name, deck_cards in itertools.groupby(cards, key=lambda deck_card: deck_card[0]):
+            target = find_deck_file(args.decks_directory, deck_name, args.deck_file_format)
+            # The deck's imported cards are kept by ID, so the cards imported before are updated as the file is streamed
+            imported_cards = {card.id: card for _, card in deck_cards}
+
+            def update(card: Flashcard) -> bool:
+                imported_card = imported_cards.pop(card.id, None)
+                if imported_card is None:
+                    return False
+                card.update_from(imported_card)
+                return True
+
+            added_count = 0
+
+            def new_cards():
+                nonlocal added_count
+                # Taken once every card in the file was streamed, so only the cards that weren't there are added
+                cards_to_add = list(imported_cards.values())
+                imported_cards.clear()
+                added_count = len(cards_to_add)
+                yield from cards_to_add
+
+            updated_count = utils.rewrite_deck_file(target, update, new_cards())
+            total_added += added_count
+            total_updated += updated_count
+            print(f"{deck_name}: {added_count} cards imported, {updated_count} updated")
+    print(f"Total: {total_added} cards imported, {total_updated} updated")
+    return 0
+
+
+def command_convert(args) -> int:
+    """ Convert deck files to another format, e.g. to compress them. """
+    if args.to == 'zstd' and utils.zstandard is None:
+        print("Install zstandard to compress decks with zstd", file=sys.stderr)
+        return 1
+    extension = utils.DECK_FILE_FORMATS[args.to]
+    for deck_name, filepath in iter_deck_files(args.decks_directory, args.deck):
+        target = utils.deck_filepath_from_filename(args.decks_directory, f"{deck_name}{extension}")
+        if target == filepath:
+            continue
+        deck_id = str(uuid4())
+        rows = itertools.chain([utils.CSV_HEADER], ([deck_id, deck_name] + utils.card_to_row(card)
+                                                    for card in utils.iter_cards_from_csv(filepath)))
+        with utils.deck_file_lock(filepath), utils.deck_file_lock(target):
+            utils.write_rows_to_csv(rows, target, keep_backups=False)
+            old_size = os.path.getsize(filepath)
+            os.remove(filepath)
+        print(f"{deck_name}: {old_size} -> {os.path.getsize(target)} bytes")
+    return 0
+
+
+def command_sync(args) -> int:
+    """ Sync the decks with a sync server, sending the local changes and applying the changes of other devices. """
+    if not args.server:
+        print("No sync server, pass --server or set sync_server_url in settings.ini", file=sys.stderr)
+        return 1
+    decks = utils.load_decks_from_csv(args.decks_directory) if os.path.isdir(args.decks_directory) else []
+    # Decks added by other devices are saved in the format of new decks
+    Deck.file_extension = utils.deck_file_extension(args.deck_file_format)
+    state = SyncState(args.state_file)
+    state.reset_for_server(args.server)
+    result = SyncClient(args.server, state.device_id).sync(card_snapshot(decks), state)
+    changed_count = apply_sync_result(decks, state, result)
+    utils.save_decks_to_csv(decks, args.decks_directory)
+    print(f"Synced, {len(result['digests'])} cards sent and {changed_count} cards received")
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """
+    Build the command line parser
+    :return: The ArgumentParser for the CLI
+    """
+    settings = utils.load_config("settings.ini")
+    # Options aren't abbreviated, as --deck of the subcommands would be a prefix of the options starting with --deck-
+    parser = argparse.ArgumentParser(prog="python -m cli", description="Bulk maintenance for JLPyT Flashcards decks.",
+                                     allow_abbrev=False)
+    parser.add_argument("--decks-directory", default=settings.get("USER", "decks_directory", fallback="decks"),
+                        help="the decks directory, taken from settings.ini by default")
+    parser.add_argument("--deck-file-format", choices=list(utils.DECK_FILE_FORMATS),
+                        default=settings.get("USER", "deck_file_format", fallback="csv"),
+                        help="the format of new deck files, taken from settings.ini by default")
+    parser.add_argument("--trace", metavar="FILE", default=os.environ.get("JLPYT_TRACE", ""),
+                        help="write a Chrome trace of the command to this file, and print where the time went")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    # Every command works on a selection of decks and tags
+    selection = argparse.ArgumentParser(add_help=False, allow_abbrev=False)
+    selection.add_argument("--deck", action="append", help="only include this deck, can be repeated")
+    selection.add_argument("--tag", action="append", help="only include cards with this tag, can be repeated")
+
+    stats_parser = subparsers.add_parser("stats", parents=[selection], help="show statistics for each deck")
+    stats_parser.set_defaults(handler=command_stats)
+
+    reschedule_parser = subparsers.add_parser("reschedule", parents=[selection], help="change scheduling state")
+    reschedule_parser.add_argument("--reset", action="store_true", help="reset the cards to new")
+    reschedule_parser.add_argument("--shift-days", type=int, default=0, help="move due dates by this many days")
+    reschedule_parser.add_argument("--set-ef", type=float, help="set the easiness factor, at least 1.3")
+    reschedule_parser.add_argument("--dry-run", action="store_true", help="only report what would change")
+    reschedule_parser.set_defaults(handler=command_reschedule)
+
+    retag_parser = subparsers.add_parser("retag", parents=[selection], help="add, remove or rename tags")
+    retag_parser.add_argument("--add", action="append", help="add this tag, can be repeated")
+    retag_parser.add_argument("--remove", action="append", help="remove this tag, can be repeated")
+    retag_parser.add_argument("--rename", nargs=2, metavar=("OLD", "NEW"), help="rename a tag")
+    retag_parser.add_argument("--dry-run", action="store_true", help="only report what would change")
+    retag_parser.set_defaults(handler=command_retag)
+
+    merge_parser = subparsers.add_parser("merge", help="merge decks into another deck")
+    merge_parser.add_argument("sources", nargs="+", help="the names of the decks to merge")
+    merge_parser.add_argument("--into", required=True, help="the name of the deck to merge into")
+    merge_parser.set_defaults(handler=command_merge)
+
+    export_parser = subparsers.add_parser("export", parents=[selection], help="export cards to another format")
+    export_parser.add_argument("--format", choices=list(EXPORT_FORMATS), default="tsv",
+                               help="the export format")
+    export_parser.add_argument("--output", default="-", help="the file to export to, stdout by default")
+    export_parser.set_defaults(handler=command_export)
+
+    import_parser = subparsers.add_parser("import", help="import an Anki package (.apkg or .colpkg)")
+    import_parser.add_argument("package", help="the package to import")
+    import_parser.set_defaults(handler=command_import)
+
+    convert_parser = subparsers.add_parser("convert", parents=[selection], help="convert deck files to another format")
+    convert_parser.add_argument("--to", choices=list(utils.DECK_FILE_FORMATS), required=True,
+                                help="the format to convert to, gzip and zstd are compressed")
+    convert_parser.set_defaults(handler=command_convert)
+
+    sync_parser = subparsers.add_parser("sync", help="sync the decks with a sync server")
+    sync_parser.add_argument("--server", default=settings.get("USER", "sync_server_url", fallback=""),
+                             help="the URL of the sync server, taken from settings.ini by default")
+    sync_parser.add_argument("--state-file", default=settings.get("USER", "sync_state_file", fallback="sync_state.json"),
+                             help="the file the state of the last sync is kept in")
+    sync_parser.set_defaults(handler=command_sync)
+
+    return parser
+
+
+def main(argv: list[str] = None) -> int:
+    """
+    Run the CLI
+    :param argv: The command line arguments, taken from sys.argv by default
+    :return: The exit code
+    """
+    args = build_parser().parse_args(argv)
+    if args.trace:
+        tracing.enable(args.trace)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,325 @@
+"""
+A headless benchmark of the GUI, which runs the widgets on Qt's offscreen platform against synthetic collections and
+checks how long common interactions take against latency budgets, so performance regressions in the card browser, the
+deck list and the review view show up without clicking through the app by hand.
+
+Usage: python -m gui_benchmark [--sizes 1000 10000 100000] [--reviews 500] [--repeat 5] [--output FILE] [--trace FILE]
+
+The results are written as JSON, to stdout by default, with a table on stderr, and the exit code is 1 if an interaction
+went over its budget. Everything runs in a temporary directory, so the decks and settings of the app are never touched.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import contextlib
+from datetime import datetime, timedelta
+
+# The widgets are created without a display, unless another platform was chosen
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PySide6 import __version__ as pyside_version
+from PySide6.QtCore import Qt
+from PySide6.QtWidgets import QApplication
+# noinspection PyUnresolvedReferences
+from __feature__ import snake_case, true_property
+
+import utils
+import tracing
+from models.Deck import Deck
+from models.DailyCounters import DailyCounters
+from models.Flashcard import Flashcard
+from models.LoadBalancer import LoadBalancer
+from models.LeechIndex import LeechIndex
+from models.DuplicateIndex import DuplicateIndex
+from models.UndoStack import UndoStack
+from widgets.CardBrowserWidget import CardBrowserWidget
+from widgets.DeckListWidget import DeckListWidget
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+DECK_COUNT = 10
+TAG_COUNT = 50
+# Latency budgets in milliseconds as (fixed, per 1,000 cards), set from measured timings with a modest margin. Only the
+# interactions that have to go through every card, i.e. showing all of them or counting the due ones, and deleting a
+# deck, which goes through the deck's cards, a tenth of the collection, are allowed to grow with the collection. An edit
+# taking longer for a bigger collection is reported as going over budget
+BUDGETS = {
+    "open_browser": (60, 25),
+    "switch_filter": (15, 5),
+    "edit_card": (60, 0),
+    "undo_edit": (60, 0),
+    "delete_deck": (60, 2),
+    "undo_delete_deck": (60, 2),
+    "rebuild_deck_list": (10, 10),
+    "start_review": (10, 8),
+    "review_card": (3, 0),
+    "undo_review": (3, 0),
+}
+# Budgets are checked against the 95th percentile of an interaction timed at least this many times, and the median of
+# one timed fewer times, whose 95th percentile would be its slowest sample
+PERCENTILE_SAMPLE_COUNT = 20
+
+
+def make_collection(card_count: int, seed: int) -> list[Deck]:
+    """
+    Make a synthetic collection, with a mix of new and learned cards, cards due today and later, tags, leeches and
+    duplicate fronts, spread over DECK_COUNT decks.
+    :param card_count: The number of cards
+    :param seed: The seed of the random generator, so every run uses the same collection
+    :return: The decks
+    """
+    rng = random.Random(seed)
+    now = datetime.now()
+    tags = [f"tag{index}" for index in range(TAG_COUNT)]
+    decks = [Deck(f"Deck {index + 1}", []) for index in range(DECK_COUNT)]
+    for index in range(card_count):
+        # Every 50th card has the same front as an earlier card
+        question = f"Question {index - 1 if index % 50 == 49 else index}"
+        card = Flashcard(question, f"Answer {index} {rng.random():.6f}", tags=rng.sample(tags, rng.randint(0, 3)))
+        if rng.random() < 0.3:
+            card.next_review_date = now - timedelta(minutes=1)
+        else:
+            card.repetitions = rng.randint(1, 10)
+            card.interval = rng.randint(1, 365)
+            card.easiness_factor = round(rng.uniform(1.3, 3.0), 2)
+            card.next_review_date = now + timedelta(days=rng.randint(-30, 60))
+            card.lapses = rng.choice((0, 0, 0, 1, 2, 9))
+        decks[index % DECK_COUNT].cards.append(card)
+    return decks
+
+
+def percentile(samples: list[float], fraction: float) -> float:
+    """
+    Get a percentile of some samples, the sample below which the given fraction of the samples fall.
+    :param samples: The samples
+    :param fraction: The fraction, e.g. 0.95
+    :return: The percentile
+    """
+    samples = sorted(samples)
+    return samples[min(int(len(samples) * fraction), len(samples) - 1)]
+
+
+class GuiBenchmark:
+    """
+    A class to run the scripted interactions against one synthetic collection. The collection is set up the way the app
+    sets up its decks, with the load balancer, the leech and duplicate indexes and the undo stack, and every interaction
+    is timed until the events it caused have been processed.
+    """
+
+    def __init__(self, app: QApplication, card_count: int, review_count: int, seed: int, repeat: int = 5):
+        """
+        Constructor for the GuiBenchmark class, which makes the collection
+        :param app: The application, whose events are processed after every interaction
+        :param card_count: The number of cards in the collection
+        :param review_count: The number of cards to review
+        :param seed: The seed of the random generator
+        :param repeat: The number of times each of the other interactions is timed, so one outlier doesn't decide
+            whether an interaction is within its budget
+        """
+        self.app = app
+        self.card_count = card_count
+        self.review_count = review_count
+        self.repeat = repeat
+        self.decks = make_collection(card_count, seed)
+        # The app's class-level state is set up from scratch for every collection
+        Deck.daily_counters = DailyCounters()
+        self.load_balancer = LoadBalancer(self.decks)
+        Flashcard.load_balancer = self.load_balancer
+        self.leech_index = LeechIndex(self.decks)
+        Flashcard.review_observers[:] = [self.leech_index.record_review]
+        self.duplicate_index = DuplicateIndex(self.decks)
+        self.undo_stack = UndoStack()
+        self.undo_stack.observers.extend([self.load_balancer.record_change, self.leech_index.record_change,
+                                          self.duplicate_index.record_change])
+        # Interaction names mapped to their samples in milliseconds
+        self.samples = {}
+
+    def measure(self, scenario: str, action) -> None:
+        """
+        Time an interaction, including processing the events it caused, e.g. painting.
+        :param scenario: The name of the interaction
+        :param action: A function that performs the interaction
+        :return: None
+        """
+        with tracing.trace_span(scenario, "benchmark", cards=self.card_count):
+            start = time.perf_counter()
+            action()
+            self.app.process_events()
+            elapsed = (time.perf_counter() - start) * 1000
+        self.samples.setdefault(scenario, []).append(elapsed)
+
+    def run_browser(self) -> None:
+        """
+        Open the card browser, switch between filters, edit cards, delete decks, and undo the changes.
+        :return: None
+        """
+        browser = None
+
+        def open_browser():
+            nonlocal browser
+            browser = CardBrowserWidget(self.decks, self.leech_index, self.duplicate_index, self.undo_stack)
+
+        for index in range(self.repeat):
+            if browser is not None:
+                browser.close()
+                self.app.process_events()
+            self.measure("open_browser", open_browser)
+
+        for filter_text in ("Deck 1", "tag0", CardBrowserWidget.LEECHES_FILTER, CardBrowserWidget.DUPLICATES_FILTER,
+                            "-- All Decks --"):
+            item = browser.filter_list_widget.find_items(filter_text, Qt.MatchExactly)[0]
+            self.measure("switch_filter", lambda: browser.select_filter(item))
+
+        for index in range(self.repeat):
+            browser.show_card_editor(browser.card_tree_widget.top_level_item(index))
+            editor = browser.card_edit_widget
+            editor.front_input.plain_text = f"Edited question {index}"
+            editor.tags_input.text = f"edited tag{index}"
+            self.measure("edit_card", editor.save_card)
+        for _ in range(self.repeat):
+            self.measure("undo_edit", browser.undo)
+
+        for index in range(self.repeat):
+            deck_item = browser.filter_list_widget.find_items(f"Deck {index % DECK_COUNT + 1}", Qt.MatchExactly)[0]
+            browser.filter_list_widget.set_current_item(deck_item)
+            browser.focused_widget = browser.filter_list_widget
+            self.measure("delete_deck", browser.handle_delete_shortcut)
+            self.measure("undo_delete_deck", browser.undo)
+        browser.close()
+        self.app.process_events()
+
+    def run_reviews(self) -> None:
+        """
+        Rebuild the deck list, start a review of every deck and review cards, failing every fifth one, then undo the
+        last reviews.
+        :return: None
+        """
+        deck_list = None
+
+        def rebuild_deck_list():
+            nonlocal deck_list
+            self.load_balancer.rebuild()
+            self.leech_index.rebuild()
+            self.duplicate_index.rebuild()
+            # The old deck list is replaced, as the main window does
+            if deck_list is not None:
+                deck_list.delete_later()
+            deck_list = DeckListWidget(self.decks, self.undo_stack)
+
+        for _ in range(self.repeat):
+            self.measure("rebuild_deck_list", rebuild_deck_list)
+        for _ in range(self.repeat):
+            deck_list.handle_escape()
+            self.measure("start_review", deck_list.review_all)
+
+        card_widget = deck_list.card_widget
+
+        def review(grade: int):
+            card_widget.on_show_answer_click()
+            card_widget.on_review_click(grade)
+
+        for index in range(self.review_count):
+            if card_widget.session.current_card() is None:
+                break
+            self.measure("review_card", lambda: review(0 if index % 5 == 4 else 3))
+
+        def undo_review():
+            deck_list.show_undone_review(self.undo_stack.undo(), True)
+
+        for _ in range(self.repeat):
+            self.measure("undo_review", undo_review)
+        deck_list.delete_later()
+        self.app.process_events()
+
+    def results(self) -> list[dict]:
+        """
+        Summarize the samples of every interaction and check them against their budgets, see PERCENTILE_SAMPLE_COUNT.
+        :return: A list of results, one for each interaction
+        """
+        results = []
+        for scenario, samples in self.samples.items():
+            fixed, per_thousand = BUDGETS[scenario]
+            budget = fixed + per_thousand * self.card_count / 1000
+            median = percentile(samples, 0.5)
+            high = percentile(samples, 0.95)
+            checked = "p95" if len(samples) >= PERCENTILE_SAMPLE_COUNT else "median"
+            results.append({"scenario": scenario, "cards": self.card_count, "samples": len(samples),
+                            "median_ms": round(median, 2), "p95_ms": round(high, 2), "max_ms": round(max(samples), 2),
+                            "budget_ms": round(budget, 2), "checked": checked,
+                            "passed": (high if checked == "p95" else median) <= budget})
+        return results
+
+
+def format_results(results: list[dict]) -> str:
+    """
+    Format the results as a table.
+    :param results: The results of every collection
+    :return: The table
+    """
+    lines = [f"{'Interaction':<18}  {'Cards':>7}  {'Samples':>7}  {'Median ms':>10}  {'p95 ms':>9}  {'Max ms':>9}  "
+             f"{'Budget ms':>10}  {'Checked':>7}  Result"]
+    lines += [f"{result['scenario']:<18}  {result['cards']:>7}  {result['samples']:>7}  {result['median_ms']:>10.1f}  "
+              f"{result['p95_ms']:>9.1f}  {result['max_ms']:>9.1f}  {result['budget_ms']:>10.0f}  "
+              f"{result['checked']:>7}  {'ok' if result['passed'] else 'OVER BUDGET'}" for result in results]
+    return "\n".join(lines)
+
+
+def main(argv: list[str] = None) -> int:
+    """
+    Run the benchmark
+    :param argv: The command line arguments, taken from sys.argv by default
+    :return: The exit code, 1 if an interaction went over its budget
+    """
+    parser = argparse.ArgumentParser(prog="python -m gui_benchmark", description="Headless GUI benchmark.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES),
+                        help="the numbers of cards of the synthetic collections")
+    parser.add_argument("--reviews", type=int, default=500, help="the number of cards to review")
+    parser.add_argument("--repeat", type=int, default=5, help="the number of times each other interaction is timed")
+    parser.add_argument("--seed", type=int, default=1, help="the seed of the synthetic collections")
+    parser.add_argument("--output", default="-", help="the file to write the JSON results to, stdout by default")
+    parser.add_argument("--trace", metavar="FILE", help="also write a Chrome trace of the run to this file")
+    args = parser.parse_args(argv)
+
+    output = os.path.abspath(args.output) if args.output != "-" else None
+    if args.trace:
+        tracing.enable(os.path.abspath(args.trace))
+    app = QApplication.instance() or QApplication([])
+    results = []
+    working_directory = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            # The widgets read their limits from settings.ini, which are raised so every review can be done
+            settings = utils.load_config("settings.ini")
+            settings["USER"] = {"daily_reviews_limit": 1000000, "new_card_limit": 1000000, "theme": "dark_blue"}
+            utils.save_config(settings, "settings.ini")
+            # Anything the app prints goes to stderr, so it doesn't get mixed into the results
+            with contextlib.redirect_stdout(sys.stderr):
+                for card_count in args.sizes:
+                    benchmark = GuiBenchmark(app, card_count, args.reviews, args.seed, max(args.repeat, 1))
+                    benchmark.run_browser()
+                    benchmark.run_reviews()
+                    results.extend(benchmark.results())
+                    print(f"Finished {card_count} cards")
+        finally:
+            os.chdir(working_directory)
+
+    passed = all(result["passed"] for result in results)
+    report = {"platform": os.environ["QT_QPA_PLATFORM"], "python": platform.python_version(),
+              "pyside": pyside_version, "system": platform.platform(), "passed": passed, "results": results}
+    print(format_results(results), file=sys.stderr)
+    if output is None:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(output, mode='w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2)
+    return 0 if passed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,42 +1,88 @@
+import os
 import sys
+import multiprocessing
 from datetime import datetime
 
 from PySide6.QtCore import Qt, Slot
 from PySide6.QtGui import QFont, QAction
 from PySide6.QtWidgets import QApplication, QWidget, QVBoxLayout, QPushButton, QHBoxLayout, QDialog, QCheckBox, QLabel, \
-    QMenuBar, QFileDialog
+    QMenuBar, QFileDialog, QInputDialog
 # noinspection PyUnresolvedReferences
 from __feature__ import snake_case, true_property
 
 import utils
+import tracing
+from models.Deck import Deck
+from models.DailyCounters import DailyCounters
+from models.Flashcard import Flashcard
+from models.ReviewHistory import ReviewHistory
+from models.CollectionStats import CollectionStats
+from models.LoadBalancer import LoadBalancer
+from models.LeechIndex import LeechIndex
+from models.DuplicateIndex import DuplicateIndex
+from models.UndoStack import UndoStack, RemoveDeckCommand
+from models.Rescheduler import reschedule_decks, spread_backlog
+from models.Scheduler import schedulers
 from widgets.CardBrowserWidget import CardBrowserWidget
 from widgets.DeckListWidget import DeckListWidget
 from widgets.AddCardWidget import AddCardWidget
+from widgets.BulkAddWidget import BulkAddWidget
 from widgets.AddDeckWidget import AddDeckWidget
 from widgets.Toast import Toast
 from widgets.SettingsDialog import SettingsDialog
+from widgets.StatisticsWidget import StatisticsWidget
+from services.AutosaveService import AutosaveService
+from services.DeckWatcher import DeckWatcher
+from services.EventLoopMonitor import EventLoopMonitor
+from services.OptimizerService import OptimizerService
+from services.Exporters import export_cards
+from services.ImportService import ImportService
+from services.SyncClient import SyncState
+from services.SyncService import SyncService
+from services.Importers import add_cards_to_decks
 from theme import PaletteFactory, default_text_font, button_font
 
-my_app = QApplication([])
-my_app.set_font(button_font, "QPushButton")
-
-settings = utils.load_config("settings.ini")
-starting_theme = settings.get("USER", "theme", fallback="dark_blue")
-my_app.set_palette(PaletteFactory.create_palette(starting_theme))
-
-app_decks = utils.load_decks_from_csv(settings.get("USER", "decks_directory", fallback="decks"))
-
 
 class MainWindow(QWidget):
     """This class defines the main window of the application, which will house all other necessary widgets."""
 
     def __init__(self):
         super().__init__()
-        self.last_checked_date = datetime.now().date()
+        # The daily limits start over at the start of each day, even if the app is left open overnight
+        self.rollover_timer = utils.make_single_shot_timer(self, 0, self.roll_over_day)
+        self.schedule_rollover()
+        # The statistics are only collected the first time they are shown, and then kept up to date after each review
+        self.collection_stats = None
         self.layout = QVBoxLayout()
         self.setup_menu()
         self.toast = Toast(self)
         self.toast.hide()
+        autosave_service.signals.changed_on_disk.connect(self.merge_external_changes)
+        deck_watcher.signals.deck_added.connect(self.reset_deck_list)
+        # Changes can't be undone once the decks they were made to have been reloaded from disk
+        deck_watcher.signals.deck_removed.connect(undo_stack.clear)
+        deck_watcher.signals.deck_changed.connect(undo_stack.clear)
+        deck_watcher.signals.deck_added.connect(lambda deck: self.toast.show_toast(f"{deck.name} was added"))
+        deck_watcher.signals.deck_removed.connect(self.reset_deck_list)
+        deck_watcher.signals.deck_removed.connect(lambda deck: self.toast.show_toast(f"{deck.name} was removed"))
+        deck_watcher.signals.deck_changed.connect(
+            lambda deck: self.toast.show_toast(f"{deck.name} was changed elsewhere and has been reloaded"))
+        deck_watcher.signals.deck_changed.connect(lambda deck: load_balancer.rebuild())
+        deck_watcher.signals.deck_changed.connect(lambda deck: leech_index.rebuild())
+        deck_watcher.signals.deck_changed.connect(lambda deck: duplicate_index.rebuild())
+        deck_watcher.signals.deck_changed.connect(lambda deck: self.mark_collection_stats_stale())
+        optimizer_service.signals.finished.connect(self.apply_fsrs_weights)
+        optimizer_service.signals.failed.connect(
+            lambda message: self.toast.show_toast(f"Could not optimize FSRS parameters: {message}", 5000))
+        # Cards imported from Anki packages are added in batches as they're read, and existing cards are looked up by ID
+        self.import_card_lookup = None
+        import_service.signals.batch_read.connect(self.add_imported_cards)
+        import_service.signals.finished.connect(self.finish_import)
+        import_service.signals.failed.connect(self.fail_import)
+        event_loop_monitor.signals.stall_detected.connect(self.report_stall)
+        sync_service.signals.finished.connect(self.finish_sync)
+        sync_service.signals.failed.connect(
+            lambda message: self.toast.show_toast(f"Could not sync: {message}", 5000))
         self.decks = app_decks
         self.no_decks_label = QLabel(
             'No decks found. <br> Click "Add Deck" to create a new deck, go to "File > Import From File" to import a deck, or go to "Tools > Generate Default Decks" to generate decks for JLPT N5-N1.')
@@ -44,7 +90,7 @@ class MainWindow(QWidget):
         self.no_decks_label.alignment = Qt.AlignCenter
         if not self.decks:
             self.layout.add_widget(self.no_decks_label)
-        self.deck_list_widget = DeckListWidget(self.decks)
+        self.deck_list_widget = DeckListWidget(self.decks, undo_stack)
         self.layout.add_widget(self.deck_list_widget)
         if not self.decks:
             self.no_decks_label.show()
@@ -89,14 +135,27 @@ class MainWindow(QWidget):
         self.show()
 
     def save(self):
-        """ This method saves the decks to CSV files. """
-        utils.save_decks_to_csv(app_decks, settings.get("USER", "decks_directory", fallback="decks"))
+        """ This method queues all modified decks to be written to CSV files by the autosave service. """
+        autosave_service.save_now()
         self.toast.show_toast("Saved Successfully")
 
+    @Slot(Deck)
+    def merge_external_changes(self, deck: Deck):
+        """ This method merges the changes another instance of the app made to a deck's file into the deck. """
+        filename = utils.deck_filepath(deck, settings.get("USER", "decks_directory", fallback="decks"))
+        if utils.merge_deck_from_csv(deck, filename):
+            undo_stack.clear()
+            load_balancer.rebuild()
+            leech_index.rebuild()
+            duplicate_index.rebuild()
+            self.mark_collection_stats_stale()
+            self.toast.show_toast(f"{deck.name} was changed elsewhere and has been merged")
+
     def import_from_file(self):
-        """ This method imports decks from a CSV file. """
+        """ This method imports decks from CSV files, and Anki packages on a background thread. """
         file_dialog = QFileDialog()
-        file_filter = "CSV File (*.csv)"
+        file_filter = "Decks (*.csv *.csv.gz *.csv.zst *.apkg *.colpkg);;CSV File (*.csv *.csv.gz *.csv.zst);;" \
+                      "Anki Package (*.apkg *.colpkg)"
         file_dialog.set_directory(settings.get("USER", "decks_directory", fallback="decks"))
         file_paths = file_dialog.get_open_file_names(
             caption="Select a Deck",
@@ -104,13 +163,69 @@ class MainWindow(QWidget):
         )
 
         # Add all selected decks to the app_decks list
-        for file_path in file_paths[0]:
+        package_paths = [file_path for file_path in file_paths[0] if file_path.lower().endswith((".apkg", ".colpkg"))]
+        csv_paths = [file_path for file_path in file_paths[0] if file_path not in package_paths]
+        for file_path in csv_paths:
             deck = utils.load_deck_from_csv(file_path)
             if deck:
-                deck.name = file_path.split("/")[-1].split(".")[0]
+                # The deck is saved to the decks directory in the format chosen in the settings
+                deck.file_extension = Deck.file_extension
                 self.decks.append(deck)
+        if csv_paths:
+            self.reset_deck_list()
+            self.toast.show_toast("Decks imported!")
+
+        for file_path in package_paths[:1]:
+            if import_service.start(file_path):
+                self.import_card_lookup = {card.id: card for deck in self.decks for card in deck.cards}
+                self.toast.show_toast(f"Importing {file_path.split('/')[-1]}...")
+            else:
+                self.toast.show_toast("Another package is already being imported")
+        if len(package_paths) > 1:
+            self.toast.show_toast("Only one Anki package can be imported at a time", 5000)
+
+    @Slot(list, int, int)
+    def add_imported_cards(self, deck_cards: list, read_count: int, total: int):
+        """ This method adds a batch of cards read from an Anki package to the decks. """
+        add_cards_to_decks(self.decks, deck_cards, self.import_card_lookup)
+        self.toast.show_toast(f"Importing... {read_count} of {total} cards")
+
+    @Slot(int)
+    def finish_import(self, card_count: int):
+        """ This method shows the imported decks once the whole package has been read, and saves them. """
+        self.import_card_lookup = None
         self.reset_deck_list()
-        self.toast.show_toast("Decks imported!")
+        autosave_service.save_now()
+        self.toast.show_toast(f"{card_count} cards imported!")
+
+    @Slot(str)
+    def fail_import(self, message: str):
+        """ This method keeps the cards imported before an import failed, and reports the error. """
+        self.import_card_lookup = None
+        self.reset_deck_list()
+        self.toast.show_toast(f"Could not import the package: {message}", 5000)
+
+    @Slot()
+    def export_decks(self):
+        """ This method exports every deck, including the scheduling state, as an Anki package, TSV or JSON Lines. """
+        file_filters = {"Anki Package (*.apkg)": "apkg", "TSV File (*.tsv)": "tsv", "JSON Lines File (*.jsonl)": "jsonl"}
+        file_path, file_filter = QFileDialog.get_save_file_name(self, "Export Decks", "decks.apkg",
+                                                                ";;".join(file_filters))
+        if not file_path:
+            return
+        export_format = file_filters.get(file_filter, "apkg")
+        if not file_path.endswith(f".{export_format}"):
+            file_path += f".{export_format}"
+        cards = ((deck.name, card) for deck in self.decks for card in deck.cards)
+        QApplication.set_override_cursor(Qt.WaitCursor)
+        try:
+            count = export_cards(cards, file_path, export_format)
+        except OSError as error:
+            self.toast.show_toast(f"Could not export the decks: {error}", 5000)
+            return
+        finally:
+            QApplication.restore_override_cursor()
+        self.toast.show_toast(f"{count} cards exported")
 
     def setup_menu(self):
         """ This method sets up the menu bar for the main window, using a dictionary to map menu names to actions. """
@@ -120,12 +235,16 @@ class MainWindow(QWidget):
         menu_map = {
             "File": {
                 "Import From File": (self.import_from_file, "Ctrl+I"),
+                "Export Decks": (self.export_decks, "Ctrl+E"),
                 "Save": (self.save, "Ctrl+S"),
                 "Settings": (self.show_settings_dialog, "Alt+S"),
                 "Exit": (self.close, "Ctrl+Q")
             },
             "Edit": {
+                "Undo": (self.undo, "Ctrl+Z"),
+                "Redo": (self.redo, "Ctrl+Shift+Z"),
                 "Add Card": (self.show_add_card_widget, "Ctrl+N"),
+                "Bulk Add Cards": (self.show_bulk_add_widget, "Ctrl+Shift+N"),
                 "Add Deck": (self.show_add_deck_widget, "Ctrl+D"),
                 "Browse Cards": (self.show_card_browser_widget, "Ctrl+B")
             },
@@ -135,9 +254,14 @@ class MainWindow(QWidget):
                 "Show Full Screen": (self.show_full_screen, "F11")
             },
             "Tools": {
-                "Generate Default Decks": (self.show_generation_dialog, "Ctrl+G")
+                "Generate Default Decks": (self.show_generation_dialog, "Ctrl+G"),
+                "Statistics": (self.show_statistics_widget, "Ctrl+T"),
+                "Optimize FSRS Parameters": (self.optimize_fsrs_weights, None),
+                "Redistribute Backlog": (self.redistribute_backlog, None),
+                "Sync Now": (self.sync_now, "Ctrl+Y")
             },
             "Help": {
+                "Freeze Monitor": (self.toggle_freeze_monitor, None),
                 "About": (lambda: self.toast.show_toast("JLPyT Flashcards v1.0.0"), None)
             }
         }
@@ -157,9 +281,18 @@ class MainWindow(QWidget):
     @Slot()
     def show_add_card_widget(self):
         """This method displays the AddCardWidget when the "Add Card" button is clicked."""
-        add_card_widget = AddCardWidget(self.decks)
+        add_card_widget = AddCardWidget(self.decks, duplicate_index)
         add_card_widget.signals.card_added.connect(lambda: self.toast.show_toast("Card added!"))
 
+    @Slot()
+    def show_bulk_add_widget(self):
+        """ This method displays the BulkAddWidget, to add many cards at once from pasted text. """
+        self.bulk_add_widget = BulkAddWidget(self.decks, duplicate_index)
+        self.bulk_add_widget.signals.cards_added.connect(self.reset_deck_list)
+        self.bulk_add_widget.signals.cards_added.connect(autosave_service.save_now)
+        self.bulk_add_widget.signals.cards_added.connect(
+            lambda count: self.toast.show_toast(f"{count} cards added!"))
+
     @Slot()
     def show_add_deck_widget(self):
         """ This method displays the AddDeckWidget when the "Add Deck" button is clicked. """
@@ -171,31 +304,139 @@ class MainWindow(QWidget):
     @Slot()
     def show_card_browser_widget(self):
         """ This method displays the CardBrowserWidget when the "Browse Cards" button is clicked. """
-        card_browser_widget = CardBrowserWidget(self.decks)
+        card_browser_widget = CardBrowserWidget(self.decks, leech_index, duplicate_index, undo_stack)
         card_browser_widget.signals.closed.connect(self.reset_deck_list)
-        card_browser_widget.signals.closed.connect(self.save)
+        card_browser_widget.signals.closed.connect(autosave_service.save_now)
 
-    def reset_deck_list(self):
-        """ This method resets the deck list widget after a new deck has been added. """
-        if self.decks and self.no_decks_label.visible:
-            self.no_decks_label.hide()
-        elif not self.decks and not self.no_decks_label.visible:
-            self.no_decks_label.show()
-        new_deck_list_widget = DeckListWidget(self.decks)
-        self.layout.replace_widget(self.deck_list_widget, new_deck_list_widget)
-        self.deck_list_widget.delete_later()
-        self.deck_list_widget = new_deck_list_widget
-        current_date = datetime.now().date()
-        if current_date >= self.last_checked_date:
-            self.reset_deck_counters()
-            self.last_checked_date = current_date
+    @Slot()
+    def show_statistics_widget(self):
+        """ This method displays the StatisticsWidget. """
+        self.statistics_widget = StatisticsWidget(self.get_collection_stats())
+
+    def get_collection_stats(self):
+        """ This method returns the statistics of the collection, collecting them the first time they are needed. """
+        if self.collection_stats is None:
+            self.collection_stats = CollectionStats(self.decks, review_history)
+            Flashcard.review_observers.append(self.collection_stats.record_review)
+            undo_stack.observers.append(self.collection_stats.record_change)
+        return self.collection_stats
+
+    def mark_collection_stats_stale(self):
+        """ This method makes the statistics of the collection be collected again the next time they are needed. """
+        if self.collection_stats is not None:
+            self.collection_stats.mark_stale()
 
+    @Slot()
+    def optimize_fsrs_weights(self):
+        """ This method starts fitting the FSRS parameters to the review history on a background process. """
+        review_history.flush()
+        if optimizer_service.start(review_history.filename, schedulers["fsrs"].weights):
+            self.toast.show_toast("Optimizing FSRS parameters in the background...")
+        else:
+            self.toast.show_toast("The FSRS parameters are already being optimized")
+
+    @Slot(list, float, float)
+    def apply_fsrs_weights(self, weights: list, initial_loss: float, final_loss: float):
+        """ This method starts using the fitted FSRS parameters, and saves them to the settings. """
+        schedulers["fsrs"].weights = weights
+        if 'USER' not in settings.sections():
+            settings['USER'] = settings['DEFAULT']
+        settings['USER']['fsrs_weights'] = ','.join(str(weight) for weight in weights)
+        utils.save_config(settings, "settings.ini")
+        self.toast.show_toast(f"FSRS parameters optimized, log loss {initial_loss:.3f} -> {final_loss:.3f}", 5000)
 
+    @Slot()
+    def redistribute_backlog(self):
+        """ This method spreads the overdue cards of every deck over the coming days, so the daily workload is even. """
+        days, ok = QInputDialog.get_int(self, "Redistribute Backlog", "Spread the overdue cards over this many days:",
+                                        7, 1, 365)
+        if not ok:
+            return
+        changed_count = reschedule_decks(self.decks, spread_backlog(days))
+        load_balancer.rebuild()
+        if self.collection_stats is not None:
+            self.collection_stats.rebuild()
+        self.reset_deck_list()
+        autosave_service.save_now()
+        self.toast.show_toast(f"{changed_count} overdue cards were spread over {days} days")
 
-    def reset_deck_counters(self):
-        """ This method resets the deck counters. """
-        for deck in self.decks:
-            deck.reset_session_counts()
+    @Slot()
+    def sync_now(self):
+        """ This method starts syncing the decks with the sync server set in the settings. """
+        server_url = settings.get("USER", "sync_server_url", fallback="")
+        if not server_url:
+            self.toast.show_toast("Set sync_server_url in settings.ini to sync, e.g. http://127.0.0.1:8765", 5000)
+        elif sync_service.start(server_url):
+            self.toast.show_toast("Syncing...")
+        else:
+            self.toast.show_toast("Already syncing")
+
+    @Slot(int, int)
+    def finish_sync(self, sent_count: int, changed_count: int):
+        """ This method shows the decks changed by other devices once a sync has finished, and saves them. """
+        if changed_count:
+            undo_stack.clear()
+            self.reset_deck_list()
+            autosave_service.save_now()
+        self.toast.show_toast(f"Synced, {sent_count} cards sent and {changed_count} cards received")
+
+    @Slot()
+    def undo(self):
+        """ This method undoes the most recent edit, deletion or review. """
+        command = undo_stack.undo()
+        if command is None:
+            self.toast.show_toast("Nothing to undo")
+            return
+        self.show_undo_result(command, True)
+        self.toast.show_toast(f"Undone: {command.description}")
+
+    @Slot()
+    def redo(self):
+        """ This method redoes the most recently undone change. """
+        command = undo_stack.redo()
+        if command is None:
+            self.toast.show_toast("Nothing to redo")
+            return
+        self.show_undo_result(command, False)
+        self.toast.show_toast(f"Redone: {command.description}")
+
+    def show_undo_result(self, command, is_undone: bool):
+        """ This method shows the decks again after a deck was deleted or restored, or the card of an undone review. """
+        if isinstance(command, RemoveDeckCommand):
+            self.reset_deck_list()
+        else:
+            self.deck_list_widget.show_undone_review(command, is_undone)
+
+    def reset_deck_list(self):
+        """ This method resets the deck list widget after a new deck has been added. """
+        # A span block rather than a decorator, as signals connected to this method pass arguments it doesn't take
+        with tracing.trace_span("MainWindow.reset_deck_list", "ui", decks=len(self.decks)):
+            if self.decks and self.no_decks_label.visible:
+                self.no_decks_label.hide()
+            elif not self.decks and not self.no_decks_label.visible:
+                self.no_decks_label.show()
+            with tracing.trace_span("rebuild indexes", "ui"):
+                load_balancer.rebuild()
+                leech_index.rebuild()
+                duplicate_index.rebuild()
+                self.mark_collection_stats_stale()
+            new_deck_list_widget = DeckListWidget(self.decks, undo_stack)
+            self.layout.replace_widget(self.deck_list_widget, new_deck_list_widget)
+            self.deck_list_widget.delete_later()
+            self.deck_list_widget = new_deck_list_widget
+
+    def schedule_rollover(self):
+        """ This method starts the timer that rolls the daily counters over when the next day starts. """
+        seconds = (Deck.daily_counters.next_rollover() - datetime.now()).total_seconds()
+        # A second late rather than early, so the timer doesn't fire while it's still the previous day
+        self.rollover_timer.start(int(seconds * 1000) + 1000)
+
+    @Slot()
+    def roll_over_day(self):
+        """ This method starts a new day, so the daily limits start over, and shows the cards that are now due. """
+        Deck.daily_counters.roll_over()
+        self.reset_deck_list()
+        self.schedule_rollover()
 
     @Slot()
     def show_generation_dialog(self):
@@ -226,6 +467,29 @@ class MainWindow(QWidget):
         generate_decks_dialog.resize(300, 200)
         generate_decks_dialog.exec()
 
+    @Slot()
+    def toggle_freeze_monitor(self):
+        """ This method starts or stops watching for freezes, and remembers the choice in the settings. """
+        if event_loop_monitor.is_running():
+            median, high, longest = event_loop_monitor.latency_percentiles()
+            event_loop_monitor.stop()
+            self.toast.show_toast(f"Freeze monitor off. Event loop latency: median {median:.0f} ms, "
+                                  f"95th percentile {high:.0f} ms, longest {longest:.0f} ms", 5000)
+        else:
+            event_loop_monitor.start()
+            self.toast.show_toast(f"Freeze monitor on, freezes are logged to {event_loop_monitor.log_file}", 5000)
+        if 'USER' not in settings.sections():
+            settings['USER'] = settings['DEFAULT']
+        settings['USER']['freeze_monitor'] = str(event_loop_monitor.is_running())
+        utils.save_config(settings, "settings.ini")
+
+    @Slot(str, float)
+    def report_stall(self, slot: str, duration: float):
+        """ This method tells the user the app froze, and where the details were logged. """
+        self.toast.show_toast(f"The app froze for {duration / 1000:.1f} s in {slot}, "
+                              f"see {event_loop_monitor.log_file}", 5000)
+
+    @tracing.span(category="io")
     def generate_selected_decks(self, check_box_list, dialog):
         """ This method generates the selected decks. """
         dialog.find_child(QPushButton).text = "Downloading..."
@@ -237,7 +501,9 @@ class MainWindow(QWidget):
                                              settings.get("USER", "decks_directory", fallback="decks"))
 
         print([deck.name for deck in self.decks])
-        self.decks = utils.load_decks_from_csv(settings.get("USER", "decks_directory", fallback="decks"))
+        # Replace the contents of the list rather than the list itself, as it is shared with the autosave service
+        self.decks[:] = utils.load_decks_from_csv(settings.get("USER", "decks_directory", fallback="decks"))
+        undo_stack.clear()
         self.reset_deck_list()
         self.toast.show_toast("Decks generated!")
         dialog.delete_later()
@@ -245,14 +511,70 @@ class MainWindow(QWidget):
     @Slot()
     def show_settings_dialog(self):
         """ This method displays the settings widget. """
-        settings_dialog = SettingsDialog(settings)
+        settings_dialog = SettingsDialog(settings, self.get_collection_stats())
         settings_dialog.exec()
-
-
-main_window = MainWindow()
-main_window.show()
-
-my_app.aboutToQuit.connect(
-    lambda: utils.save_decks_to_csv(app_decks, settings.get("USER", "decks_directory", fallback="decks")))
-
-sys.exit(my_app.exec())
+        autosave_service.set_interval(settings.getint("USER", "autosave_interval", fallback=2000))
+        decks_directory = settings.get("USER", "decks_directory", fallback="decks")
+        autosave_service.set_directory(decks_directory)
+        deck_watcher.set_directory(decks_directory)
+
+
+# The app is only started when this file is run, not when it is imported by the worker processes of the ForecastWidget
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+
+    my_app = QApplication([])
+    my_app.set_font(button_font, "QPushButton")
+
+    settings = utils.load_config("settings.ini")
+    # Tracing is off unless a trace file is set, see tracing.py
+    trace_file = os.environ.get("JLPYT_TRACE") or settings.get("USER", "trace_file", fallback="")
+    if trace_file:
+        tracing.enable(trace_file)
+    starting_theme = settings.get("USER", "theme", fallback="dark_blue")
+    my_app.set_palette(PaletteFactory.create_palette(starting_theme))
+
+    app_decks = utils.load_decks_from_csv(settings.get("USER", "decks_directory", fallback="decks"))
+    autosave_service = AutosaveService(app_decks, settings.get("USER", "decks_directory", fallback="decks"),
+                                       settings.getint("USER", "autosave_interval", fallback=2000))
+    review_history = ReviewHistory(settings.get("USER", "review_history_file", fallback="review_history.sqlite3"))
+    Flashcard.review_observers.append(review_history.record)
+    Deck.file_extension = utils.deck_file_extension(settings.get("USER", "deck_file_format", fallback="csv"))
+    Deck.daily_counters = DailyCounters(settings.get("USER", "daily_counters_file", fallback="daily_counters.json"),
+                                        settings.getint("USER", "day_start_hour", fallback=4))
+    load_balancer = LoadBalancer(app_decks)
+    Flashcard.load_balancer = load_balancer
+    leech_index = LeechIndex(app_decks, settings.getint("USER", "leech_threshold", fallback=8),
+                             settings.getboolean("USER", "suspend_leeches", fallback=True))
+    Flashcard.review_observers.append(leech_index.record_review)
+    duplicate_index = DuplicateIndex(app_decks)
+    # Edits, deletions and reviews can be undone, and the indexes are updated one card at a time when they are
+    undo_stack = UndoStack(settings.getint("USER", "undo_limit", fallback=100))
+    undo_stack.observers.extend([load_balancer.record_change, leech_index.record_change, duplicate_index.record_change])
+    deck_watcher = DeckWatcher(app_decks, settings.get("USER", "decks_directory", fallback="decks"))
+    if settings.get("USER", "fsrs_weights", fallback=""):
+        schedulers["fsrs"].weights = [float(weight) for weight in settings.get("USER", "fsrs_weights").split(",")]
+    schedulers["fsrs"].desired_retention = settings.getfloat("USER", "desired_retention", fallback=0.9)
+    optimizer_service = OptimizerService()
+    import_service = ImportService()
+    # Stalls of the event loop are only watched for when turned on in the Help menu
+    event_loop_monitor = EventLoopMonitor(settings.getint("USER", "freeze_threshold", fallback=250),
+                                          settings.get("USER", "freeze_log_file", fallback="freezes.log"))
+    if settings.getboolean("USER", "freeze_monitor", fallback=False):
+        event_loop_monitor.start()
+    sync_service = SyncService(app_decks, SyncState(settings.get("USER", "sync_state_file",
+                                                                 fallback="sync_state.json")))
+
+    main_window = MainWindow()
+    main_window.show()
+
+    # Block until every modified deck has been written before the application exits
+    my_app.aboutToQuit.connect(deck_watcher.shutdown)
+    my_app.aboutToQuit.connect(autosave_service.shutdown)
+    my_app.aboutToQuit.connect(review_history.close)
+    my_app.aboutToQuit.connect(optimizer_service.shutdown)
+    my_app.aboutToQuit.connect(import_service.shutdown)
+    my_app.aboutToQuit.connect(sync_service.shutdown)
+    my_app.aboutToQuit.connect(event_loop_monitor.stop)
+
+    sys.exit(my_app.exec())
@@ -0,0 +1,196 @@
+from datetime import date
+
+import numpy as np
+
+from models.Deck import Deck
+from models.Flashcard import Flashcard
+from models.ReviewHistory import ReviewHistory
+
+
+class CollectionStats:
+    """
+    A class to compute statistics over every card in the collection. The scheduling fields of all cards, and their
+    review counts from the ReviewHistory, are copied into NumPy arrays once, and then kept up to date one card at a time
+    after every review and change, so aggregates never have to loop over Flashcard objects.
+    """
+
+    # The number of past days daily review counts are kept for
+    HISTORY_DAYS = 365
+
+    def __init__(self, decks: list[Deck], history: ReviewHistory = None):
+        """
+        Constructor for the CollectionStats class
+        :param decks: The list of decks to compute statistics for, shared with the rest of the app
+        :param history: The review history to take review counts from, if any
+        """
+        self.decks = decks
+        self.history = history
+        self.is_stale = False
+        self.rebuild()
+
+    def rebuild(self) -> None:
+        """
+        Copy the scheduling fields of every card into arrays, and load the review counts from the history.
+        :return: None
+        """
+        cards = [card for deck in self.decks for card in deck.cards]
+        count = len(cards)
+        self.cards = cards
+        # Rows are looked up by object identity, so cards sharing an ID still get a row each
+        self.rows = {id(card): row for row, card in enumerate(cards)}
+        self.due = np.fromiter((card.next_review_date.toordinal() for card in cards), dtype=np.int64, count=count)
+        self.easiness = np.fromiter((card.easiness_factor for card in cards), dtype=np.float64, count=count)
+        self.interval = np.fromiter((card.interval for card in cards), dtype=np.int64, count=count)
+        self.repetitions = np.fromiter((card.repetitions for card in cards), dtype=np.int64, count=count)
+
+        self.deck_names = [deck.name for deck in self.decks]
+        self.deck_index = np.repeat(np.arange(len(self.decks)), [len(deck.cards) for deck in self.decks])
+
+        # Cards can have several tags, so tags are stored as (tag, row) pairs
+        self.tag_names = sorted({tag for card in cards for tag in card.tags if tag})
+        tag_lookup = {tag: index for index, tag in enumerate(self.tag_names)}
+        pairs = [(tag_lookup[tag], row) for row, card in enumerate(cards) for tag in card.tags if tag]
+        pairs = np.array(pairs, dtype=np.int64).reshape(-1, 2)
+        self.tag_index, self.tag_rows = pairs[:, 0], pairs[:, 1]
+
+        self.reviews = np.zeros(count, dtype=np.int64)
+        self.passed = np.zeros(count, dtype=np.int64)
+        self.first_day = date.today().toordinal() - self.HISTORY_DAYS + 1
+        self.daily_reviews = np.zeros(self.HISTORY_DAYS, dtype=np.int64)
+        self.daily_passed = np.zeros(self.HISTORY_DAYS, dtype=np.int64)
+
+        if self.history:
+            self.history.flush()
+            rows_by_card_id = {card.id: row for row, card in enumerate(cards)}
+            counts = [(rows_by_card_id[card_id], reviews, passed)
+                      for card_id, reviews, passed in self.history.card_review_counts() if card_id in rows_by_card_id]
+            if counts:
+                rows, reviews, passed = np.array(counts, dtype=np.int64).T
+                self.reviews[rows] = reviews
+                self.passed[rows] = passed
+            for day, reviews, passed in self.history.daily_review_counts(date.fromordinal(self.first_day)):
+                self.daily_reviews[day.toordinal() - self.first_day] = reviews
+                self.daily_passed[day.toordinal() - self.first_day] = passed
+        self.is_stale = False
+
+    def ensure_current(self) -> None:
+        """
+        Rebuild the arrays if they were marked stale, cards or decks were added or removed since they were built, or a
+        new day started.
+        :return: None
+        """
+        if self.is_stale:
+            self.rebuild()
+        elif len(self.deck_names) != len(self.decks) or sum(len(deck.cards) for deck in self.decks) != len(self.cards):
+            self.rebuild()
+        elif date.today().toordinal() - self.HISTORY_DAYS + 1 != self.first_day:
+            self.rebuild()
+
+    def mark_stale(self) -> None:
+        """
+        Rebuild the arrays the next time they're used, e.g. after decks were reloaded or merged from disk.
+        :return: None
+        """
+        self.is_stale = True
+
+    def record_change(self, card: Flashcard, deck: Deck, before: dict, after: dict) -> None:
+        """
+        Update a card's row after a change was made or undone, e.g. an edit or an undone review. The signature matches
+        the observers of the UndoStack, so this can be registered there directly. Undone reviews stay in the review
+        history, so the review counts are left as they are.
+        :param card: The card that changed
+        :param deck: The deck of the card
+        :param before: The changed fields' values before the change, or None if the card was added
+        :param after: The changed fields' values after the change, or None if the card was removed
+        :return: None
+        """
+        row = self.rows.get(id(card))
+        if row is None or before is None or after is None or "tags" in before:
+            # Cards moving in or out of the arrays, or between tags, change the rows themselves
+            self.is_stale = True
+            return
+        self.due[row] = card.next_review_date.toordinal()
+        self.easiness[row] = card.easiness_factor
+        self.interval[row] = card.interval
+        self.repetitions[row] = card.repetitions
+
+    def record_review(self, card: Flashcard, quality: int, prior_interval: int, prior_easiness_factor: float) -> None:
+        """
+        Update a single card's row after it was reviewed. The signature matches Flashcard.review_observers.
+        :param card: The card that was reviewed
+        :param quality: The grade the card was given
+        :param prior_interval: The card's interval before the review
+        :param prior_easiness_factor: The card's easiness factor before the review
+        :return: None
+        """
+        row = self.rows.get(id(card))
+        if row is None:
+            return  # A card added since the last rebuild, which will be picked up by ensure_current
+        self.due[row] = card.next_review_date.toordinal()
+        self.easiness[row] = card.easiness_factor
+        self.interval[row] = card.interval
+        self.repetitions[row] = card.repetitions
+        self.reviews[row] += 1
+        self.passed[row] += quality >= 3
+
+        day = date.today().toordinal() - self.first_day
+        if day < self.HISTORY_DAYS:
+            self.daily_reviews[day] += 1
+            self.daily_passed[day] += quality >= 3
+
+    def due_forecast(self, days: int = 30) -> np.ndarray:
+        """
+        Count the cards that have been learned and come due on each of the next days. Overdue cards count for today.
+        :param days: The number of days to forecast
+        :return: An array with the number of due cards for each day, starting today
+        """
+        learned = self.repetitions > 0
+        offsets = np.maximum(self.due[learned] - date.today().toordinal(), 0)
+        return np.bincount(offsets[offsets < days], minlength=days)
+
+    def easiness_distribution(self, bins: int = 12) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Get a histogram of the easiness factors of the cards that have been learned.
+        :param bins: The number of bins
+        :return: The counts and the bin edges, as returned by np.histogram
+        """
+        easiness = self.easiness[self.repetitions > 0]
+        upper = max(float(easiness.max()), 2.6) if easiness.size else 2.6
+        return np.histogram(easiness, bins=bins, range=(1.3, upper))
+
+    def daily_review_counts(self, days: int = 30) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Get the number of reviews and passed reviews on each of the last days.
+        :param days: The number of days, at most HISTORY_DAYS
+        :return: The reviews and passed reviews per day, ending today
+        """
+        end = date.today().toordinal() - self.first_day + 1
+        start = max(end - days, 0)
+        return self.daily_reviews[start:end], self.daily_passed[start:end]
+
+    def retention_by_deck(self) -> list[tuple[str, int, float]]:
+        """
+        Get the share of passed reviews for each deck.
+        :return: A list of (deck name, reviews, retention) tuples, with retention between 0 and 1
+        """
+        return self.group_retention(self.deck_names, self.deck_index, np.arange(len(self.cards)))
+
+    def retention_by_tag(self) -> list[tuple[str, int, float]]:
+        """
+        Get the share of passed reviews for each tag.
+        :return: A list of (tag, reviews, retention) tuples, with retention between 0 and 1
+        """
+        return self.group_retention(self.tag_names, self.tag_index, self.tag_rows)
+
+    def group_retention(self, names: list[str], groups: np.ndarray, rows: np.ndarray) -> list[tuple[str, int, float]]:
+        """
+        Sum the reviews and passed reviews of the rows in each group.
+        :param names: The name of each group
+        :param groups: The group of each (group, row) pair
+        :param rows: The row of each (group, row) pair
+        :return: A list of (name, reviews, retention) tuples
+        """
+        reviews = np.bincount(groups, weights=self.reviews[rows], minlength=len(names))
+        passed = np.bincount(groups, weights=self.passed[rows], minlength=len(names))
+        retention = np.divide(passed, reviews, out=np.zeros(len(names)), where=reviews > 0)
+        return list(zip(names, reviews.astype(int).tolist(), retention.tolist()))
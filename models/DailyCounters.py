@@ -0,0 +1,136 @@
+import json
+import os
+import tempfile
+from datetime import date, datetime, timedelta
+
+import tracing
+
+
+class DailyCounters:
+    """
+    A class to count the review and new cards studied in each deck today, so the daily limits survive restarting the
+    app. Only today's counts are kept, in a small JSON file that is rewritten after every change. A day starts at a
+    configurable hour rather than at midnight, so a late night session still counts towards the day it started on.
+    Counts from an earlier day are never returned, so the counters roll over even if roll_over isn't called.
+    """
+
+    def __init__(self, filename: str = None, day_start_hour: int = 0):
+        """
+        Constructor for the DailyCounters class, which loads today's counts from the file if there is one
+        :param filename: The JSON file to keep the counts in, or None to only keep them in memory
+        :param day_start_hour: The hour of the day, from 0 to 23, at which a new day starts
+        """
+        self.filename = filename
+        self.day_start_hour = day_start_hour
+        self.day = self.current_day()
+        # Deck names mapped to [review cards, new cards], as deck IDs aren't stored in deck files and change on load
+        self.counts = {}
+        if filename is not None and os.path.exists(filename):
+            self.load()
+
+    def current_day(self, now: datetime = None) -> date:
+        """
+        Get the day a time belongs to, taking the day start hour into account.
+        :param now: The time, datetime.now() by default
+        :return: The day
+        """
+        return ((now or datetime.now()) - timedelta(hours=self.day_start_hour)).date()
+
+    def next_rollover(self, now: datetime = None) -> datetime:
+        """
+        Get the time the next day starts.
+        :param now: The current time, datetime.now() by default
+        :return: The start of the next day
+        """
+        return datetime.combine(self.current_day(now) + timedelta(days=1), datetime.min.time()) + \
+            timedelta(hours=self.day_start_hour)
+
+    def load(self) -> None:
+        """
+        Load the counts from the file, ignoring counts from an earlier day and files that can't be read.
+        :return: None
+        """
+        try:
+            with open(self.filename, encoding='utf-8') as file:
+                data = json.load(file)
+            if data.get("day") == self.day.isoformat():
+                self.counts = {name: [int(reviews), int(new)] for name, (reviews, new) in data["decks"].items()}
+        except (OSError, ValueError, KeyError, TypeError) as error:
+            tracing.event("daily_counters.load_failed", f"Could not load daily counters from {self.filename}: {error}",
+                          "io", filename=self.filename, error=str(error))
+
+    def save(self) -> None:
+        """
+        Write the counts to the file atomically, via a temporary file that replaces it.
+        :return: None
+        """
+        if self.filename is None:
+            return
+        directory = os.path.dirname(os.path.abspath(self.filename))
+        file_descriptor, temp_filename = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(self.filename)}.",
+                                                          suffix='.tmp')
+        try:
+            with open(file_descriptor, mode='w', encoding='utf-8') as file:
+                json.dump({"day": self.day.isoformat(), "decks": self.counts}, file)
+            os.replace(temp_filename, self.filename)
+        except BaseException:
+            if os.path.exists(temp_filename):
+                os.remove(temp_filename)
+            raise
+
+    def roll_over(self) -> bool:
+        """
+        Start counting from zero if a new day has started since the counts were last changed.
+        :return: True if a new day has started, False otherwise
+        """
+        day = self.current_day()
+        if day == self.day:
+            return False
+        self.day = day
+        self.counts = {}
+        self.save()
+        return True
+
+    def get(self, deck_name: str) -> tuple[int, int]:
+        """
+        Get the number of review and new cards studied in a deck today.
+        :param deck_name: The name of the deck
+        :return: The number of review cards and the number of new cards
+        """
+        self.roll_over()
+        reviews, new = self.counts.get(deck_name, (0, 0))
+        return reviews, new
+
+    def add(self, deck_name: str, is_new_card: bool) -> None:
+        """
+        Count a card studied in a deck today.
+        :param deck_name: The name of the deck
+        :param is_new_card: True if the card was new, False otherwise
+        :return: None
+        """
+        self.roll_over()
+        self.counts.setdefault(deck_name, [0, 0])[1 if is_new_card else 0] += 1
+        self.save()
+
+    def subtract(self, deck_name: str, is_new_card: bool) -> None:
+        """
+        Stop counting a card studied in a deck today, e.g. when its review was undone.
+        :param deck_name: The name of the deck
+        :param is_new_card: True if the card was new, False otherwise
+        :return: None
+        """
+        self.roll_over()
+        counts = self.counts.get(deck_name)
+        index = 1 if is_new_card else 0
+        if counts is not None and counts[index] > 0:
+            counts[index] -= 1
+            self.save()
+
+    def reset(self, deck_name: str) -> None:
+        """
+        Forget the cards studied in a deck today.
+        :param deck_name: The name of the deck
+        :return: None
+        """
+        if self.counts.pop(deck_name, None) is not None:
+            self.save()
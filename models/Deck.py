@@ -1,6 +1,9 @@
 from uuid import uuid4
 from datetime import datetime
 from models.Flashcard import Flashcard
+from models.DailyCounters import DailyCounters
+from models.Scheduler import DEFAULT_SCHEDULER
+from models.Rescheduler import Transform, reschedule_cards, select_cards
 
 
 class Deck:
@@ -8,6 +11,13 @@ class Deck:
     A class to represent a deck of Flashcard objects.
     """
 
+    # The cards studied in each deck today, shared by every deck and only kept in memory unless the app replaces it with
+    # counters kept in a file
+    daily_counters = DailyCounters()
+    # The extension of the file new decks are saved to, which tells whether they're compressed. Decks loaded from a file
+    # keep the extension of that file
+    file_extension = ".csv"
+
     def __init__(self, name, cards):
         """
         Constructor for the Deck class.
@@ -19,34 +29,80 @@ class Deck:
         self.cards = cards
         self.is_modified = True
         # When a new deck is created, it is automatically modified, as it has not been saved yet
-        self.session_review_cards = 0
-        self.session_new_cards = 0
+        # The state of the deck's file when it was last read or written, used to detect changes made by other instances
+        self.disk_signature = None
+        self.disk_fingerprints = {}
 
     def append_card(self, card: Flashcard) -> None:
         """
-        Appends a Flashcard object to the deck.
+        Appends a Flashcard object to the deck. The card is scheduled with the deck's scheduler.
         :param card: The Flashcard object to append
         :return: None
         """
+        card.scheduler = self.get_scheduler_name()
         self.cards.append(card)
         self.is_modified = True
 
-    def get_filtered_cards(self, max_reviews: int, max_new: int) -> (list, int):
+    def append_cards(self, cards: list[Flashcard]) -> None:
         """
-        Get a filtered list of cards based on the number of reviews and new cards.
-        :param max_reviews: Maximum number of review cards
-        :param max_new: Maximum number of new cards
-        :return: List of filtered cards, and the total number of cards that will be reviewed
+        Appends many Flashcard objects to the deck at once, e.g. from a paste-import. The cards are scheduled with the
+        deck's scheduler.
+        :param cards: The Flashcard objects to append
+        :return: None
         """
-        today = datetime.now()
-        review_cards = [card for card in self.cards if card.next_review_date <= today and card.repetitions > 0]
-        new_cards = [card for card in self.cards if card.next_review_date <= today and card.repetitions == 0]
+        scheduler_name = self.get_scheduler_name()
+        for card in cards:
+            card.scheduler = scheduler_name
+        self.cards.extend(cards)
+        self.is_modified = True
 
-        review_cards = review_cards[:max_reviews - self.session_review_cards]
-        new_cards = new_cards[:max_new - self.session_new_cards]
-        num_of_cards = len(review_cards) + len(new_cards)
+    def get_scheduler_name(self) -> str:
+        """
+        Get the name of the scheduler the deck's cards use. It's stored on every card, so it travels with the cards
+        through saves, merges and the command line tools.
+        :return: The name of the scheduler
+        """
+        return self.cards[0].scheduler if self.cards else DEFAULT_SCHEDULER
 
-        return review_cards + new_cards, num_of_cards
+    def set_scheduler_name(self, name: str) -> None:
+        """
+        Switch every card in the deck to another scheduler. Cards keep their scheduling state, and the new scheduler
+        takes over from it at their next review.
+        :param name: The name of the scheduler
+        :return: None
+        """
+        for card in self.cards:
+            if card.scheduler != name:
+                card.scheduler = name
+                self.is_modified = True
+
+    def reschedule(self, transform: Transform, tags: list[str] = None, now: datetime = None) -> int:
+        """
+        Apply a bulk change to the scheduling fields of the deck's cards, e.g. Rescheduler.shift_due_dates(3). The
+        deck is only marked as modified if a card actually changed.
+        :param transform: The transform to apply, from the Rescheduler module
+        :param tags: Only change cards with at least one of these tags, or None to change every card
+        :param now: The current time, datetime.now() by default
+        :return: The number of cards that changed
+        """
+        changed_rows = reschedule_cards(select_cards(self.cards, tags), transform, now)
+        if len(changed_rows):
+            self.is_modified = True
+        return len(changed_rows)
+
+    @property
+    def session_review_cards(self) -> int:
+        """
+        The number of review cards studied in the deck today, read from the daily counters.
+        """
+        return Deck.daily_counters.get(self.name)[0]
+
+    @property
+    def session_new_cards(self) -> int:
+        """
+        The number of new cards studied in the deck today, read from the daily counters.
+        """
+        return Deck.daily_counters.get(self.name)[1]
 
     def handle_card_review(self, is_new_card: bool):
         """
@@ -54,10 +110,15 @@ class Deck:
         :param is_new_card: True if the card is new, False otherwise
         :return: None
         """
-        if is_new_card:
-            self.session_new_cards += 1
-        else:
-            self.session_review_cards += 1
+        Deck.daily_counters.add(self.name, is_new_card)
+
+    def undo_card_review(self, is_new_card: bool):
+        """
+        Stop counting the review of a card, after the review was undone.
+        :param is_new_card: True if the card was new, False otherwise
+        :return: None
+        """
+        Deck.daily_counters.subtract(self.name, is_new_card)
 
 
     def reset_session_counts(self):
@@ -65,8 +126,7 @@ class Deck:
         Reset the session review and new card counts.
         :return: None
         """
-        self.session_review_cards = 0
-        self.session_new_cards = 0
+        Deck.daily_counters.reset(self.name)
 
     def __str__(self):
         return f"Deck: {self.name}\nID: {self.id}\nCards: {self.cards}"
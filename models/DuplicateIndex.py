@@ -0,0 +1,130 @@
+import unicodedata
+
+from models.Deck import Deck
+from models.Flashcard import Flashcard
+
+# Katakana from ァ to ヶ, which are folded to the hiragana 0x60 code points before them
+KATAKANA_RANGE = (0x30A1, 0x30F6)
+KATAKANA_TO_HIRAGANA = {code_point: code_point - 0x60 for code_point in range(KATAKANA_RANGE[0], KATAKANA_RANGE[1] + 1)}
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalize a card's text for duplicate detection. NFKC turns full-width letters and half-width katakana into their
+    usual forms, katakana are folded to hiragana, case is folded, and runs of whitespace become a single space.
+    :param text: The text to normalize
+    :return: The normalized text
+    """
+    text = unicodedata.normalize("NFKC", text).translate(KATAKANA_TO_HIRAGANA).casefold()
+    return " ".join(text.split())
+
+
+class DuplicateIndex:
+    """
+    A class to find cards with the same front anywhere in the collection. Cards are grouped by their normalized front in
+    a dictionary, so checking a new card is a single lookup and listing every duplicate takes a single pass over the
+    groups. The index is built once, and then kept up to date as cards are added, edited and deleted.
+    """
+
+    def __init__(self, decks: list[Deck]):
+        """
+        Constructor for the DuplicateIndex class
+        :param decks: The list of decks to find duplicates in, shared with the rest of the app
+        """
+        self.decks = decks
+        # Normalized fronts mapped to the cards with that front, by card ID
+        self.groups = {}
+        # Card IDs mapped to their normalized front and the name of their deck
+        self.entries = {}
+        self.rebuild()
+
+    def rebuild(self) -> None:
+        """
+        Index every card again, e.g. after decks were imported, reloaded or merged.
+        :return: None
+        """
+        self.groups = {}
+        self.entries = {}
+        for deck in self.decks:
+            for card in deck.cards:
+                self.add(card, deck.name)
+
+    def add(self, card: Flashcard, deck_name: str) -> None:
+        """
+        Add a card to the index.
+        :param card: The card to add
+        :param deck_name: The name of the card's deck
+        :return: None
+        """
+        key = normalize_text(card.question)
+        self.groups.setdefault(key, {})[card.id] = card
+        self.entries[card.id] = (key, deck_name)
+
+    def add_cards(self, cards: list[Flashcard], deck_name: str) -> None:
+        """
+        Add many cards of a deck to the index at once, e.g. after a paste-import.
+        :param cards: The cards to add
+        :param deck_name: The name of the cards' deck
+        :return: None
+        """
+        for card in cards:
+            self.add(card, deck_name)
+
+    def remove(self, card: Flashcard) -> None:
+        """
+        Remove a card from the index, e.g. when it's deleted.
+        :param card: The card to remove
+        :return: None
+        """
+        entry = self.entries.pop(card.id, None)
+        if entry is None:
+            return
+        group = self.groups[entry[0]]
+        group.pop(card.id, None)
+        if not group:
+            del self.groups[entry[0]]
+
+    def update(self, card: Flashcard) -> None:
+        """
+        Index a card again after its front was edited.
+        :param card: The edited card
+        :return: None
+        """
+        entry = self.entries.get(card.id)
+        if entry is None:
+            return
+        self.remove(card)
+        self.add(card, entry[1])
+
+    def record_change(self, card: Flashcard, deck: Deck, before: dict, after: dict) -> None:
+        """
+        Index a card again after a change was made or undone. The signature matches the observers of the UndoStack, so
+        this can be registered there directly.
+        :param card: The card that changed
+        :param deck: The deck of the card
+        :param before: The changed fields' values before the change, or None if the card was added
+        :param after: The changed fields' values after the change, or None if the card was removed
+        :return: None
+        """
+        if after is None:
+            self.remove(card)
+        elif before is None:
+            self.add(card, deck.name)
+        elif "question" in after:
+            self.update(card)
+
+    def find(self, question: str) -> list[tuple[str, Flashcard]]:
+        """
+        Find the cards with the same front as some text, e.g. the front of a card that is being added.
+        :param question: The front to look for
+        :return: The name of each card's deck and the card
+        """
+        group = self.groups.get(normalize_text(question), {})
+        return [(self.entries[card_id][1], card) for card_id, card in group.items()]
+
+    def get_duplicates(self) -> list[Flashcard]:
+        """
+        Get every card that shares its front with another card, with the cards of each front next to each other.
+        :return: The duplicate cards
+        """
+        return [card for group in self.groups.values() if len(group) > 1 for card in group.values()]
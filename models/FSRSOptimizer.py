@@ -0,0 +1,237 @@
+import contextlib
+import sqlite3
+
+import numpy as np
+
+from models.Scheduler import FSRS_DEFAULT_WEIGHTS, FSRS_DECAY, FSRS_FACTOR, FSRS_STABILITY_RANGE, \
+    FSRS_DIFFICULTY_RANGE
+
+# The range each FSRS weight is kept in while fitting, so the model stays well-behaved
+WEIGHT_BOUNDS = np.array([(0.01, 100), (0.01, 100), (0.01, 100), (0.01, 100), (1, 10), (0.1, 5), (0.1, 5),
+                          (0, 0.75), (0, 4), (0, 0.8), (0.01, 3), (0.5, 5), (0.01, 0.2), (0.01, 0.9), (0.01, 3),
+                          (0, 1), (1, 6)])
+# Predicted recall probabilities are kept away from 0 and 1, so the log loss stays finite
+PROBABILITY_EPSILON = 1e-4
+
+
+class ReviewSequences:
+    """
+    The review history arranged for fitting: the reviews of each card in order, keeping only the first review of each
+    day, as FSRS models memory in days. Cards are sorted by their number of reviews, longest first, so the cards that
+    have a k-th review are always the first ones, and each step of the fit works on a prefix of the arrays.
+    """
+
+    def __init__(self, card_indexes: np.ndarray, days: np.ndarray, grades: np.ndarray):
+        """
+        Constructor for the ReviewSequences class
+        :param card_indexes: The card of each review, with the reviews of each card in chronological order
+        :param days: The day of each review, as an ordinal
+        :param grades: The grade of each review, from 0 to 5
+        """
+        first_of_day = np.ones(len(card_indexes), dtype=bool)
+        first_of_day[1:] = (card_indexes[1:] != card_indexes[:-1]) | (days[1:] != days[:-1])
+        card_indexes, days, grades = card_indexes[first_of_day], days[first_of_day], grades[first_of_day]
+
+        cards, starts, counts = np.unique(card_indexes, return_index=True, return_counts=True)
+        order = np.argsort(-counts, kind="stable")
+        starts, counts = starts[order], counts[order]
+        ratings = np.where(grades < 3, 1, np.where(grades >= 5, 4, 3))
+
+        # The ratings and elapsed days of the k-th review of every card that has one
+        self.ratings = []
+        self.elapsed_days = []
+        for step in range(int(counts.max()) if len(counts) else 0):
+            active = int(np.searchsorted(-counts, -step, side="left"))
+            positions = starts[:active] + step
+            self.ratings.append(ratings[positions])
+            self.elapsed_days.append(days[positions] - days[positions - 1] if step else np.zeros(active, dtype=np.int64))
+        self.card_count = len(counts)
+        # Only reviews after the first one of each card predict a recall, and so count towards the loss
+        self.review_count = int(counts.sum() - len(counts))
+
+    @classmethod
+    def from_history(cls, filename: str, card_indexes: np.ndarray = None) -> "ReviewSequences":
+        """
+        Load the reviews of a ReviewHistory database.
+        :param filename: The SQLite database file of the ReviewHistory
+        :param card_indexes: Only load the reviews of these cards, as indexes of the history's cards table
+        :return: The review sequences
+        """
+        with contextlib.closing(sqlite3.connect(filename)) as connection:
+            rows = connection.execute("SELECT card_idx, day, grade FROM reviews ORDER BY card_idx, timestamp").fetchall()
+        reviews = np.array(rows, dtype=np.int64).reshape(-1, 3)
+        if card_indexes is not None:
+            reviews = reviews[np.isin(reviews[:, 0], card_indexes)]
+        return cls(reviews[:, 0], reviews[:, 1], reviews[:, 2])
+
+    def split(self, parts: int, seed: int = 0) -> list["ReviewSequences"]:
+        """
+        Split the cards into random batches, each with the reviews of about the same number of cards.
+        :param parts: The number of batches
+        :param seed: The seed of the random number generator
+        :return: The batches
+        """
+        rng = np.random.default_rng(seed)
+        batch_of_card = rng.integers(parts, size=self.card_count)
+        batches = []
+        for batch in range(parts):
+            part = ReviewSequences.__new__(ReviewSequences)
+            selected = batch_of_card == batch
+            part.ratings, part.elapsed_days = [], []
+            for ratings, elapsed_days in zip(self.ratings, self.elapsed_days):
+                # The cards with a k-th review are a prefix, so the selection is cut to the same length
+                step_selected = selected[:len(ratings)]
+                if not step_selected.any():
+                    break
+                part.ratings.append(ratings[step_selected])
+                part.elapsed_days.append(elapsed_days[step_selected])
+            part.card_count = int(selected.sum())
+            part.review_count = sum(len(ratings) for ratings in part.ratings[1:])
+            batches.append(part)
+        return [batch for batch in batches if batch.review_count]
+
+
+def loss_and_gradient(weights: np.ndarray, sequences: ReviewSequences) -> tuple[float, np.ndarray]:
+    """
+    Replay every card's reviews through FSRS and compute the log loss of the predicted recall probabilities against
+    whether each review passed, along with its gradient with respect to the weights. The gradient is computed in
+    forward mode: alongside the stability and difficulty of every card, their derivatives with respect to each weight
+    are carried through the same vectorized steps.
+    :param weights: The 17 FSRS weights
+    :param sequences: The reviews to replay
+    :return: The total loss and its gradient
+    """
+    w = weights
+    count = sequences.card_count
+    parameter_count = len(w)
+    stability = np.zeros(count)
+    difficulty = np.zeros(count)
+    d_stability = np.zeros((count, parameter_count))
+    d_difficulty = np.zeros((count, parameter_count))
+    loss = 0.0
+    gradient = np.zeros(parameter_count)
+
+    for step, (ratings, elapsed_days) in enumerate(zip(sequences.ratings, sequences.elapsed_days)):
+        active = len(ratings)
+        rows = np.arange(active)
+        if step == 0:
+            stability[:active] = w[ratings - 1]
+            d_stability[rows, ratings - 1] = 1
+            initial_difficulty = w[4] - (ratings - 3) * w[5]
+            difficulty[:active] = np.clip(initial_difficulty, *FSRS_DIFFICULTY_RANGE)
+            inside = (initial_difficulty > FSRS_DIFFICULTY_RANGE[0]) & (initial_difficulty < FSRS_DIFFICULTY_RANGE[1])
+            d_difficulty[:active, 4] = inside
+            d_difficulty[:active, 5] = -(ratings - 3) * inside
+            continue
+
+        s, d = stability[:active], difficulty[:active]
+        ds, dd = d_stability[:active], d_difficulty[:active]
+        passed = ratings > 1
+
+        # The recall probability at the time of the review, and its derivative
+        base = 1 + FSRS_FACTOR * elapsed_days / s
+        retrievability = base ** FSRS_DECAY
+        dr_ds = FSRS_DECAY * base ** (FSRS_DECAY - 1) * (-FSRS_FACTOR * elapsed_days / s ** 2)
+        dr = dr_ds[:, None] * ds
+        probability = np.clip(retrievability, PROBABILITY_EPSILON, 1 - PROBABILITY_EPSILON)
+        loss -= np.sum(np.where(passed, np.log(probability), np.log(1 - probability)))
+        dloss_dr = np.where(passed, -1 / probability, 1 / (1 - probability))
+        gradient += dloss_dr @ dr
+
+        # The stability after a passed review
+        growth = np.exp(w[8]) * (11 - d) * s ** -w[9]
+        exp_term = np.exp(w[10] * (1 - retrievability))
+        bonus = np.where(ratings == 2, w[15], 1) * np.where(ratings == 4, w[16], 1)
+        increase = growth * (exp_term - 1) * bonus
+        d_increase = increase[:, None] * (-dd / (11 - d)[:, None] - w[9] * ds / s[:, None])
+        d_increase[:, 8] += increase
+        d_increase[:, 9] -= increase * np.log(s)
+        d_increase -= (growth * bonus * exp_term * w[10])[:, None] * dr
+        d_increase[:, 10] += growth * bonus * exp_term * (1 - retrievability)
+        d_increase[:, 15] += np.where(ratings == 2, increase / w[15], 0)
+        d_increase[:, 16] += np.where(ratings == 4, increase / w[16], 0)
+        passed_stability = s * (1 + increase)
+        d_passed_stability = ds * (1 + increase)[:, None] + s[:, None] * d_increase
+
+        # The stability after a failed review
+        power = (s + 1) ** w[13]
+        factor = w[11] * d ** -w[12] * np.exp(w[14] * (1 - retrievability))
+        failed_stability = factor * (power - 1)
+        d_failed_stability = failed_stability[:, None] * (-w[12] * dd / d[:, None] - w[14] * dr)
+        d_failed_stability += (factor * power * w[13] / (s + 1))[:, None] * ds
+        d_failed_stability[:, 11] += failed_stability / w[11]
+        d_failed_stability[:, 12] -= failed_stability * np.log(d)
+        d_failed_stability[:, 13] += factor * power * np.log(s + 1)
+        d_failed_stability[:, 14] += failed_stability * (1 - retrievability)
+        # Forgetting a card never makes it more stable than it was
+        capped = failed_stability > s
+        failed_stability = np.where(capped, s, failed_stability)
+        d_failed_stability = np.where(capped[:, None], ds, d_failed_stability)
+
+        new_stability = np.where(passed, passed_stability, failed_stability)
+        d_new_stability = np.where(passed[:, None], d_passed_stability, d_failed_stability)
+        inside = (new_stability > FSRS_STABILITY_RANGE[0]) & (new_stability < FSRS_STABILITY_RANGE[1])
+        stability[:active] = np.clip(new_stability, *FSRS_STABILITY_RANGE)
+        d_stability[:active] = d_new_stability * inside[:, None]
+
+        # The difficulty, which reverts slowly to the initial difficulty of a card rated Easy
+        moved_difficulty = d - w[6] * (ratings - 3)
+        new_difficulty = w[7] * (w[4] - w[5]) + (1 - w[7]) * moved_difficulty
+        d_new_difficulty = (1 - w[7]) * dd
+        d_new_difficulty[:, 4] += w[7]
+        d_new_difficulty[:, 5] -= w[7]
+        d_new_difficulty[:, 6] -= (1 - w[7]) * (ratings - 3)
+        d_new_difficulty[:, 7] += (w[4] - w[5]) - moved_difficulty
+        inside = (new_difficulty > FSRS_DIFFICULTY_RANGE[0]) & (new_difficulty < FSRS_DIFFICULTY_RANGE[1])
+        difficulty[:active] = np.clip(new_difficulty, *FSRS_DIFFICULTY_RANGE)
+        d_difficulty[:active] = d_new_difficulty * inside[:, None]
+
+    return loss, gradient
+
+
+def optimize_fsrs_weights(filename: str, weights=FSRS_DEFAULT_WEIGHTS, epochs: int = 5, batches: int = 16,
+                          learning_rate: float = 0.04) -> tuple[list[float], float, float]:
+    """
+    Fit the FSRS weights to the reviews in a ReviewHistory database, with Adam on random batches of cards. This is a
+    top-level function, so it can be run on a worker process.
+    :param filename: The SQLite database file of the ReviewHistory
+    :param weights: The weights to start from
+    :param epochs: The number of passes over every review
+    :param batches: The number of batches the cards are split into
+    :param learning_rate: The step size of Adam
+    :return: The fitted weights, and the average log loss per review before and after fitting
+    """
+    sequences = ReviewSequences.from_history(filename)
+    if sequences.review_count < 100:
+        raise ValueError(f"At least 100 reviews on a later day are needed, but there are {sequences.review_count}")
+
+    initial_weights = np.clip(np.array(weights, dtype=np.float64), WEIGHT_BOUNDS[:, 0], WEIGHT_BOUNDS[:, 1])
+    weights = initial_weights
+    initial_loss = loss_and_gradient(weights, sequences)[0] / sequences.review_count
+    parts = sequences.split(batches)
+
+    first_moment = np.zeros_like(weights)
+    second_moment = np.zeros_like(weights)
+    beta1, beta2 = 0.9, 0.999
+    total_steps = epochs * len(parts)
+    rng = np.random.default_rng(0)
+    step = 0
+    for epoch in range(epochs):
+        for part in rng.permutation(len(parts)):
+            step += 1
+            loss, gradient = loss_and_gradient(weights, parts[part])
+            gradient /= parts[part].review_count
+            first_moment = beta1 * first_moment + (1 - beta1) * gradient
+            second_moment = beta2 * second_moment + (1 - beta2) * gradient ** 2
+            corrected_first = first_moment / (1 - beta1 ** step)
+            corrected_second = second_moment / (1 - beta2 ** step)
+            # The step size follows a cosine schedule, so the weights settle towards the end
+            rate = learning_rate * 0.5 * (1 + np.cos(np.pi * (step - 1) / total_steps))
+            weights = weights - rate * corrected_first / (np.sqrt(corrected_second) + 1e-8)
+            weights = np.clip(weights, WEIGHT_BOUNDS[:, 0], WEIGHT_BOUNDS[:, 1])
+
+    final_loss = loss_and_gradient(weights, sequences)[0] / sequences.review_count
+    if final_loss > initial_loss:
+        # The fit made things worse, e.g. because there are too few reviews, so the original weights are kept
+        weights, final_loss = initial_weights, initial_loss
+    return [round(float(weight), 4) for weight in weights], initial_loss, final_loss
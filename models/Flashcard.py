@@ -1,14 +1,23 @@
-from datetime import datetime, timedelta
+from datetime import datetime
 from uuid import uuid4
 
+from models.Scheduler import DEFAULT_SCHEDULER, get_scheduler
+
 
 class Flashcard:
     """
     A class to represent a flashcard
     """
 
-    def __init__(self, question, answer, id=str(uuid4()), next_review_date=datetime.now(), repetitions=0,
-                 easiness_factor=2.5, interval=0, tags: list[str] = []):
+    # Functions called after every review as observer(card, quality, prior_interval, prior_easiness_factor), e.g. to
+    # record the review in the ReviewHistory
+    review_observers = []
+    # The LoadBalancer that moves each card's due date to a less busy day after the scheduler has chosen it, if any
+    load_balancer = None
+
+    def __init__(self, question, answer, id=None, next_review_date=None, repetitions=0,
+                 easiness_factor=2.5, interval=0, tags: list[str] = None, scheduler: str = DEFAULT_SCHEDULER,
+                 stability: float = None, difficulty: float = None, lapses: int = 0, suspended: bool = False):
         """
         Constructor for the Flashcard class
         :param question: The question to be answered, will be on the front of the card by default.
@@ -18,44 +27,72 @@ class Flashcard:
         :param repetitions: The number of times the card has been reviewed, set to 0 by default.
         :param easiness_factor: The easiness factor for the card, set to 2.5 by default, with a minimum of 1.3.
         :param interval: The number of days between reviews, set to 0 by default.
+        :param tags: The card's tags.
+        :param scheduler: The name of the scheduling algorithm used for the card, set by its deck.
+        :param stability: The card's FSRS stability, None until it's reviewed with FSRS.
+        :param difficulty: The card's FSRS difficulty, None until it's reviewed with FSRS.
+        :param lapses: The number of times the card was failed after it had been learned.
+        :param suspended: Whether the card is left out of reviews, e.g. because it was failed too often.
         """
-        self.id = id
+        # Defaults are created per card, as default arguments are only evaluated once and would be shared by every card
+        self.id = id if id else str(uuid4())
         self.question = question
         self.answer = answer
+        if next_review_date is None:
+            next_review_date = datetime.now()
         self.next_review_date = datetime.fromisoformat(next_review_date) if \
             (isinstance(next_review_date, str)) else next_review_date
         self.repetitions = repetitions
         self.easiness_factor = easiness_factor
         self.interval = interval
-        self.tags = tags
+        self.tags = tags if tags is not None else []
+        self.scheduler = scheduler
+        self.stability = stability
+        self.difficulty = difficulty
+        self.lapses = lapses
+        self.suspended = suspended
 
     def review(self, quality: int) -> None:
         """
         Review the flashcard and update the next review date and easiness factor based on the quality/score of the review.
+        The update itself is done by the card's scheduler.
         :param quality: The quality/score of the review, from 0 to 5.
         :return: None
         """
-        # In our case, this is if the user clicks "Pass"
-        if quality >= 3:
-            if self.repetitions == 0:
-                self.interval = 1
-            elif self.repetitions == 1:
-                self.interval = 6
-            else:
-                self.interval = round(self.repetitions * self.easiness_factor)
-            self.repetitions += 1
-        else:
-            # If the user clicks "Fail", reset the card's repetitions and interval
-            self.repetitions = 0
-            self.interval = 0  # Slight adjustment to the algorithm to make the user review the card again on the same day
-
-        # Update the easiness factor
-        self.easiness_factor = self.easiness_factor + (0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
-        if self.easiness_factor < 1.3:
-            self.easiness_factor = 1.3
-
-        # Update the next review date
-        self.next_review_date = datetime.now() + timedelta(days=self.interval)
+        prior_interval = self.interval
+        prior_easiness_factor = self.easiness_factor
+        prior_review_date = self.next_review_date
+        prior_repetitions = self.repetitions
+        now = datetime.now()
+        get_scheduler(self.scheduler).review(self, quality, now)
+        if Flashcard.load_balancer is not None:
+            Flashcard.load_balancer.balance(self, prior_review_date, prior_repetitions, now)
+        # Failing a card that had been learned starts it over, which is counted whichever scheduler is used
+        if prior_repetitions > 0 and self.repetitions == 0:
+            self.lapses += 1
+
+        for observer in Flashcard.review_observers:
+            observer(self, quality, prior_interval, prior_easiness_factor)
+
+    def update_from(self, other: "Flashcard") -> None:
+        """
+        Copy the content and scheduling state of another flashcard with the same ID into this one, keeping this
+        instance so that any references to it stay valid
+        :param other: The flashcard to copy from
+        :return: None
+        """
+        self.question = other.question
+        self.answer = other.answer
+        self.next_review_date = other.next_review_date
+        self.repetitions = other.repetitions
+        self.easiness_factor = other.easiness_factor
+        self.interval = other.interval
+        self.tags = other.tags
+        self.scheduler = other.scheduler
+        self.stability = other.stability
+        self.difficulty = other.difficulty
+        self.lapses = other.lapses
+        self.suspended = other.suspended
 
     def print_stats(self) -> None:
         """
@@ -70,6 +107,11 @@ class Flashcard:
         print(f"Easiness Factor: {self.easiness_factor}")
         print(f"Interval: {self.interval}")
         print(f"Tags: {self.tags}")
+        print(f"Scheduler: {self.scheduler}")
+        print(f"Stability: {self.stability}")
+        print(f"Difficulty: {self.difficulty}")
+        print(f"Lapses: {self.lapses}")
+        print(f"Suspended: {self.suspended}")
 
     def get_stats(self) -> dict:
         """
@@ -84,14 +126,21 @@ class Flashcard:
             "repetitions": self.repetitions,
             "easiness_factor": self.easiness_factor,
             "interval": self.interval,
-            "tags": self.tags
+            "tags": self.tags,
+            "scheduler": self.scheduler,
+            "stability": self.stability,
+            "difficulty": self.difficulty,
+            "lapses": self.lapses,
+            "suspended": self.suspended
         }
 
     def __str__(self):
         return f"Question: {self.question}\nAnswer: {self.answer}\nNext Review Date: {self.next_review_date}"
 
     def __eq__(self, other):
-        return (self.question == other.question and self.answer == other.answer) or self.id == other.id
+        # Cards are the same card if they have the same ID, consistent with __hash__. Cards with the same content are
+        # found by the DuplicateIndex instead
+        return isinstance(other, Flashcard) and self.id == other.id
 
     def __ne__(self, other):
         return not self == other
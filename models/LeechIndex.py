@@ -0,0 +1,78 @@
+from models.Deck import Deck
+from models.Flashcard import Flashcard
+
+
+class LeechIndex:
+    """
+    A class to keep track of leeches, the cards that were failed so often after being learned that reviewing them
+    mostly wastes time. The cards are found once, and then added one at a time as they reach the lapse threshold, so
+    listing the leeches never has to look at every card. New leeches can be suspended automatically.
+    """
+
+    def __init__(self, decks: list[Deck], threshold: int = 8, suspend_leeches: bool = True):
+        """
+        Constructor for the LeechIndex class
+        :param decks: The list of decks to find leeches in, shared with the rest of the app
+        :param threshold: The number of lapses that makes a card a leech
+        :param suspend_leeches: Whether to suspend cards as soon as they become leeches
+        """
+        self.decks = decks
+        self.threshold = max(threshold, 1)
+        self.suspend_leeches = suspend_leeches
+        # Card IDs mapped to cards, in the order they became leeches
+        self.leeches = {}
+        self.rebuild()
+
+    def rebuild(self) -> None:
+        """
+        Find the leeches again, e.g. after decks were added, reloaded or edited. Cards aren't suspended by a rebuild, so
+        leeches the user unsuspended stay unsuspended.
+        :return: None
+        """
+        self.leeches = {card.id: card for deck in self.decks for card in deck.cards if card.lapses >= self.threshold}
+
+    def record_review(self, card: Flashcard, quality: int, prior_interval: int, prior_easiness_factor: float) -> None:
+        """
+        Add a card to the index if the review made it a leech. The signature matches Flashcard.review_observers, so this
+        can be registered there directly.
+        :param card: The card that was reviewed
+        :param quality: The grade the card was given
+        :param prior_interval: The card's interval before the review
+        :param prior_easiness_factor: The card's easiness factor before the review
+        :return: None
+        """
+        if card.lapses >= self.threshold and card.id not in self.leeches:
+            self.leeches[card.id] = card
+            if self.suspend_leeches:
+                card.suspended = True
+
+    def record_change(self, card: Flashcard, deck: Deck, before: dict, after: dict) -> None:
+        """
+        Add or remove a card after a change was made or undone, e.g. a review that made it a leech was undone. Cards
+        aren't suspended here, as the change already set whether they're suspended. The signature matches the observers
+        of the UndoStack, so this can be registered there directly.
+        :param card: The card that changed
+        :param deck: The deck of the card
+        :param before: The changed fields' values before the change, or None if the card was added
+        :param after: The changed fields' values after the change, or None if the card was removed
+        :return: None
+        """
+        if after is not None and card.lapses >= self.threshold:
+            self.leeches.setdefault(card.id, card)
+        else:
+            self.leeches.pop(card.id, None)
+
+    def remove(self, card: Flashcard) -> None:
+        """
+        Remove a card from the index, e.g. when it's deleted.
+        :param card: The card to remove
+        :return: None
+        """
+        self.leeches.pop(card.id, None)
+
+    def get_leeches(self) -> list[Flashcard]:
+        """
+        Get the leeches, in the order they became leeches.
+        :return: The leeches
+        """
+        return list(self.leeches.values())
@@ -0,0 +1,109 @@
+from collections import Counter
+from datetime import datetime, timedelta
+
+from models.Deck import Deck
+from models.Flashcard import Flashcard
+from models.UndoStack import state_value
+
+# The fields of a card that decide whether and on which day it's counted
+DUE_FIELDS = {"next_review_date", "repetitions", "suspended"}
+
+# The fuzz window grows by this fraction of the interval over each range of interval lengths, (start, end, fraction)
+FUZZ_RANGES = ((2.5, 7.0, 0.15), (7.0, 20.0, 0.1), (20.0, float("inf"), 0.05))
+
+
+def fuzz_days(interval: int) -> int:
+    """
+    Get the number of days a card's due date may move either way, which is 0 for short intervals and grows more slowly
+    than the interval itself, so a card is never moved by much compared to how long it waits anyway.
+    :param interval: The interval chosen by the scheduler, in days
+    :return: The number of days
+    """
+    if interval < 2.5:
+        return 0
+    fuzz = 1.0
+    for start, end, fraction in FUZZ_RANGES:
+        fuzz += fraction * max(min(interval, end) - start, 0)
+    return round(fuzz)
+
+
+class LoadBalancer:
+    """
+    A stage after the scheduler that picks each card's due date within a small window around the date the scheduler
+    chose, preferring the day with the fewest cards due, so cards learned together don't all come due on the same day.
+    The number of learned cards due on each day is counted once, and then kept up to date after every review.
+    """
+
+    def __init__(self, decks: list[Deck]):
+        """
+        Constructor for the LoadBalancer class
+        :param decks: The list of decks to balance, shared with the rest of the app
+        """
+        self.decks = decks
+        self.due_counts = Counter()
+        self.rebuild()
+
+    def rebuild(self) -> None:
+        """
+        Count the learned cards due on each day again, e.g. after decks were added, reloaded or rescheduled. Suspended
+        cards aren't reviewed, so they aren't counted.
+        :return: None
+        """
+        self.due_counts = Counter(card.next_review_date.toordinal() for deck in self.decks for card in deck.cards
+                                  if card.repetitions > 0 and not card.suspended)
+
+    def balance(self, card: Flashcard, prior_review_date: datetime, prior_repetitions: int, now: datetime) -> None:
+        """
+        Move a card that was just reviewed to the least busy day within the fuzz window around its due date, and update
+        the counts. The interval moves with the due date, so the date of the last review stays the same.
+        :param card: The card that was reviewed
+        :param prior_review_date: The card's due date before the review
+        :param prior_repetitions: The card's repetitions before the review
+        :param now: The time of the review
+        :return: None
+        """
+        if prior_repetitions > 0:
+            prior_day = prior_review_date.toordinal()
+            self.due_counts[prior_day] -= 1
+            if self.due_counts[prior_day] <= 0:
+                del self.due_counts[prior_day]
+        if card.repetitions == 0:
+            return
+
+        fuzz = fuzz_days(card.interval)
+        if fuzz:
+            # Ties go to the day closest to the scheduler's choice, and cards are never moved to today or before
+            offsets = sorted(range(max(-fuzz, 1 - card.interval), fuzz + 1), key=abs)
+            due_day = card.next_review_date.toordinal()
+            offset = min(offsets, key=lambda offset: self.due_counts.get(due_day + offset, 0))
+            card.interval += offset
+            card.next_review_date = now + timedelta(days=card.interval)
+        self.due_counts[card.next_review_date.toordinal()] += 1
+
+    def record_change(self, card: Flashcard, deck: Deck, before: dict, after: dict) -> None:
+        """
+        Move a card's count to its new due day after a change was made or undone. The signature matches the observers
+        of the UndoStack, so this can be registered there directly.
+        :param card: The card that changed
+        :param deck: The deck of the card
+        :param before: The changed fields' values before the change, or None if the card was added
+        :param after: The changed fields' values after the change, or None if the card was removed
+        :return: None
+        """
+        if before is not None and after is not None and not DUE_FIELDS & before.keys():
+            return
+        for state, step in ((before, -1), (after, 1)):
+            if state is None or state_value(card, state, "repetitions") == 0 or state_value(card, state, "suspended"):
+                continue
+            day = state_value(card, state, "next_review_date").toordinal()
+            self.due_counts[day] += step
+            if self.due_counts[day] <= 0:
+                del self.due_counts[day]
+
+    def get_due_count(self, day: datetime) -> int:
+        """
+        Get the number of learned cards due on a day.
+        :param day: The day
+        :return: The number of cards
+        """
+        return self.due_counts.get(day.toordinal(), 0)
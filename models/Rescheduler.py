@@ -0,0 +1,212 @@
+from datetime import datetime
+from typing import Callable, TYPE_CHECKING
+
+import numpy as np
+
+from models.Flashcard import Flashcard
+from models.Scheduler import MIN_EASINESS_FACTOR
+
+if TYPE_CHECKING:
+    from models.Deck import Deck
+
+ONE_DAY = np.timedelta64(1, 'D')
+
+
+class SchedulingFields:
+    """
+    The scheduling fields of a list of cards as NumPy arrays, so bulk changes can be applied to all of them at once.
+    Optional fields (the FSRS stability and difficulty) are NaN where the card has None.
+    """
+
+    def __init__(self, cards: list[Flashcard]):
+        """
+        Constructor for the SchedulingFields class, which copies the fields out of the cards
+        :param cards: The cards to copy the fields of
+        """
+        count = len(cards)
+        self.due = np.array([card.next_review_date for card in cards], dtype='datetime64[us]').reshape(count)
+        self.interval = np.fromiter((card.interval for card in cards), dtype=np.int64, count=count)
+        self.repetitions = np.fromiter((card.repetitions for card in cards), dtype=np.int64, count=count)
+        self.easiness = np.fromiter((card.easiness_factor for card in cards), dtype=np.float64, count=count)
+        self.stability = np.fromiter((np.nan if card.stability is None else card.stability for card in cards),
+                                     dtype=np.float64, count=count)
+        self.difficulty = np.fromiter((np.nan if card.difficulty is None else card.difficulty for card in cards),
+                                      dtype=np.float64, count=count)
+
+    def copy(self) -> "SchedulingFields":
+        """
+        Copy the arrays, e.g. to compare them after a transform
+        :return: The copy
+        """
+        fields = SchedulingFields.__new__(SchedulingFields)
+        fields.__dict__ = {name: array.copy() for name, array in self.__dict__.items()}
+        return fields
+
+    def changed_rows(self, original: "SchedulingFields") -> np.ndarray:
+        """
+        Find the cards whose fields differ from another copy
+        :param original: The fields before a transform
+        :return: The indexes of the changed cards
+        """
+        changed = (self.due != original.due) | (self.interval != original.interval) | \
+            (self.repetitions != original.repetitions) | (self.easiness != original.easiness)
+        for name in ("stability", "difficulty"):
+            array, original_array = getattr(self, name), getattr(original, name)
+            changed |= (array != original_array) & ~(np.isnan(array) & np.isnan(original_array))
+        return np.flatnonzero(changed)
+
+    def write_back(self, cards: list[Flashcard], rows: np.ndarray) -> None:
+        """
+        Copy the fields of some of the cards back into the Flashcard objects
+        :param cards: The cards the fields were copied from
+        :param rows: The indexes of the cards to update
+        :return: None
+        """
+        due = self.due[rows].tolist()
+        stability = np.where(np.isnan(self.stability[rows]), None, self.stability[rows]).tolist()
+        difficulty = np.where(np.isnan(self.difficulty[rows]), None, self.difficulty[rows]).tolist()
+        for index, row in enumerate(rows.tolist()):
+            card = cards[row]
+            card.next_review_date = due[index]
+            card.interval = int(self.interval[row])
+            card.repetitions = int(self.repetitions[row])
+            card.easiness_factor = float(self.easiness[row])
+            card.stability = stability[index]
+            card.difficulty = difficulty[index]
+
+
+# A transform changes the fields of every card in place, given the current time
+Transform = Callable[[SchedulingFields, np.datetime64], None]
+
+
+def reset() -> Transform:
+    """
+    Get a transform that turns cards back into new cards, due now.
+    :return: The transform
+    """
+    def transform(fields: SchedulingFields, now: np.datetime64) -> None:
+        fields.due[:] = now
+        fields.interval[:] = 0
+        fields.repetitions[:] = 0
+        fields.easiness[:] = 2.5
+        fields.stability[:] = np.nan
+        fields.difficulty[:] = np.nan
+    return transform
+
+
+def shift_due_dates(days: int) -> Transform:
+    """
+    Get a transform that moves the due date of cards by a number of days. The interval moves with the due date, so the
+    date of the last review, which FSRS derives from the two, stays the same.
+    :param days: The number of days to move the due dates by, negative to move them earlier
+    :return: The transform
+    """
+    def transform(fields: SchedulingFields, now: np.datetime64) -> None:
+        fields.due += days * ONE_DAY
+        fields.interval[:] = np.maximum(fields.interval + days, 0)
+    return transform
+
+
+def set_easiness_factor(easiness_factor: float) -> Transform:
+    """
+    Get a transform that sets the easiness factor of cards, no lower than the SM-2 minimum.
+    :param easiness_factor: The new easiness factor
+    :return: The transform
+    """
+    def transform(fields: SchedulingFields, now: np.datetime64) -> None:
+        fields.easiness[:] = max(easiness_factor, MIN_EASINESS_FACTOR)
+    return transform
+
+
+def spread_backlog(days: int) -> Transform:
+    """
+    Get a transform that spreads the overdue cards over the coming days, starting today, so a backlog can be worked
+    through at a steady pace. Days that already have fewer cards due are filled up first, so the total number of cards
+    due each day is as even as possible. The most overdue cards stay first. New cards aren't part of the backlog.
+    :param days: The number of days to spread the backlog over
+    :return: The transform
+    """
+    def transform(fields: SchedulingFields, now: np.datetime64) -> None:
+        days_ahead = max(days, 1)
+        learned = fields.repetitions > 0
+        is_overdue = (fields.due <= now) & learned
+        overdue = np.flatnonzero(is_overdue)
+        overdue = overdue[np.argsort(fields.due[overdue], kind="stable")]
+
+        # The cards that are already due on each of the days, which the backlog is added to
+        day_offsets = (fields.due.astype('datetime64[D]') - now.astype('datetime64[D]')) // ONE_DAY
+        upcoming = learned & ~is_overdue & (day_offsets >= 0) & (day_offsets < days_ahead)
+        due_counts = np.bincount(day_offsets[upcoming], minlength=days_ahead)
+
+        # Find the lowest daily total that fits the whole backlog, fill every day up to just below it, and give the
+        # remaining cards one more each to the earliest days still below it
+        low, high = 0, int(due_counts.max(initial=0)) + len(overdue)
+        while low < high:
+            level = (low + high) // 2
+            if np.maximum(level - due_counts, 0).sum() >= len(overdue):
+                high = level
+            else:
+                low = level + 1
+        capacities = np.maximum(low - 1 - due_counts, 0)
+        below_level = np.flatnonzero(due_counts < low)
+        capacities[below_level[:len(overdue) - capacities.sum()]] += 1
+        offsets = np.repeat(np.arange(days_ahead), capacities)
+
+        new_due = now + offsets * ONE_DAY
+        shift = (new_due.astype('datetime64[D]') - fields.due[overdue].astype('datetime64[D]')) // ONE_DAY
+        fields.due[overdue] = new_due
+        fields.interval[overdue] = np.maximum(fields.interval[overdue] + shift, 0)
+    return transform
+
+
+def reschedule_cards(cards: list[Flashcard], transform: Transform, now: datetime = None) -> np.ndarray:
+    """
+    Apply a transform to the scheduling fields of many cards at once, and copy the result back into only the cards
+    that changed.
+    :param cards: The cards to transform
+    :param transform: The transform, e.g. from reset, shift_due_dates, set_easiness_factor or spread_backlog
+    :param now: The current time, datetime.now() by default
+    :return: The indexes of the cards that changed
+    """
+    fields = SchedulingFields(cards)
+    original = fields.copy()
+    transform(fields, np.datetime64(now or datetime.now(), 'us'))
+    rows = fields.changed_rows(original)
+    fields.write_back(cards, rows)
+    return rows
+
+
+def select_cards(cards: list[Flashcard], tags: list[str] = None) -> list[Flashcard]:
+    """
+    Select the cards that have at least one of the given tags
+    :param cards: The cards to select from
+    :param tags: The tags to look for, or None to select every card
+    :return: The selected cards
+    """
+    if tags is None:
+        return cards
+    tags = set(tags)
+    return [card for card in cards if not tags.isdisjoint(card.tags)]
+
+
+def reschedule_decks(decks: list["Deck"], transform: Transform, deck_names: list[str] = None,
+                     tags: list[str] = None, now: datetime = None) -> int:
+    """
+    Apply a transform to the selected cards of the whole collection at once, so e.g. a backlog is spread across every
+    selected deck together rather than deck by deck. Only the decks with changed cards are marked as modified.
+    :param decks: The decks of the collection
+    :param transform: The transform to apply
+    :param deck_names: The names of the decks to include, or None to include every deck
+    :param tags: Only include cards with at least one of these tags, or None to include every card
+    :param now: The current time, datetime.now() by default
+    :return: The number of cards that changed
+    """
+    selected_decks = [deck for deck in decks if deck_names is None or deck.name in deck_names]
+    selections = [select_cards(deck.cards, tags) for deck in selected_decks]
+    cards = [card for selection in selections for card in selection]
+    deck_indexes = np.repeat(np.arange(len(selected_decks)), [len(selection) for selection in selections])
+
+    rows = reschedule_cards(cards, transform, now)
+    for deck_index in np.unique(deck_indexes[rows]).tolist():
+        selected_decks[deck_index].is_modified = True
+    return len(rows)
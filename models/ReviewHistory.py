@@ -0,0 +1,174 @@
+import queue
+import contextlib
+import sqlite3
+import threading
+import time
+from datetime import date
+
+import tracing
+from models.Flashcard import Flashcard
+
+
+class ReviewHistory:
+    """
+    A class to store every review in an append-only SQLite database. Each review is a compact row of the card's index,
+    the time of the review, the grade, and the card's interval and easiness factor before the review. Card IDs are
+    stored once in a separate table, so the reviews table only holds integers and floats. The local day of each review
+    is stored as well, so daily aggregates can be answered from an index without converting timestamps.
+
+    Reviews are recorded from the GUI thread, but written to the database by a background thread in batches. Several
+    instances of the app can share the database, each adding the cards it reviews to the cards table.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS cards (
+            idx INTEGER PRIMARY KEY,
+            card_id TEXT NOT NULL UNIQUE
+        );
+        CREATE TABLE IF NOT EXISTS reviews (
+            card_idx INTEGER NOT NULL,
+            timestamp INTEGER NOT NULL,
+            day INTEGER NOT NULL,
+            grade INTEGER NOT NULL,
+            prior_interval INTEGER NOT NULL,
+            easiness_factor REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS reviews_by_day ON reviews (day, grade);
+        CREATE INDEX IF NOT EXISTS reviews_by_card ON reviews (card_idx, grade);
+    """
+
+    # The maximum number of reviews written in one transaction
+    BATCH_SIZE = 1000
+
+    def __init__(self, filename: str):
+        """
+        Constructor for the ReviewHistory class, which creates the database if needed and starts the writer thread
+        :param filename: The SQLite database file to store the reviews in
+        """
+        self.filename = filename
+        with contextlib.closing(self.connect()) as connection:
+            connection.executescript(self.SCHEMA)
+
+        self.queue = queue.Queue()
+        self.writer = threading.Thread(target=self.run_writer, name="ReviewHistoryWriter", daemon=True)
+        self.writer.start()
+
+    def connect(self) -> sqlite3.Connection:
+        """
+        Open a new connection to the database. Every thread uses its own connection, and the database runs in WAL mode so
+        queries never wait for the writer thread.
+        :return: The connection
+        """
+        connection = sqlite3.connect(self.filename)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def record(self, card: Flashcard, quality: int, prior_interval: int, prior_easiness_factor: float) -> None:
+        """
+        Queue a review to be written by the writer thread. The signature matches Flashcard.review_observers, so this
+        can be registered there directly.
+        :param card: The card that was reviewed
+        :param quality: The grade the card was given
+        :param prior_interval: The card's interval before the review
+        :param prior_easiness_factor: The card's easiness factor before the review
+        :return: None
+        """
+        self.queue.put((card.id, int(time.time()), quality, prior_interval, prior_easiness_factor))
+
+    def run_writer(self) -> None:
+        """
+        Write queued reviews to the database in batches until a None is queued by close.
+        :return: None
+        """
+        connection = self.connect()
+        card_indexes = dict(connection.execute("SELECT card_id, idx FROM cards"))
+        is_closed = False
+        while not is_closed:
+            batch = [self.queue.get()]
+            while len(batch) < self.BATCH_SIZE and not self.queue.empty():
+                batch.append(self.queue.get())
+            if batch[-1] is None:
+                is_closed = True
+                batch.pop()
+
+            try:
+                self.write_batch(connection, card_indexes, batch)
+            except sqlite3.Error as error:
+                # The batch is lost, but the writer keeps running, so flush and close never wait forever
+                connection.rollback()
+                card_indexes = dict(connection.execute("SELECT card_id, idx FROM cards"))
+                tracing.event("review_history.write_failed", f"Could not write {len(batch)} reviews to {self.filename}: "
+                              f"{error}", "io", filename=self.filename, error=str(error))
+            finally:
+                for _ in range(len(batch) + is_closed):
+                    self.queue.task_done()
+        connection.close()
+
+    @staticmethod
+    def write_batch(connection: sqlite3.Connection, card_indexes: dict, batch: list) -> None:
+        """
+        Write a batch of reviews in one transaction, on the writer thread.
+        :param connection: The writer thread's connection
+        :param card_indexes: Card IDs mapped to their index in the cards table, updated with the cards that are added
+        :param batch: The queued reviews
+        :return: None
+        """
+        rows = []
+        for card_id, timestamp, grade, prior_interval, easiness_factor in batch:
+            if card_id not in card_indexes:
+                # Another instance sharing the database may have added the card since the indexes were read
+                connection.execute("INSERT OR IGNORE INTO cards (card_id) VALUES (?)", (card_id,))
+                card_indexes[card_id] = connection.execute("SELECT idx FROM cards WHERE card_id = ?",
+                                                           (card_id,)).fetchone()[0]
+            day = date.fromtimestamp(timestamp).toordinal()
+            rows.append((card_indexes[card_id], timestamp, day, grade, prior_interval, easiness_factor))
+        connection.executemany("INSERT INTO reviews VALUES (?, ?, ?, ?, ?, ?)", rows)
+        connection.commit()
+
+    def flush(self) -> None:
+        """
+        Wait until every queued review has been written.
+        :return: None
+        """
+        self.queue.join()
+
+    def close(self) -> None:
+        """
+        Write every queued review and stop the writer thread, should be called before the application exits.
+        :return: None
+        """
+        self.queue.put(None)
+        self.writer.join()
+
+    def review_count(self) -> int:
+        """
+        Get the total number of reviews recorded.
+        :return: The number of reviews
+        """
+        with contextlib.closing(self.connect()) as connection:
+            return connection.execute("SELECT COUNT(*) FROM reviews").fetchone()[0]
+
+    def daily_review_counts(self, since: date = None) -> list[tuple[date, int, int]]:
+        """
+        Get the number of reviews and passed reviews per day, in local time.
+        :param since: Only count reviews on or after this day
+        :return: A list of (day, reviews, passed reviews) tuples, sorted by day
+        """
+        with contextlib.closing(self.connect()) as connection:
+            rows = connection.execute(
+                """SELECT day, COUNT(*), SUM(grade >= 3) FROM reviews WHERE day >= ? GROUP BY day ORDER BY day""",
+                (since.toordinal() if since else 0,)).fetchall()
+        return [(date.fromordinal(day), reviews, passed) for day, reviews, passed in rows]
+
+    def card_review_counts(self) -> list[tuple[str, int, int]]:
+        """
+        Get the number of reviews and passed reviews per card, e.g. to compute the retention of a deck or tag.
+        :return: A list of (card ID, reviews, passed reviews) tuples
+        """
+        with contextlib.closing(self.connect()) as connection:
+            return connection.execute(
+                """SELECT cards.card_id, counts.reviews, counts.passed
+                   FROM (SELECT card_idx, COUNT(*) AS reviews, SUM(grade >= 3) AS passed
+                         FROM reviews GROUP BY card_idx) AS counts
+                   JOIN cards ON cards.idx = counts.card_idx""").fetchall()
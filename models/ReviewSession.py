@@ -0,0 +1,222 @@
+import heapq
+from collections import deque
+from datetime import datetime
+from itertools import chain, count, islice
+from typing import Iterator
+
+import tracing
+from models.Deck import Deck
+from models.Flashcard import Flashcard
+from models.UndoStack import ReviewCommand, card_state, diff_card_state
+
+
+class ReviewSession:
+    """
+    A class to represent a review session over one or more decks. The due cards of each deck are kept in a heap of
+    their own, and the decks are merged lazily with a k-way heap merge, so cards are taken from the decks one at a time
+    in order of their due dates without ever building a list of every due card in the collection.
+    Review cards are shown before new cards, each limited per deck and for the session as a whole, and failed cards are
+    shown again once the other cards are done. Suspended cards are left out as the heaps are built, with one attribute
+    check per card, so they never count against the limits.
+    """
+
+    def __init__(self, decks: list[Deck], max_reviews: int, max_new: int, total_max_reviews: int = None,
+                 total_max_new: int = None):
+        """
+        Constructor for the ReviewSession class
+        :param decks: The decks to review
+        :param max_reviews: The maximum number of review cards per deck per day
+        :param max_new: The maximum number of new cards per deck per day
+        :param total_max_reviews: The maximum number of review cards per day across all the decks, or None for no limit
+        :param total_max_new: The maximum number of new cards per day across all the decks, or None for no limit
+        """
+        self.decks = decks
+        self.max_reviews = max_reviews
+        self.max_new = max_new
+        self.total_max_reviews = total_max_reviews
+        self.total_max_new = total_max_new
+        self.start_time = datetime.now()
+        # Failed cards waiting to be shown again, as (next review date, order, deck index, card)
+        self.relearning = []
+        self.relearning_order = count()
+        # The IDs of the cards answered in this session, so cards shown again aren't counted against the limits twice
+        self.answered = set()
+        self.current = None
+        # Entries taken from the queue ahead of time by upcoming_cards
+        self.lookahead = deque()
+        self.queue = chain(self.merged_queue(is_new=False), self.merged_queue(is_new=True))
+
+    def deck_limit(self, deck: Deck, is_new: bool) -> int:
+        """
+        Get the number of cards of a kind a deck can still show today. The deck's counts come from the daily counters,
+        so cards studied before the app was restarted count as well.
+        :param deck: The deck
+        :param is_new: True for new cards, False for review cards
+        :return: The number of cards
+        """
+        if is_new:
+            return max(self.max_new - deck.session_new_cards, 0)
+        return max(self.max_reviews - deck.session_review_cards, 0)
+
+    def total_limit(self, is_new: bool) -> int:
+        """
+        Get the number of cards of a kind the decks can still show together today. The decks' counts come from the
+        daily counters, so the limit holds across sessions and restarts as well.
+        :param is_new: True for new cards, False for review cards
+        :return: The number of cards, or None if there is no limit
+        """
+        if is_new:
+            if self.total_max_new is None:
+                return None
+            return max(self.total_max_new - sum(deck.session_new_cards for deck in self.decks), 0)
+        if self.total_max_reviews is None:
+            return None
+        return max(self.total_max_reviews - sum(deck.session_review_cards for deck in self.decks), 0)
+
+    def is_due(self, card: Flashcard, is_new: bool) -> bool:
+        """
+        Check whether a card of a kind is due at the start of the session, and isn't suspended.
+        :param card: The card
+        :param is_new: True for new cards, False for review cards
+        :return: True if the card is due, False otherwise
+        """
+        return card.next_review_date <= self.start_time and (card.repetitions == 0) == is_new and not card.suspended
+
+    def deck_queue(self, deck_index: int, is_new: bool) -> Iterator[tuple]:
+        """
+        Get the due cards of a kind of a deck in order of their due dates. The heap is only built when the first card
+        is needed, and each card is only taken from it when it's needed.
+        :param deck_index: The index of the deck in the session
+        :param is_new: True for new cards, False for review cards
+        :return: An iterator of (next review date, order, deck index, card)
+        """
+        heap = [(card.next_review_date, order, deck_index, card)
+                for order, card in enumerate(self.decks[deck_index].cards) if self.is_due(card, is_new)]
+        heapq.heapify(heap)
+        while heap:
+            yield heapq.heappop(heap)
+
+    def merged_queue(self, is_new: bool) -> Iterator[tuple]:
+        """
+        Merge the queues of every deck for a kind of card, each cut off at the deck's limit, and cut the result off at
+        the session's limit. Entries never tie, as the deck index breaks ties between decks, so cards aren't compared.
+        :param is_new: True for new cards, False for review cards
+        :return: An iterator of (next review date, order, deck index, card)
+        """
+        deck_queues = [islice(self.deck_queue(deck_index, is_new), self.deck_limit(deck, is_new))
+                       for deck_index, deck in enumerate(self.decks)]
+        return islice(heapq.merge(*deck_queues), self.total_limit(is_new))
+
+    def current_card(self) -> Flashcard:
+        """
+        Get the card to show, taking the next one from the queue if needed.
+        :return: The card, or None if the session is over
+        """
+        if self.current is None:
+            self.current = self.lookahead.popleft() if self.lookahead else next(self.queue, None)
+            if self.current is None and self.relearning:
+                self.current = heapq.heappop(self.relearning)
+        return self.current[3] if self.current is not None else None
+
+    def upcoming_cards(self, count: int) -> list[Flashcard]:
+        """
+        Get the cards that will be shown after the current one, e.g. to prepare them before they're shown. Failed cards
+        aren't included, as they're only queued again once they've been answered.
+        :param count: The maximum number of cards to get
+        :return: The cards, in the order they will be shown
+        """
+        while len(self.lookahead) < count:
+            entry = next(self.queue, None)
+            if entry is None:
+                break
+            self.lookahead.append(entry)
+        return [entry[3] for entry in islice(self.lookahead, count)]
+
+    def current_deck(self) -> Deck:
+        """
+        Get the deck of the card to show.
+        :return: The deck, or None if the session is over
+        """
+        return self.decks[self.current[2]] if self.current_card() is not None else None
+
+    @tracing.span(category="review")
+    def answer(self, quality: int) -> ReviewCommand:
+        """
+        Review the card being shown, count it against its deck's limits the first time it's answered, and queue it to
+        be shown again if it's still due.
+        :param quality: The quality/score of the review, from 0 to 5
+        :return: The command that undoes the review, or None if the session is over
+        """
+        card = self.current_card()
+        if card is None:
+            return None
+        deck = self.current_deck()
+        entry = self.current
+        is_new_card = card.repetitions == 0
+        state = card_state(card)
+        card.review(quality)
+        # When a card is reviewed, the deck is modified, for the save function to know to save this particular deck
+        deck.is_modified = True
+        is_counted = card.id not in self.answered
+        if is_counted:
+            self.answered.add(card.id)
+            deck.handle_card_review(is_new_card)
+        if card.next_review_date <= datetime.now():
+            heapq.heappush(self.relearning, (card.next_review_date, next(self.relearning_order), self.current[2], card))
+        self.current = None
+        return ReviewCommand(deck, card, diff_card_state(state, card), quality, self, entry, is_new_card, is_counted)
+
+    def undo_answer(self, entry: tuple, is_new_card: bool, is_counted: bool) -> None:
+        """
+        Show a card again after its review was undone, before the card that's being shown, and stop counting the review
+        against its deck's limits. The card's fields are set back by the ReviewCommand.
+        :param entry: The queue entry of the card
+        :param is_new_card: Whether the card was new before the review
+        :param is_counted: Whether the review was counted against the deck's limits
+        :return: None
+        """
+        card = entry[3]
+        if any(queued[3] is card for queued in self.relearning):
+            self.relearning = [queued for queued in self.relearning if queued[3] is not card]
+            heapq.heapify(self.relearning)
+        if is_counted:
+            self.answered.discard(card.id)
+            self.decks[entry[2]].undo_card_review(is_new_card)
+        if self.current is not None and self.current is not entry:
+            self.lookahead.appendleft(self.current)
+        self.current = entry
+
+    def redo_answer(self, entry: tuple, is_new_card: bool, is_counted: bool) -> None:
+        """
+        Move past a card again after its undone review was redone, as answer does. The card's fields are set by the
+        ReviewCommand.
+        :param entry: The queue entry of the card
+        :param is_new_card: Whether the card was new before the review
+        :param is_counted: Whether the review was counted against the deck's limits
+        :return: None
+        """
+        card = entry[3]
+        if self.current is entry:
+            self.current = None
+        elif any(queued is entry for queued in self.lookahead):
+            self.lookahead = deque(queued for queued in self.lookahead if queued is not entry)
+        if is_counted:
+            self.answered.add(card.id)
+            self.decks[entry[2]].handle_card_review(is_new_card)
+        if card.next_review_date <= datetime.now():
+            heapq.heappush(self.relearning, (card.next_review_date, next(self.relearning_order), entry[2], card))
+
+    def count_remaining(self) -> int:
+        """
+        Count the cards the session will show, before any of them are answered, without counting cards that will be
+        shown again after failing them.
+        :return: The number of cards
+        """
+        total = 0
+        for is_new in (False, True):
+            counts = (min(sum(1 for card in deck.cards if self.is_due(card, is_new)), self.deck_limit(deck, is_new))
+                      for deck in self.decks)
+            kind_total = sum(counts)
+            total_limit = self.total_limit(is_new)
+            total += kind_total if total_limit is None else min(kind_total, total_limit)
+        return total
@@ -0,0 +1,231 @@
+import math
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from models.Flashcard import Flashcard
+
+# The lowest easiness factor a card can reach under SM-2
+MIN_EASINESS_FACTOR = 1.3
+
+# The FSRS-4.5 parameters fitted by its authors to a large collection, used until they are fitted to the user's reviews
+FSRS_DEFAULT_WEIGHTS = (0.4872, 1.4003, 3.7145, 13.8206, 5.1618, 1.2298, 0.8975, 0.031, 1.6474, 0.1367, 1.0461,
+                        2.1072, 0.0793, 0.3246, 1.587, 0.2272, 2.8755)
+# The shape of the FSRS forgetting curve, chosen so the recall probability is 90% after `stability` days
+FSRS_DECAY = -0.5
+FSRS_FACTOR = 0.9 ** (1 / FSRS_DECAY) - 1
+# The range stability and difficulty are kept in
+FSRS_STABILITY_RANGE = (0.01, 36500)
+FSRS_DIFFICULTY_RANGE = (1, 10)
+
+# The scheduler cards use unless their deck selects another one
+DEFAULT_SCHEDULER = "sm2"
+
+
+def easiness_factor_delta(quality):
+    """
+    Get the change in easiness factor SM-2 applies after a review. Only uses arithmetic, so it works on a single grade
+    as well as on a NumPy array of grades, e.g. in the WorkloadSimulator.
+    :param quality: The quality/score of the review, from 0 to 5
+    :return: The amount to add to the easiness factor
+    """
+    return 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02)
+
+
+def fsrs_rating(quality: int) -> int:
+    """
+    Convert a grade from 0 to 5, as given by the review buttons, to an FSRS rating from 1 (Again) to 4 (Easy). The
+    "Pass" button's grade of 3 is a normal pass, so it becomes Good rather than Hard.
+    :param quality: The quality/score of the review, from 0 to 5
+    :return: The FSRS rating
+    """
+    if quality < 3:
+        return 1
+    return 4 if quality >= 5 else 3
+
+
+def clamp(value: float, value_range: tuple) -> float:
+    """
+    Limit a value to a range
+    :param value: The value to limit
+    :param value_range: The lowest and highest allowed values
+    :return: The limited value
+    """
+    return min(max(value, value_range[0]), value_range[1])
+
+
+class Scheduler:
+    """
+    The base class of scheduling algorithms. A scheduler updates a card's scheduling fields after a review, and cards
+    delegate to the scheduler named by their `scheduler` field in Flashcard.review.
+    """
+
+    # The name stored in deck files, and the title shown in the app
+    name = None
+    title = None
+
+    def review(self, card: "Flashcard", quality: int, now: datetime) -> None:
+        """
+        Update a card's scheduling fields after a review.
+        :param card: The card that was reviewed
+        :param quality: The quality/score of the review, from 0 to 5
+        :param now: The time of the review
+        :return: None
+        """
+        raise NotImplementedError
+
+
+class SM2Scheduler(Scheduler):
+    """ The SM-2 algorithm, which the app has always used. """
+
+    name = "sm2"
+    title = "SM-2"
+
+    def review(self, card: "Flashcard", quality: int, now: datetime) -> None:
+        # In our case, this is if the user clicks "Pass"
+        if quality >= 3:
+            if card.repetitions == 0:
+                card.interval = 1
+            elif card.repetitions == 1:
+                card.interval = 6
+            else:
+                card.interval = round(card.repetitions * card.easiness_factor)
+            card.repetitions += 1
+        else:
+            # If the user clicks "Fail", reset the card's repetitions and interval
+            card.repetitions = 0
+            card.interval = 0  # Slight adjustment to the algorithm to make the user review the card again on the same day
+
+        # Update the easiness factor
+        card.easiness_factor = card.easiness_factor + easiness_factor_delta(quality)
+        if card.easiness_factor < MIN_EASINESS_FACTOR:
+            card.easiness_factor = MIN_EASINESS_FACTOR
+
+        # Update the next review date
+        card.next_review_date = now + timedelta(days=card.interval)
+        # An FSRS memory state would be out of date now, so it's derived again if the card is switched back to FSRS
+        card.stability = None
+        card.difficulty = None
+
+
+class FSRSScheduler(Scheduler):
+    """
+    The FSRS-4.5 algorithm, which models each card's memory with a stability (the number of days until the recall
+    probability drops to 90%) and a difficulty from 1 to 10, and schedules the next review for when the recall
+    probability reaches the desired retention. Its 17 weights can be fitted to the review history by the FSRSOptimizer.
+    """
+
+    name = "fsrs"
+    title = "FSRS"
+
+    def __init__(self, weights=FSRS_DEFAULT_WEIGHTS, desired_retention: float = 0.9):
+        """
+        Constructor for the FSRSScheduler class
+        :param weights: The 17 FSRS weights
+        :param desired_retention: The recall probability reviews are scheduled at
+        """
+        self.weights = list(weights)
+        self.desired_retention = desired_retention
+
+    def retrievability(self, elapsed_days: float, stability: float) -> float:
+        """
+        Get the probability of recalling a card.
+        :param elapsed_days: The number of days since the card's last review
+        :param stability: The card's stability
+        :return: The recall probability, between 0 and 1
+        """
+        return (1 + FSRS_FACTOR * elapsed_days / stability) ** FSRS_DECAY
+
+    def initial_difficulty(self, rating: int) -> float:
+        """
+        Get the difficulty of a new card after its first review, before it's limited to the difficulty range.
+        :param rating: The FSRS rating of the first review
+        :return: The difficulty
+        """
+        return self.weights[4] - (rating - 3) * self.weights[5]
+
+    def next_difficulty(self, difficulty: float, rating: int) -> float:
+        """
+        Get a card's difficulty after a review, which moves with the rating and reverts slowly to the difficulty of a
+        new card rated Easy.
+        :param difficulty: The card's difficulty before the review
+        :param rating: The FSRS rating of the review
+        :return: The new difficulty
+        """
+        w = self.weights
+        difficulty = w[7] * self.initial_difficulty(4) + (1 - w[7]) * (difficulty - w[6] * (rating - 3))
+        return clamp(difficulty, FSRS_DIFFICULTY_RANGE)
+
+    def next_stability(self, difficulty: float, stability: float, retrievability: float, rating: int) -> float:
+        """
+        Get a card's stability after a review.
+        :param difficulty: The card's difficulty before the review
+        :param stability: The card's stability before the review
+        :param retrievability: The card's recall probability at the time of the review
+        :param rating: The FSRS rating of the review
+        :return: The new stability
+        """
+        w = self.weights
+        if rating > 1:
+            hard_penalty = w[15] if rating == 2 else 1
+            easy_bonus = w[16] if rating == 4 else 1
+            stability = stability * (1 + math.exp(w[8]) * (11 - difficulty) * stability ** -w[9] *
+                                     (math.exp(w[10] * (1 - retrievability)) - 1) * hard_penalty * easy_bonus)
+        else:
+            # Forgetting a card never makes it more stable than it was
+            stability = min(w[11] * difficulty ** -w[12] * ((stability + 1) ** w[13] - 1) *
+                            math.exp(w[14] * (1 - retrievability)), stability)
+        return clamp(stability, FSRS_STABILITY_RANGE)
+
+    def next_interval(self, stability: float) -> int:
+        """
+        Get the number of days until the recall probability drops to the desired retention.
+        :param stability: The card's stability
+        :return: The interval in days, at least 1
+        """
+        interval = stability / FSRS_FACTOR * (self.desired_retention ** (1 / FSRS_DECAY) - 1)
+        return int(clamp(round(interval), (1, FSRS_STABILITY_RANGE[1])))
+
+    def review(self, card: "Flashcard", quality: int, now: datetime) -> None:
+        rating = fsrs_rating(quality)
+        last_review_date = card.next_review_date - timedelta(days=card.interval)
+        elapsed_days = max((now.date() - last_review_date.date()).days, 0)
+
+        if card.stability is None or card.difficulty is None:
+            if card.repetitions == 0:
+                card.stability = clamp(self.weights[rating - 1], FSRS_STABILITY_RANGE)
+                card.difficulty = clamp(self.initial_difficulty(rating), FSRS_DIFFICULTY_RANGE)
+                elapsed_days = 0
+            else:
+                # A card that was learned with SM-2 starts from its current interval and easiness factor
+                card.stability = clamp(float(max(card.interval, 1)), FSRS_STABILITY_RANGE)
+                card.difficulty = clamp(10 - (card.easiness_factor - MIN_EASINESS_FACTOR) / 1.2 * 5,
+                                        FSRS_DIFFICULTY_RANGE)
+
+        # Reviews on the same day as the previous one, such as retrying a failed card, don't change the memory state
+        if elapsed_days > 0:
+            retrievability = self.retrievability(elapsed_days, card.stability)
+            card.stability = self.next_stability(card.difficulty, card.stability, retrievability, rating)
+            card.difficulty = self.next_difficulty(card.difficulty, rating)
+
+        if rating > 1:
+            card.interval = self.next_interval(card.stability)
+            card.repetitions += 1
+        else:
+            # As with SM-2, failed cards are reviewed again on the same day
+            card.repetitions = 0
+            card.interval = 0
+        card.next_review_date = now + timedelta(days=card.interval)
+
+
+# Every available scheduler by name, shared by all cards, so e.g. fitted FSRS weights apply to every card using FSRS
+schedulers = {scheduler.name: scheduler for scheduler in (SM2Scheduler(), FSRSScheduler())}
+
+
+def get_scheduler(name: str) -> Scheduler:
+    """
+    Get a scheduler by name, falling back to the default scheduler for unknown names.
+    :param name: The name of the scheduler, as stored in deck files
+    :return: The scheduler
+    """
+    return schedulers.get(name) or schedulers[DEFAULT_SCHEDULER]
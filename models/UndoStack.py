@@ -0,0 +1,358 @@
+from collections import deque
+from typing import Callable
+
+from models.Deck import Deck
+from models.Flashcard import Flashcard
+
+# The fields of a card that commands record changes to, every field but the ID
+CARD_FIELDS = ("question", "answer", "next_review_date", "repetitions", "easiness_factor", "interval", "tags",
+               "scheduler", "stability", "difficulty", "lapses", "suspended")
+
+# A function called for every card a command changes as observer(card, deck, before, after), e.g. to keep an index up to
+# date. before and after hold the values of the fields that changed, other fields have the card's current values, and
+# before is None for a card that was added, after is None for a card that was removed
+ChangeObserver = Callable[[Flashcard, Deck, dict, dict], None]
+
+
+def card_state(card: Flashcard) -> tuple:
+    """
+    Take a snapshot of a card's fields, to find out which of them a change touched with diff_card_state. Tags are copied,
+    as they're edited in place.
+    :param card: The card
+    :return: The values of CARD_FIELDS
+    """
+    return tuple(tuple(card.tags) if field == "tags" else getattr(card, field) for field in CARD_FIELDS)
+
+
+def diff_card_state(state: tuple, card: Flashcard) -> dict:
+    """
+    Find the fields of a card that changed since a snapshot was taken, e.g. by a review.
+    :param state: The snapshot, taken by card_state
+    :param card: The card
+    :return: The fields that changed mapped to (old value, new value)
+    """
+    changes = {}
+    for field, old_value in zip(CARD_FIELDS, state):
+        new_value = getattr(card, field)
+        if field == "tags":
+            old_value, new_value = list(old_value), list(new_value)
+        if old_value != new_value:
+            changes[field] = (old_value, new_value)
+    return changes
+
+
+def changes_to(card: Flashcard, values: dict) -> dict:
+    """
+    Find the fields of a card that setting some values would change, e.g. the values entered in the card editor.
+    :param card: The card
+    :param values: The fields mapped to their new values
+    :return: The fields that would change mapped to (old value, new value)
+    """
+    changes = {}
+    for field, value in values.items():
+        current = getattr(card, field)
+        if current != value:
+            changes[field] = (list(current) if field == "tags" else current, value)
+    return changes
+
+
+def state_value(card: Flashcard, state: dict, field: str):
+    """
+    Get the value of a field on one side of a change passed to a ChangeObserver.
+    :param card: The card that changed
+    :param state: The before or after values of the change
+    :param field: The field
+    :return: The value
+    """
+    return state[field] if field in state else getattr(card, field)
+
+
+class Command:
+    """
+    A change that can be undone. Commands only record what they change, e.g. the fields of a card that were edited, so
+    applying or reverting one touches as little as possible, and tell the observers of the UndoStack about every card
+    they change so indexes can be updated one card at a time.
+    """
+
+    # Shown in the menu and the toast after undoing, e.g. "Delete card"
+    description = ""
+
+    def apply(self, notify: ChangeObserver) -> None:
+        """
+        Make the change, again after it was undone.
+        :param notify: The function to call for every card that changes
+        :return: None
+        """
+        raise NotImplementedError
+
+    def revert(self, notify: ChangeObserver) -> None:
+        """
+        Undo the change.
+        :param notify: The function to call for every card that changes
+        :return: None
+        """
+        raise NotImplementedError
+
+    def cost(self) -> int:
+        """
+        Estimate the memory the command keeps alive, counted in fields and cards, which limits how many commands are kept.
+        :return: The cost
+        """
+        return 1
+
+
+class CardChangeCommand(Command):
+    """ A command that changes some fields of a card, e.g. an edit in the card editor. """
+
+    def __init__(self, deck: Deck, card: Flashcard, changes: dict, description: str = "Edit card"):
+        """
+        Constructor for the CardChangeCommand class
+        :param deck: The deck of the card
+        :param card: The card
+        :param changes: The fields that change mapped to (old value, new value), see changes_to and diff_card_state
+        :param description: The description of the change
+        """
+        self.deck = deck
+        self.card = card
+        self.changes = changes
+        self.description = description
+
+    def set_fields(self, index: int, notify: ChangeObserver) -> None:
+        """
+        Set the changed fields to their old or new values.
+        :param index: 0 for the old values, 1 for the new ones
+        :param notify: The function to call once the card changed
+        :return: None
+        """
+        before = {}
+        after = {}
+        for field, values in self.changes.items():
+            before[field] = getattr(self.card, field)
+            after[field] = list(values[index]) if field == "tags" else values[index]
+            setattr(self.card, field, after[field])
+        self.deck.is_modified = True
+        notify(self.card, self.deck, before, after)
+
+    def apply(self, notify: ChangeObserver) -> None:
+        self.set_fields(1, notify)
+
+    def revert(self, notify: ChangeObserver) -> None:
+        self.set_fields(0, notify)
+
+    def cost(self) -> int:
+        return len(self.changes)
+
+
+class ReviewCommand(CardChangeCommand):
+    """
+    A review of a card in a review session. The card's scheduling fields are set back when it's undone, the review no
+    longer counts towards the daily limits, and the session shows the card again.
+    """
+
+    def __init__(self, deck: Deck, card: Flashcard, changes: dict, quality: int, session, entry: tuple,
+                 is_new_card: bool, is_counted: bool):
+        """
+        Constructor for the ReviewCommand class
+        :param deck: The deck of the card
+        :param card: The card
+        :param changes: The fields the review changed mapped to (old value, new value)
+        :param quality: The grade the card was given
+        :param session: The ReviewSession the card was reviewed in
+        :param entry: The session's queue entry of the card
+        :param is_new_card: Whether the card was new before the review
+        :param is_counted: Whether the review counted towards the deck's daily limits, i.e. it was the card's first
+            review in the session
+        """
+        super().__init__(deck, card, changes, "Review card")
+        self.quality = quality
+        self.session = session
+        self.entry = entry
+        self.is_new_card = is_new_card
+        self.is_counted = is_counted
+
+    def apply(self, notify: ChangeObserver) -> None:
+        super().apply(notify)
+        self.session.redo_answer(self.entry, self.is_new_card, self.is_counted)
+
+    def revert(self, notify: ChangeObserver) -> None:
+        super().revert(notify)
+        self.session.undo_answer(self.entry, self.is_new_card, self.is_counted)
+
+
+class RemoveCardCommand(Command):
+    """ A command that removes a card from its deck, and puts it back where it was when it's undone. """
+
+    def __init__(self, deck: Deck, card: Flashcard):
+        """
+        Constructor for the RemoveCardCommand class
+        :param deck: The deck of the card
+        :param card: The card to remove
+        """
+        self.deck = deck
+        self.card = card
+        self.index = deck.cards.index(card)
+        self.description = "Delete card"
+
+    def apply(self, notify: ChangeObserver) -> None:
+        if self.index < len(self.deck.cards) and self.deck.cards[self.index] is self.card:
+            del self.deck.cards[self.index]
+        else:
+            self.deck.cards.remove(self.card)
+        self.deck.is_modified = True
+        notify(self.card, self.deck, {}, None)
+
+    def revert(self, notify: ChangeObserver) -> None:
+        self.deck.cards.insert(min(self.index, len(self.deck.cards)), self.card)
+        self.deck.is_modified = True
+        notify(self.card, self.deck, None, {})
+
+
+class RemoveDeckCommand(Command):
+    """ A command that removes a deck from the list of decks, and puts it back with its cards when it's undone. """
+
+    def __init__(self, decks: list[Deck], deck: Deck):
+        """
+        Constructor for the RemoveDeckCommand class
+        :param decks: The list of decks, shared with the rest of the app
+        :param deck: The deck to remove
+        """
+        self.decks = decks
+        self.deck = deck
+        self.index = decks.index(deck)
+        self.description = f"Delete deck {deck.name}"
+
+    def apply(self, notify: ChangeObserver) -> None:
+        self.decks.remove(self.deck)
+        for card in self.deck.cards:
+            notify(card, self.deck, {}, None)
+
+    def revert(self, notify: ChangeObserver) -> None:
+        self.decks.insert(min(self.index, len(self.decks)), self.deck)
+        self.deck.is_modified = True
+        for card in self.deck.cards:
+            notify(card, self.deck, None, {})
+
+    def cost(self) -> int:
+        return 1 + len(self.deck.cards)
+
+
+class CompoundCommand(Command):
+    """ A command made of other commands that are undone together, e.g. removing a tag from every card. """
+
+    def __init__(self, commands: list[Command], description: str):
+        """
+        Constructor for the CompoundCommand class
+        :param commands: The commands, in the order they're applied
+        :param description: The description of the change
+        """
+        self.commands = commands
+        self.description = description
+
+    def apply(self, notify: ChangeObserver) -> None:
+        for command in self.commands:
+            command.apply(notify)
+
+    def revert(self, notify: ChangeObserver) -> None:
+        for command in reversed(self.commands):
+            command.revert(notify)
+
+    def cost(self) -> int:
+        return sum(command.cost() for command in self.commands)
+
+
+class UndoStack:
+    """
+    A class to keep the commands that can be undone, and the undone commands that can be redone. The oldest commands are
+    dropped once there are too many, or together they keep too much alive, so the memory used stays bounded.
+    Every card a command changes is passed to the observers, e.g. the indexes of due dates, leeches and fronts.
+    """
+
+    def __init__(self, max_commands: int = 100, max_cost: int = 100000):
+        """
+        Constructor for the UndoStack class
+        :param max_commands: The most commands that can be undone
+        :param max_cost: The most fields and cards the commands that can be undone may keep together
+        """
+        self.max_commands = max(max_commands, 1)
+        self.max_cost = max_cost
+        self.undo_commands = deque()
+        self.redo_commands = []
+        self.total_cost = 0
+        self.observers: list[ChangeObserver] = []
+
+    def notify(self, card: Flashcard, deck: Deck, before: dict, after: dict) -> None:
+        """
+        Pass a change to a card to every observer.
+        :param card: The card that changed
+        :param deck: The deck of the card
+        :param before: The changed fields' values before the change, or None if the card was added
+        :param after: The changed fields' values after the change, or None if the card was removed
+        :return: None
+        """
+        for observer in self.observers:
+            observer(card, deck, before, after)
+
+    def push(self, command: Command) -> None:
+        """
+        Apply a command and keep it so it can be undone. The commands that were undone can no longer be redone.
+        :param command: The command
+        :return: None
+        """
+        command.apply(self.notify)
+        self.record(command)
+
+    def record(self, command: Command) -> None:
+        """
+        Keep a command whose change was already made, e.g. a review, so it can be undone. The commands that were undone
+        can no longer be redone.
+        :param command: The command
+        :return: None
+        """
+        self.redo_commands.clear()
+        self.add(command)
+
+    def add(self, command: Command) -> None:
+        """
+        Add a command to the commands that can be undone, dropping the oldest ones if needed.
+        :param command: The command
+        :return: None
+        """
+        self.undo_commands.append(command)
+        self.total_cost += command.cost()
+        while len(self.undo_commands) > self.max_commands or \
+                (self.total_cost > self.max_cost and len(self.undo_commands) > 1):
+            self.total_cost -= self.undo_commands.popleft().cost()
+
+    def undo(self) -> Command:
+        """
+        Undo the most recent command.
+        :return: The command, or None if there's nothing to undo
+        """
+        if not self.undo_commands:
+            return None
+        command = self.undo_commands.pop()
+        self.total_cost -= command.cost()
+        command.revert(self.notify)
+        self.redo_commands.append(command)
+        return command
+
+    def redo(self) -> Command:
+        """
+        Apply the most recently undone command again.
+        :return: The command, or None if there's nothing to redo
+        """
+        if not self.redo_commands:
+            return None
+        command = self.redo_commands.pop()
+        command.apply(self.notify)
+        self.add(command)
+        return command
+
+    def clear(self) -> None:
+        """
+        Forget every command, e.g. after decks were reloaded from disk, as the commands refer to cards that were replaced.
+        :return: None
+        """
+        self.undo_commands.clear()
+        self.redo_commands.clear()
+        self.total_cost = 0
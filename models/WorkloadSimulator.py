@@ -0,0 +1,241 @@
+import os
+import threading
+import multiprocessing
+from collections import deque
+from datetime import date
+from concurrent.futures import ProcessPoolExecutor, Future
+
+import numpy as np
+
+from models.Scheduler import MIN_EASINESS_FACTOR, easiness_factor_delta
+
+# The grades given by the "Pass" and "Fail" buttons
+PASS_GRADE = 3
+FAIL_GRADE = 0
+# How many times a failed card is shown again on the same day before it is left for the next day
+MAX_RELEARNING_STEPS = 5
+# The recall probability assumed before any reviews were recorded, and how many reviews that assumption is worth
+PRIOR_RETENTION = 0.85
+PRIOR_REVIEWS = 10
+# The percentiles of the daily review count reported by forecasts
+PERCENTILES = (5, 25, 50, 75, 95)
+
+
+def simulate_workload(snapshot: dict, new_card_limit: int, review_limit: int, days: int, runs: int,
+                      seed: int) -> np.ndarray:
+    """
+    Simulate the daily number of reviews over the coming days. Every run samples a recall probability from the
+    snapshot's retention, and then applies the same update as the SM2Scheduler to every card due each day, with
+    cards passing or failing at random. All runs are simulated together: each run has its own copy of every card, and
+    cards are kept in per-day buckets, so each day only touches the cards due that day, rather than the whole collection.
+    :param snapshot: The state of the collection, as returned by snapshot_collection
+    :param new_card_limit: The number of new cards introduced each day
+    :param review_limit: The maximum number of review cards shown each day, where the rest stay due for the next day
+    :param days: The number of days to simulate
+    :param runs: The number of runs
+    :param seed: The seed of the random number generator, so the runs of each worker differ
+    :return: An array of shape (runs, days) with the number of reviews on each day of each run
+    """
+    rng = np.random.default_rng(seed)
+    daily_reviews = np.zeros((runs, days), dtype=np.int64)
+    new_count = snapshot["new_count"]
+    learned_count = len(snapshot["due"])
+    card_count = learned_count + new_count
+    recall_probability = rng.beta(snapshot["passed"] + PRIOR_RETENTION * PRIOR_REVIEWS,
+                                  snapshot["failed"] + (1 - PRIOR_RETENTION) * PRIOR_REVIEWS, size=runs)
+
+    # Row run * card_count + card holds a run's copy of a card, where new cards come after the learned cards
+    repetitions = np.tile(np.concatenate([snapshot["repetitions"], np.zeros(new_count, dtype=np.int64)]), runs)
+    easiness = np.tile(np.concatenate([snapshot["easiness"], np.full(new_count, 2.5)]), runs)
+    interval = np.tile(np.concatenate([snapshot["interval"], np.zeros(new_count, dtype=np.int64)]), runs)
+    run_offsets = np.arange(runs)[:, None] * card_count
+
+    buckets = {}
+    add_to_buckets(buckets, (run_offsets + np.arange(learned_count)).ravel(),
+                   np.tile(np.maximum(snapshot["due"], 0), runs), days)
+    # Due cards wait in a queue per run until the review limit lets them through, so cards held back for many days are
+    # only touched again on the day they are shown
+    backlogs = [deque() for _ in range(runs)]
+    next_new_card = 0
+
+    for day in range(days):
+        due = np.concatenate(buckets.pop(day, [np.zeros(0, dtype=np.int64)]))
+        shown = []
+        for backlog, run_due in zip(backlogs, split_by_run(due, card_count, runs)):
+            if len(run_due):
+                backlog.append(run_due)
+            shown.extend(take_from_backlog(backlog, review_limit))
+        new_cards = learned_count + np.arange(next_new_card, min(next_new_card + new_card_limit, new_count))
+        next_new_card += len(new_cards)
+        shown = np.concatenate(shown + [(run_offsets + new_cards).ravel()])
+        daily_reviews[:, day] = np.bincount(shown // card_count, minlength=runs)
+
+        relearning = shown
+        for step in range(MAX_RELEARNING_STEPS):
+            passed = rng.random(len(relearning)) < recall_probability[relearning // card_count]
+            apply_sm2(relearning, passed, repetitions, easiness, interval)
+            relearning = relearning[~passed]
+            if not len(relearning) or step == MAX_RELEARNING_STEPS - 1:
+                break
+            daily_reviews[:, day] += np.bincount(relearning // card_count, minlength=runs)
+
+        # Failed cards have an interval of 0, and are left for tomorrow
+        add_to_buckets(buckets, shown, day + np.maximum(interval[shown], 1), days)
+
+    return daily_reviews
+
+
+def split_by_run(rows: np.ndarray, card_count: int, runs: int) -> list[np.ndarray]:
+    """
+    Split rows into the rows of each run, keeping their order within each run.
+    :param rows: The rows to split
+    :param card_count: The number of cards in each run
+    :param runs: The number of runs
+    :return: A list with an array of rows for each run
+    """
+    # A stable sort of 16-bit integers is a radix sort, so this stays linear
+    row_runs = (rows // card_count).astype(np.int16)
+    order = np.argsort(row_runs, kind="stable")
+    return np.split(rows[order], np.cumsum(np.bincount(row_runs, minlength=runs))[:-1])
+
+
+def take_from_backlog(backlog: deque, limit: int) -> list[np.ndarray]:
+    """
+    Take the first rows from a run's backlog, oldest first.
+    :param backlog: A queue of arrays of rows, in the order they came due
+    :param limit: The maximum number of rows to take
+    :return: A list of arrays with at most limit rows in total
+    """
+    taken = []
+    while backlog and limit > 0:
+        chunk = backlog.popleft()
+        if len(chunk) > limit:
+            backlog.appendleft(chunk[limit:])
+            chunk = chunk[:limit]
+        taken.append(chunk)
+        limit -= len(chunk)
+    return taken
+
+
+def apply_sm2(rows: np.ndarray, passed: np.ndarray, repetitions: np.ndarray, easiness: np.ndarray,
+              interval: np.ndarray) -> None:
+    """
+    Apply the update of the SM2Scheduler to many cards at once, in place.
+    :param rows: The rows of the cards that were reviewed
+    :param passed: Whether each card passed
+    :param repetitions: The repetitions of every card
+    :param easiness: The easiness factor of every card
+    :param interval: The interval of every card
+    :return: None
+    """
+    card_repetitions = repetitions[rows]
+    passed_interval = np.where(card_repetitions == 0, 1,
+                               np.where(card_repetitions == 1, 6, np.round(card_repetitions * easiness[rows])))
+    interval[rows] = np.where(passed, passed_interval, 0)
+    repetitions[rows] = np.where(passed, card_repetitions + 1, 0)
+    quality = np.where(passed, PASS_GRADE, FAIL_GRADE)
+    easiness[rows] = np.maximum(easiness[rows] + easiness_factor_delta(quality), MIN_EASINESS_FACTOR)
+
+
+def add_to_buckets(buckets: dict, rows: np.ndarray, due_days: np.ndarray, days: int) -> None:
+    """
+    Add cards to the bucket of the day they are due, dropping those due after the simulated period.
+    :param buckets: A dictionary mapping each day to a list of arrays of rows due that day
+    :param rows: The rows of the cards to add
+    :param due_days: The day each card is due
+    :param days: The number of simulated days
+    :return: None
+    """
+    in_range = due_days < days
+    rows, due_days = rows[in_range], due_days[in_range]
+    order = np.argsort(due_days, kind="stable")
+    unique_days, starts = np.unique(due_days[order], return_index=True)
+    for day, group in zip(unique_days.tolist(), np.split(rows[order], starts[1:])):
+        buckets.setdefault(day, []).append(group)
+
+
+def snapshot_collection(stats) -> dict:
+    """
+    Copy the parts of the collection the simulation needs from a CollectionStats instance. The snapshot only holds
+    NumPy arrays and numbers, so it can be sent to worker processes.
+    :param stats: The CollectionStats of the collection
+    :return: The snapshot
+    """
+    stats.ensure_current()
+    learned = stats.repetitions > 0
+    return {
+        "due": stats.due[learned] - date.today().toordinal(),
+        "repetitions": stats.repetitions[learned].copy(),
+        "easiness": stats.easiness[learned].copy(),
+        "interval": stats.interval[learned].copy(),
+        "new_count": int(np.count_nonzero(~learned)),
+        "passed": int(stats.passed.sum()),
+        "failed": int(stats.reviews.sum() - stats.passed.sum()),
+    }
+
+
+class WorkloadForecaster:
+    """
+    A class to run workload simulations on a pool of worker processes, and combine their runs into percentile bands of
+    the daily review count.
+    """
+
+    def __init__(self, workers: int = None):
+        """
+        Constructor for the WorkloadForecaster class, the worker processes are only started by the first forecast
+        :param workers: The number of worker processes, the number of CPUs by default
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.executor = None
+
+    def forecast(self, snapshot: dict, new_card_limit: int, review_limit: int, days: int,
+                 runs: int = 64) -> Future:
+        """
+        Start a forecast, split over the worker processes.
+        :param snapshot: The state of the collection, as returned by snapshot_collection
+        :param new_card_limit: The number of new cards introduced each day
+        :param review_limit: The maximum number of review cards shown each day
+        :param days: The number of days to forecast
+        :param runs: The total number of runs
+        :return: A future resolving to an array of shape (len(PERCENTILES), days) with the percentile bands
+        """
+        if self.executor is None:
+            # Worker processes are spawned rather than forked, as forking a process running Qt threads isn't safe
+            self.executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                mp_context=multiprocessing.get_context("spawn"))
+
+        runs_per_worker = -(-runs // self.workers)
+        parts = [self.executor.submit(simulate_workload, snapshot, new_card_limit, review_limit, days,
+                                      runs_per_worker, seed) for seed in range(self.workers)]
+        result = Future()
+        lock = threading.Lock()
+
+        def collect(_):
+            with lock:
+                if not all(part.done() for part in parts) or result.running() or result.done():
+                    return
+                if any(part.cancelled() for part in parts):
+                    result.cancel()
+                    return
+                # Once running, the result can no longer be cancelled by the GUI thread
+                result.set_running_or_notify_cancel()
+            if any(part.exception() for part in parts):
+                result.set_exception(next(part.exception() for part in parts if part.exception()))
+            else:
+                daily_reviews = np.concatenate([part.result() for part in parts])
+                result.set_result(np.percentile(daily_reviews, PERCENTILES, axis=0))
+
+        for part in parts:
+            part.add_done_callback(collect)
+        # Cancelling the forecast, e.g. because the settings changed, cancels the parts that haven't started
+        result.add_done_callback(lambda _: result.cancelled() and [part.cancel() for part in parts])
+        return result
+
+    def shutdown(self) -> None:
+        """
+        Stop the worker processes, cancelling any forecasts that haven't started.
+        :return: None
+        """
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
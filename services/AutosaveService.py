@@ -0,0 +1,190 @@
+import os
+import threading
+
+from PySide6.QtCore import QObject, QTimer, QCoreApplication, Signal, Slot
+
+# noinspection PyUnresolvedReferences
+from __feature__ import snake_case, true_property
+
+import utils
+import tracing
+from models.Deck import Deck
+
+
+class AutosaveSignals(QObject):
+    """ This class defines the signals emitted by the AutosaveService once a write has finished. """
+    deck_saved = Signal(str)
+    save_failed = Signal(str, str)
+    changed_on_disk = Signal(Deck)
+    # Emitted from the worker thread to hand the outcome of a write back to the GUI thread, which owns the decks: the
+    # deck, the signature the write expected, and the new signature and fingerprints of the file
+    snapshot_written = Signal(Deck, object, object, object)
+    # The deck, whose write failed or found the file changed on disk
+    snapshot_failed = Signal(Deck)
+
+
+class AutosaveService(QObject):
+    """
+    This class periodically collects the modified decks and writes them to disk on a background thread, so saving never
+    blocks the GUI. Every deck that is modified within one interval is written once, no matter how often it changed.
+    """
+    def __init__(self, decks: list[Deck], directory: str, interval: int = 2000):
+        """
+        Initialize the AutosaveService and start its worker thread.
+        :param decks: The list of decks to watch for modifications, shared with the rest of the app
+        :param directory: The directory to save the decks to
+        :param interval: The number of milliseconds to wait between collecting modified decks
+        """
+        super().__init__()
+        # Every service has its own signals, as they're connected to the service's own slots
+        self.signals = AutosaveSignals()
+        self.signals.snapshot_written.connect(self.apply_written_snapshot)
+        self.signals.snapshot_failed.connect(self.mark_modified)
+        self.decks = decks
+        self.directory = directory
+
+        # Maps a deck's filename to the latest snapshot of its rows, so repeated saves of a deck replace each other
+        self.pending = {}
+        # Only used by the worker: maps a deck's filename to the signatures its snapshots may have been taken with while
+        # writes were in flight, and the signature of the latest write. A snapshot taken with one of them is checked
+        # against the latest write, not against the file as it was before writes the GUI thread hasn't heard of yet
+        self.written_signatures = {}
+        self.writes_in_progress = 0
+        self.is_stopped = False
+        self.condition = threading.Condition()
+        self.worker = threading.Thread(target=self.run_worker, name="AutosaveWorker", daemon=True)
+        self.worker.start()
+
+        self.timer = QTimer(self)
+        self.timer.interval = interval
+        self.timer.timeout.connect(self.save_now)
+        self.timer.start()
+
+    def set_interval(self, interval: int) -> None:
+        """
+        Change how often modified decks are collected.
+        :param interval: The new interval in milliseconds
+        :return: None
+        """
+        self.timer.interval = interval
+
+    def set_directory(self, directory: str) -> None:
+        """
+        Change the directory decks are saved to, e.g. after it was changed in the settings. Writes that were already
+        queued still go to the old directory.
+        :param directory: The new directory
+        :return: None
+        """
+        self.directory = directory
+
+    @Slot()
+    def save_now(self) -> None:
+        """
+        Take a snapshot of every modified deck and queue it for the worker thread. Snapshots are taken on the GUI thread,
+        so the worker never reads a deck while it is being changed.
+        :return: None
+        """
+        snapshots = {}
+        with tracing.trace_span("AutosaveService.save_now", "io"):
+            for deck in self.decks:
+                if deck.is_modified:
+                    snapshots[utils.deck_filepath(deck, self.directory)] = (deck, utils.deck_to_rows(deck),
+                                                                           deck.disk_signature)
+                    deck.is_modified = False
+
+        if snapshots:
+            with self.condition:
+                self.pending.update(snapshots)
+                self.condition.notify_all()
+
+    def run_worker(self) -> None:
+        """
+        Write queued snapshots to disk until the service is shut down.
+        :return: None
+        """
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.pending or self.is_stopped)
+                if not self.pending:
+                    return
+                filename, (deck, rows, snapshot_signature) = self.pending.popitem()
+                self.writes_in_progress += 1
+
+            try:
+                utils.ensure_directory(os.path.dirname(filename))
+                known_signatures, latest_signature = self.written_signatures.get(filename, ((), None))
+                expected_signature = latest_signature if snapshot_signature in known_signatures else snapshot_signature
+                signature = utils.write_deck_snapshot(rows, filename, expected_signature)
+                if signature is not None:
+                    if snapshot_signature == latest_signature or snapshot_signature not in known_signatures:
+                        # The GUI thread caught up with the writes, or read the file again, so older ones can be dropped
+                        known_signatures = {snapshot_signature}
+                    self.written_signatures[filename] = (set(known_signatures) | {signature}, signature)
+                    self.signals.snapshot_written.emit(deck, expected_signature, signature,
+                                                       utils.rows_fingerprints(rows))
+                    self.signals.deck_saved.emit(deck.name)
+                else:
+                    # Another instance changed the file, so the deck has to be merged on the GUI thread and saved again
+                    self.written_signatures.pop(filename, None)
+                    self.signals.snapshot_failed.emit(deck)
+                    self.signals.changed_on_disk.emit(deck)
+            except OSError as error:
+                # Make sure the deck is picked up again on the next interval
+                self.signals.snapshot_failed.emit(deck)
+                self.signals.save_failed.emit(deck.name, str(error))
+            finally:
+                with self.condition:
+                    self.writes_in_progress -= 1
+                    self.condition.notify_all()
+
+    @Slot(Deck, object, object, object)
+    def apply_written_snapshot(self, deck: Deck, expected_signature, signature, fingerprints: dict) -> None:
+        """
+        Record the signature and fingerprints of a written snapshot on its deck, on the GUI thread. A deck that was read
+        from disk again since, e.g. to merge another instance's changes, keeps what was read.
+        :param deck: The deck the snapshot was taken of
+        :param expected_signature: The signature the write expected the file to have
+        :param signature: The signature of the written file
+        :param fingerprints: The fingerprints of the cards in the snapshot
+        :return: None
+        """
+        if deck.disk_signature == expected_signature:
+            deck.disk_signature = signature
+            deck.disk_fingerprints = fingerprints
+
+    @Slot(Deck)
+    def mark_modified(self, deck: Deck) -> None:
+        """
+        Mark a deck whose snapshot wasn't written as modified, so it's picked up again on the next interval.
+        :param deck: The deck
+        :return: None
+        """
+        deck.is_modified = True
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        Queue every modified deck and wait until all queued writes have reached the disk.
+        :param timeout: The maximum number of seconds to wait, or None to wait indefinitely
+        :return: True if all writes finished, False if the timeout was reached
+        """
+        self.save_now()
+        with self.condition:
+            return self.condition.wait_for(lambda: not self.pending and not self.writes_in_progress, timeout)
+
+    def shutdown(self) -> None:
+        """
+        Flush all modified decks and stop the worker thread, should be called before the application exits.
+        :return: None
+        """
+        self.timer.stop()
+        self.flush()
+        # The outcomes of the last writes are still queued for the GUI thread, which is busy shutting down
+        QCoreApplication.send_posted_events(self)
+        # Decks that were changed on disk can't wait for the GUI thread to merge them anymore, so merge and save them here
+        for deck in self.decks:
+            if deck.is_modified:
+                utils.save_deck_to_csv(deck, self.directory)
+        with self.condition:
+            self.is_stopped = True
+            self.condition.notify_all()
+        self.worker.join()
@@ -0,0 +1,223 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from PySide6.QtCore import QObject, QFileSystemWatcher, Signal, Slot
+
+# noinspection PyUnresolvedReferences
+from __feature__ import snake_case, true_property
+
+import utils
+from models.Deck import Deck
+
+
+class DeckWatcherSignals(QObject):
+    """ This class defines the signals emitted by the DeckWatcher after it patched the list of decks. """
+    deck_added = Signal(Deck)
+    deck_changed = Signal(Deck)
+    deck_removed = Signal(Deck)
+    # Emitted from the worker thread to hand a parsed file back to the GUI thread
+    file_parsed = Signal(str, object)
+
+
+class DeckWatcher(QObject):
+    """
+    This class watches the decks directory for deck files that are added, edited or removed outside the app, and
+    patches the list of decks in place. Only the changed files are parsed, on a worker thread. Files written by the app
+    itself are recognized by their signature and ignored. A file is only added as a deck when it appeared in the
+    directory while the app was running, so the files of decks deleted in the app, which stay on disk, aren't added back.
+    """
+    signals = DeckWatcherSignals()
+
+    def __init__(self, decks: list[Deck], directory: str, delay: int = 500):
+        """
+        Initialize the DeckWatcher and start watching the decks directory.
+        :param decks: The list of decks to patch, shared with the rest of the app
+        :param directory: The decks directory to watch
+        :param delay: The number of milliseconds to wait for a file to settle before parsing it
+        """
+        super().__init__()
+        self.decks = decks
+        self.directory = directory
+        self.pending_paths = set()
+        # The deck files found by the last scan of the directory, and the ones that appeared since the app started and
+        # haven't been added as decks yet, e.g. because they were still being written
+        self.directory_paths = set()
+        self.new_paths = set()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="DeckWatcher")
+
+        self.watcher = QFileSystemWatcher(self)
+        utils.ensure_directory(directory)
+        self.watcher.add_path(directory)
+        self.directory_paths = self.list_deck_files()
+        for deck in self.decks:
+            self.watch_file(utils.deck_filepath(deck, directory))
+        self.watcher.directoryChanged.connect(self.handle_directory_changed)
+        self.watcher.fileChanged.connect(self.handle_file_changed)
+        self.signals.file_parsed.connect(self.apply_parsed_file)
+
+        # Editors and sync tools often write a file in several steps, so changes are collected before being processed
+        self.timer = utils.make_single_shot_timer(self, delay, self.process_pending_paths)
+
+    def set_directory(self, directory: str) -> None:
+        """
+        Watch another decks directory, e.g. after it was changed in the settings. The decks are kept, only the files
+        that appear in or change in the new directory from now on are picked up.
+        :param directory: The new decks directory
+        :return: None
+        """
+        if directory == self.directory:
+            return
+        self.timer.stop()
+        self.pending_paths.clear()
+        self.new_paths.clear()
+        watched_paths = self.watcher.files() + self.watcher.directories()
+        if watched_paths:
+            self.watcher.remove_paths(watched_paths)
+        self.directory = directory
+        utils.ensure_directory(directory)
+        self.watcher.add_path(directory)
+        self.directory_paths = self.list_deck_files()
+        for deck in self.decks:
+            self.watch_file(utils.deck_filepath(deck, directory))
+
+    def watch_file(self, path: str) -> None:
+        """
+        Start watching a deck file if it exists. Files that are replaced, as they are on every save, drop out of the
+        watcher, so this is called again after every change.
+        :param path: The deck file to watch
+        :return: None
+        """
+        if os.path.exists(path) and path not in self.watcher.files():
+            self.watcher.add_path(path)
+
+    def find_deck(self, path: str):
+        """
+        Find the deck that is saved to the given file.
+        :param path: The deck file
+        :return: The deck, or None if no deck is saved to the file
+        """
+        for deck in self.decks:
+            if utils.deck_filepath(deck, self.directory) == path:
+                return deck
+        return None
+
+    def list_deck_files(self) -> set[str]:
+        """
+        List the deck files in the decks directory.
+        :return: The paths of the deck files
+        """
+        paths = set()
+        for filename in os.listdir(self.directory):
+            path = utils.deck_filepath_from_filename(self.directory, filename)
+            if utils.is_valid_filename(filename) and utils.is_valid_path(self.directory, path):
+                paths.add(path)
+        return paths
+
+    @Slot(str)
+    def handle_directory_changed(self, directory: str) -> None:
+        """
+        Queue deck files that appeared in or disappeared from the decks directory since the last scan. Comparing with the
+        decks instead would queue the file of every deck deleted in the app on any change, e.g. a temporary file.
+        :param directory: The directory that changed
+        :return: None
+        """
+        current_paths = self.list_deck_files()
+        added_paths = current_paths - self.directory_paths
+        removed_paths = self.directory_paths - current_paths
+        self.directory_paths = current_paths
+        self.new_paths = (self.new_paths | added_paths) - removed_paths
+
+        if added_paths or removed_paths:
+            self.pending_paths.update(added_paths | removed_paths)
+            self.timer.start()
+
+    @Slot(str)
+    def handle_file_changed(self, path: str) -> None:
+        """
+        Queue a deck file that was changed, unless it's the file of a deck that was deleted in the app.
+        :param path: The file that changed
+        :return: None
+        """
+        if path not in self.new_paths and self.find_deck(path) is None:
+            return
+        self.pending_paths.add(path)
+        self.timer.start()
+
+    @Slot()
+    def process_pending_paths(self) -> None:
+        """
+        Hand the queued deck files to the worker thread. Files whose signature matches the deck's are skipped there, which
+        covers every save made by the app itself.
+        :return: None
+        """
+        for path in self.pending_paths:
+            self.watch_file(path)
+            deck = self.find_deck(path)
+            if deck is not None:
+                # A new file of a deck the app knows about, e.g. the first save of a deck created in the app
+                self.new_paths.discard(path)
+            self.executor.submit(self.parse_file, path, deck.disk_signature if deck else None)
+        self.pending_paths.clear()
+
+    def parse_file(self, path: str, known_signature) -> None:
+        """
+        Parse a changed deck file on the worker thread, and hand the result to the GUI thread.
+        :param path: The deck file to parse
+        :param known_signature: The signature of the file when the app last read or wrote it
+        :return: None
+        """
+        if not os.path.exists(path):
+            self.signals.file_parsed.emit(path, None)
+            return
+        if not utils.has_changed_on_disk(path, known_signature):
+            return
+        try:
+            disk_deck = utils.load_deck_from_csv(path)
+        except (OSError,) + utils.DECK_FILE_ERRORS:
+            # The file is still being written, or was damaged, so wait for the next change
+            return
+        self.signals.file_parsed.emit(path, disk_deck)
+
+    @Slot(str, object)
+    def apply_parsed_file(self, path: str, disk_deck) -> None:
+        """
+        Patch the list of decks with a parsed deck file, on the GUI thread.
+        :param path: The deck file that was parsed
+        :param disk_deck: The deck loaded from the file, or None if the file was removed
+        :return: None
+        """
+        deck = self.find_deck(path)
+        if disk_deck is None:
+            # A deck with unsaved changes is kept, and will be written again by the next save, as is a deck that was
+            # never written, e.g. one just created in the app whose first save is still in progress
+            if deck and not deck.is_modified and deck.disk_signature is not None and not os.path.exists(path):
+                self.decks.remove(deck)
+                self.signals.deck_removed.emit(deck)
+            return
+
+        stat = os.stat(path) if os.path.exists(path) else None
+        if stat is None or (stat.st_mtime_ns, stat.st_size) != disk_deck.disk_signature[:2]:
+            # The file changed again since it was parsed, so parse it again rather than merging an outdated version
+            self.handle_file_changed(path)
+            return
+
+        self.watch_file(path)
+        if deck is None:
+            if path not in self.new_paths:
+                # The deck was deleted in the app while its file was being parsed
+                return
+            self.new_paths.discard(path)
+            disk_deck.is_modified = False
+            self.decks.append(disk_deck)
+            self.signals.deck_added.emit(disk_deck)
+        elif deck.disk_signature != disk_deck.disk_signature and utils.merge_deck(deck, disk_deck):
+            self.signals.deck_changed.emit(deck)
+
+    def shutdown(self) -> None:
+        """
+        Stop watching the decks directory and wait for the worker thread to finish.
+        :return: None
+        """
+        self.timer.stop()
+        self.watcher.remove_paths(self.watcher.files() + self.watcher.directories())
+        self.executor.shutdown(wait=True)
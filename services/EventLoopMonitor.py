@@ -0,0 +1,193 @@
+import sys
+import time
+import linecache
+import threading
+import traceback
+from collections import deque
+from datetime import datetime
+
+from PySide6.QtCore import QObject, QTimer, Signal, Slot
+
+# noinspection PyUnresolvedReferences
+from __feature__ import snake_case, true_property
+
+import tracing
+
+# The calls that run a Qt event loop, so the function called from a frame on one of these lines was called by Qt
+EVENT_LOOP_CALLS = (".exec(", ".exec_(", ".process_events(", ".processEvents(")
+
+
+def frame_name(frame) -> str:
+    """
+    Get the qualified name of the function a frame is running, e.g. MainWindow.generate_selected_decks.
+    :param frame: The frame
+    :return: The name
+    """
+    return getattr(frame.f_code, "co_qualname", frame.f_code.co_name)
+
+
+def find_running_slot(frame) -> str:
+    """
+    Find the slot the GUI thread is running, the innermost function that was called by a Qt event loop, which is either
+    the main loop or the loop of a dialog. A lambda connected to a signal is skipped for the function it calls.
+    :param frame: The innermost frame of the GUI thread
+    :return: The qualified name of the slot, or the innermost function if no event loop was found on the stack
+    """
+    frames = []
+    while frame is not None:
+        frames.append(frame)
+        frame = frame.f_back
+    # From the innermost frame outwards, look for a frame whose caller is waiting in an event loop
+    for index, current in enumerate(frames[:-1]):
+        caller = frames[index + 1]
+        if any(call in linecache.getline(caller.f_code.co_filename, caller.f_lineno) for call in EVENT_LOOP_CALLS):
+            if current.f_code.co_name == "<lambda>" and index > 0:
+                current = frames[index - 1]
+            return frame_name(current)
+    return frame_name(frames[0]) if frames else "unknown"
+
+
+class EventLoopMonitorSignals(QObject):
+    """ This class defines the signals emitted by the EventLoopMonitor once the event loop runs again after a stall. """
+    # The slot that was running, and how long the event loop was blocked in milliseconds
+    stall_detected = Signal(str, float)
+
+
+class EventLoopMonitor(QObject):
+    """
+    This class measures how late a timer on the GUI thread fires, which is how long events had to wait for the event
+    loop, and reports stalls, where the loop was blocked for longer than a threshold. A watchdog thread notices a stall
+    while it's happening, samples the Python stack of the GUI thread, and appends the slot that was running and the
+    stack to a log file, so a freeze is logged even if the app never recovers. The stall is reported again with its
+    duration once the event loop runs again.
+    """
+
+    # The number of latency samples kept, a minute's worth at the default interval
+    SAMPLE_COUNT = 1200
+
+    def __init__(self, threshold: int = 250, log_file: str = None, interval: int = 50):
+        """
+        Initialize the EventLoopMonitor on the GUI thread, the monitor only runs once it's started.
+        :param threshold: The number of milliseconds the event loop has to be blocked for to count as a stall
+        :param log_file: The file stalls are appended to, or None to only report them
+        :param interval: The number of milliseconds between timer ticks
+        """
+        super().__init__()
+        # Every monitor has its own signals, as the stalls of one monitor mean nothing to the slots of another
+        self.signals = EventLoopMonitorSignals()
+        self.threshold = threshold
+        self.log_file = log_file
+        self.gui_thread_id = threading.get_ident()
+        self.timer = QTimer(self)
+        self.timer.interval = interval
+        self.timer.timeout.connect(self.tick)
+        # How late each tick was, in milliseconds
+        self.latencies = deque(maxlen=self.SAMPLE_COUNT)
+        # Written by the GUI thread and read by the watchdog, single assignments are atomic
+        self.last_tick = time.monotonic()
+        self.stall_sample = None
+        self.watchdog = None
+        self.stop_event = threading.Event()
+
+    def is_running(self) -> bool:
+        """
+        Check whether the monitor is running.
+        :return: True if the monitor is running, False otherwise
+        """
+        return self.watchdog is not None
+
+    def start(self) -> None:
+        """
+        Start measuring the event loop's latency and watching for stalls.
+        :return: None
+        """
+        if self.is_running():
+            return
+        self.latencies.clear()
+        self.stall_sample = None
+        self.last_tick = time.monotonic()
+        self.timer.start()
+        self.stop_event.clear()
+        self.watchdog = threading.Thread(target=self.run_watchdog, name="EventLoopWatchdog", daemon=True)
+        self.watchdog.start()
+
+    def stop(self) -> None:
+        """
+        Stop the monitor, should be called before the application exits.
+        :return: None
+        """
+        if not self.is_running():
+            return
+        self.timer.stop()
+        self.stop_event.set()
+        self.watchdog.join()
+        self.watchdog = None
+
+    @Slot()
+    def tick(self) -> None:
+        """
+        Record how late the timer fired, and report the stall the watchdog sampled since the last tick, if any.
+        :return: None
+        """
+        now = time.monotonic()
+        latency = max((now - self.last_tick) * 1000 - self.timer.interval, 0.0)
+        self.last_tick = now
+        self.latencies.append(latency)
+
+        sample = self.stall_sample
+        if sample is not None:
+            self.stall_sample = None
+            slot, stack = sample
+            tracing.event("event_loop.stall", f"The event loop was blocked for {latency:.0f} ms in {slot}", "ui",
+                          slot=slot, duration_ms=round(latency), stack=stack)
+            self.signals.stall_detected.emit(slot, latency)
+
+    def run_watchdog(self) -> None:
+        """
+        Check whether the GUI thread has stopped ticking, and sample its stack once for every stall, until the monitor
+        is stopped.
+        :return: None
+        """
+        sampled_tick = None
+        while not self.stop_event.wait(self.threshold / 4000):
+            last_tick = self.last_tick
+            blocked = (time.monotonic() - last_tick) * 1000 - self.timer.interval
+            if blocked < self.threshold or last_tick == sampled_tick:
+                continue
+            sampled_tick = last_tick
+            frame = sys._current_frames().get(self.gui_thread_id)
+            if frame is None:
+                continue
+            slot = find_running_slot(frame)
+            stack = "".join(traceback.format_stack(frame))
+            del frame
+            self.stall_sample = (slot, stack)
+            self.write_log(slot, blocked, stack)
+
+    def write_log(self, slot: str, blocked: float, stack: str) -> None:
+        """
+        Append a stall to the log file, called on the watchdog thread.
+        :param slot: The slot that was running
+        :param blocked: The number of milliseconds the event loop had been blocked for when the stack was sampled
+        :param stack: The stack of the GUI thread
+        :return: None
+        """
+        if not self.log_file:
+            return
+        try:
+            with open(self.log_file, mode='a', encoding='utf-8') as file:
+                file.write(f"{datetime.now().isoformat(timespec='seconds')} The event loop has been blocked for "
+                           f"{blocked:.0f} ms in {slot}\n{stack}\n")
+        except OSError as error:
+            tracing.event("event_loop.log_failed", f"Could not write to {self.log_file}: {error}", "io",
+                          filename=self.log_file, error=str(error))
+
+    def latency_percentiles(self) -> tuple[float, float, float]:
+        """
+        Get the median, 95th percentile and highest latency of the recent ticks.
+        :return: The latencies in milliseconds, all 0 if there were no ticks yet
+        """
+        latencies = sorted(self.latencies)
+        if not latencies:
+            return 0.0, 0.0, 0.0
+        return latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.95)], latencies[-1]
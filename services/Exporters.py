@@ -0,0 +1,254 @@
+import os
+import re
+import csv
+import json
+import time
+import sqlite3
+import hashlib
+import zipfile
+import tempfile
+import itertools
+from datetime import datetime
+from typing import Iterable, Iterator, TextIO
+
+import utils
+from models.Flashcard import Flashcard
+
+# Cards are exported as (deck name, card) pairs, so the cards of several decks can be streamed in one pass
+DeckCards = Iterable[tuple[str, Flashcard]]
+
+TSV_HEADER = ['deck', 'id', 'question', 'answer', 'next_review_date', 'repetitions', 'easiness_factor', 'interval',
+              'tags', 'scheduler', 'stability', 'difficulty', 'lapses', 'suspended']
+# The number of cards inserted into the .apkg database at a time
+APKG_BATCH_SIZE = 1000
+# Anki's card types and queues
+ANKI_NEW, ANKI_REVIEW, ANKI_SUSPENDED = 0, 2, -1
+# The field separator of Anki notes
+ANKI_FIELD_SEPARATOR = "\x1f"
+# The ID of the exported note type, the same in every package, so Anki recognizes it when the same cards are exported
+# again and updates their notes instead of asking to import them with a new note type. Its fields and template must
+# stay the same for that to work.
+ANKI_MODEL_ID = 1700000000000
+HTML_TAG_PATTERN = re.compile(r"<[^>]*>")
+
+ANKI_SCHEMA = """
+CREATE TABLE col (id integer primary key, crt integer not null, mod integer not null, scm integer not null,
+    ver integer not null, dty integer not null, usn integer not null, ls integer not null, conf text not null,
+    models text not null, decks text not null, dconf text not null, tags text not null);
+CREATE TABLE notes (id integer primary key, guid text not null, mid integer not null, mod integer not null,
+    usn integer not null, tags text not null, flds text not null, sfld integer not null, csum integer not null,
+    flags integer not null, data text not null);
+CREATE TABLE cards (id integer primary key, nid integer not null, did integer not null, ord integer not null,
+    mod integer not null, usn integer not null, type integer not null, queue integer not null, due integer not null,
+    ivl integer not null, factor integer not null, reps integer not null, lapses integer not null,
+    left integer not null, odue integer not null, odid integer not null, flags integer not null, data text not null);
+CREATE TABLE revlog (id integer primary key, cid integer not null, usn integer not null, ease integer not null,
+    ivl integer not null, lastIvl integer not null, factor integer not null, time integer not null,
+    type integer not null);
+CREATE TABLE graves (usn integer not null, oid integer not null, type integer not null);
+CREATE INDEX ix_notes_usn on notes (usn);
+CREATE INDEX ix_cards_usn on cards (usn);
+CREATE INDEX ix_revlog_usn on revlog (usn);
+CREATE INDEX ix_cards_nid on cards (nid);
+CREATE INDEX ix_cards_sched on cards (did, queue, due);
+CREATE INDEX ix_revlog_cid on revlog (cid);
+CREATE INDEX ix_notes_csum on notes (csum);
+"""
+
+
+def export_tsv(cards: DeckCards, file: TextIO) -> int:
+    """
+    Write cards to a file as tab-separated values, one row per card, including their scheduling state.
+    :param cards: The (deck name, card) pairs to write
+    :param file: The text file to write to, opened with newline=''
+    :return: The number of cards written
+    """
+    writer = csv.writer(file, delimiter='\t')
+    writer.writerow(TSV_HEADER)
+    count = 0
+    for deck_name, card in cards:
+        writer.writerow([deck_name] + utils.card_to_row(card))
+        count += 1
+    return count
+
+
+def export_jsonl(cards: DeckCards, file: TextIO) -> int:
+    """
+    Write cards to a file as JSON Lines, one object per card, including their scheduling state.
+    :param cards: The (deck name, card) pairs to write
+    :param file: The text file to write to
+    :return: The number of cards written
+    """
+    count = 0
+    for deck_name, card in cards:
+        stats = card.get_stats()
+        stats['next_review_date'] = card.next_review_date.isoformat()
+        file.write(json.dumps({"deck": deck_name, **stats}, ensure_ascii=False) + "\n")
+        count += 1
+    return count
+
+
+def anki_checksum(text: str) -> int:
+    """
+    Get the checksum Anki uses to find notes with the same first field, the first 8 hex digits of its SHA-1.
+    :param text: The first field, without HTML
+    :return: The checksum
+    """
+    return int(hashlib.sha1(text.encode("utf-8")).hexdigest()[:8], 16)
+
+
+def anki_collection_config(deck_ids: dict, model_id: int, now: int) -> tuple:
+    """
+    Get the JSON columns of the col table of an Anki collection with a Basic note type and the exported decks.
+    :param deck_ids: The names of the exported decks mapped to their Anki IDs
+    :param model_id: The ID of the note type
+    :param now: The export time, in seconds since the epoch
+    :return: The conf, models, decks and dconf columns
+    """
+    conf = {"nextPos": 1, "estTimes": True, "activeDecks": [1], "sortType": "noteFld", "timeLim": 0,
+            "sortBackwards": False, "addToCur": True, "curDeck": 1, "newSpread": 0, "dueCounts": True,
+            "curModel": model_id, "collapseTime": 1200}
+    model = {
+        "id": model_id, "name": "Basic (JLPyT)", "type": 0, "mod": now, "usn": -1, "sortf": 0, "did": 1, "tags": [],
+        "vers": [], "req": [[0, "any", [0]]],
+        "flds": [{"name": name, "ord": ord, "sticky": False, "rtl": False, "font": "Arial", "size": 20, "media": []}
+                 for ord, name in enumerate(["Front", "Back"])],
+        "tmpls": [{"name": "Card 1", "ord": 0, "qfmt": "{{Front}}", "afmt": "{{FrontSide}}\n\n<hr id=answer>\n\n{{Back}}",
+                   "did": None, "bqfmt": "", "bafmt": ""}],
+        "css": ".card {\n font-family: arial;\n font-size: 20px;\n text-align: center;\n}\n",
+        "latexPre": "\\documentclass[12pt]{article}\n\\special{papersize=3in,5in}\n\\usepackage[utf8]{inputenc}\n"
+                    "\\usepackage{amssymb,amsmath}\n\\pagestyle{empty}\n\\setlength{\\parindent}{0in}\n"
+                    "\\begin{document}\n",
+        "latexPost": "\\end{document}"
+    }
+
+    def anki_deck(deck_id: int, name: str) -> dict:
+        return {"id": deck_id, "name": name, "mod": now, "usn": -1, "desc": "", "dyn": 0, "conf": 1, "collapsed": False,
+                "newToday": [0, 0], "revToday": [0, 0], "lrnToday": [0, 0], "timeToday": [0, 0], "extendNew": 10,
+                "extendRev": 50}
+
+    decks = {"1": anki_deck(1, "Default")}
+    for name, deck_id in deck_ids.items():
+        decks[str(deck_id)] = anki_deck(deck_id, name)
+    dconf = {"1": {
+        "id": 1, "name": "Default", "mod": 0, "usn": 0, "maxTaken": 60, "autoplay": True, "timer": 0, "replayq": True,
+        "dyn": False,
+        "new": {"delays": [1, 10], "ints": [1, 4, 7], "initialFactor": 2500, "order": 1, "perDay": 20, "bury": True,
+                "separate": True},
+        "rev": {"perDay": 200, "ease4": 1.3, "fuzz": 0.05, "minSpace": 1, "ivlFct": 1, "maxIvl": 36500, "bury": True},
+        "lapse": {"delays": [10], "mult": 0, "minInt": 1, "leechFails": 8, "leechAction": 0}
+    }}
+    return (json.dumps(conf), json.dumps({str(model_id): model}), json.dumps(decks), json.dumps(dconf))
+
+
+def anki_deck_id(name: str) -> int:
+    """
+    Get the Anki ID of an exported deck, derived from its name so a deck keeps its ID across exports.
+    :param name: The name of the deck
+    :return: The ID, above the IDs Anki uses for its own decks
+    """
+    return int(hashlib.sha1(name.encode("utf-8")).hexdigest()[:12], 16) + 2
+
+
+def anki_rows(cards: DeckCards, deck_ids: dict, model_id: int, now: int, today: datetime) -> Iterator[tuple]:
+    """
+    Convert cards to rows of Anki's notes and cards tables. Each card becomes a Basic note with one card, keeping its
+    ID as the note's GUID, so exporting the same cards again updates them in Anki rather than duplicating them.
+    :param cards: The (deck name, card) pairs to convert
+    :param deck_ids: The names of the decks mapped to their Anki IDs, which new decks are added to
+    :param model_id: The ID of the note type
+    :param now: The export time, in seconds since the epoch
+    :param today: The day due dates are counted from, the collection's creation date
+    :return: An iterator of (note row, card row) tuples
+    """
+    # Anki IDs are millisecond timestamps, so notes count up from the export time
+    first_id = now * 1000
+    for position, (deck_name, card) in enumerate(cards):
+        if deck_name not in deck_ids:
+            deck_ids[deck_name] = anki_deck_id(deck_name)
+        note_id = first_id + position
+        sort_field = HTML_TAG_PATTERN.sub("", card.question)
+        tags = " ".join(tag for tag in card.tags if tag)
+        note = (note_id, card.id, model_id, now, -1, f" {tags} " if tags else "",
+                card.question + ANKI_FIELD_SEPARATOR + card.answer, sort_field, anki_checksum(sort_field), 0, "")
+
+        if card.repetitions > 0:
+            card_type = ANKI_REVIEW
+            due = (card.next_review_date.date() - today.date()).days
+            factor = round(card.easiness_factor * 1000)
+        else:
+            card_type = ANKI_NEW
+            due = position
+            factor = 0
+        queue = ANKI_SUSPENDED if card.suspended else card_type
+        # Newer versions of Anki keep the FSRS memory state in the card's data
+        data = json.dumps({"s": card.stability, "d": card.difficulty}) \
+            if card.stability is not None and card.difficulty is not None else ""
+        card_row = (note_id, note_id, deck_ids[deck_name], 0, now, -1, card_type, queue, due, card.interval, factor,
+                    card.repetitions, card.lapses, 0, 0, 0, 0, data)
+        yield note, card_row
+
+
+def export_apkg(cards: DeckCards, filename: str) -> int:
+    """
+    Write cards to an Anki package, a zip file holding an SQLite collection. The collection is written to a temporary
+    file in batches and then compressed into the package, so only a batch of cards is held in memory at a time. The
+    package is moved into place once it's complete.
+    :param cards: The (deck name, card) pairs to write
+    :param filename: The .apkg file to write
+    :return: The number of cards written
+    """
+    now = int(time.time())
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    model_id = ANKI_MODEL_ID
+    deck_ids = {}
+    count = 0
+    directory = os.path.dirname(os.path.abspath(filename))
+
+    with tempfile.TemporaryDirectory(dir=directory) as temp_directory:
+        database_filename = os.path.join(temp_directory, "collection.anki2")
+        connection = sqlite3.connect(database_filename)
+        try:
+            connection.executescript(ANKI_SCHEMA)
+            rows = anki_rows(cards, deck_ids, model_id, now, today)
+            while batch := list(itertools.islice(rows, APKG_BATCH_SIZE)):
+                connection.executemany("INSERT INTO notes VALUES (?,?,?,?,?,?,?,?,?,?,?)", (row[0] for row in batch))
+                connection.executemany("INSERT INTO cards VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)",
+                                       (row[1] for row in batch))
+                count += len(batch)
+            connection.execute("INSERT INTO col VALUES (1,?,?,?,11,0,0,0,?,?,?,?,'{}')",
+                               (int(today.timestamp()), now * 1000, now * 1000,
+                                *anki_collection_config(deck_ids, model_id, now)))
+            connection.commit()
+        finally:
+            connection.close()
+
+        package_filename = os.path.join(temp_directory, "package.apkg")
+        with zipfile.ZipFile(package_filename, "w", compression=zipfile.ZIP_DEFLATED) as package:
+            package.write(database_filename, "collection.anki2")
+            package.writestr("media", "{}")
+        os.replace(package_filename, filename)
+    return count
+
+
+# The formats cards can be exported to, mapped to their exporter and whether it writes to a text file
+EXPORT_FORMATS = {
+    "tsv": (export_tsv, True),
+    "jsonl": (export_jsonl, True),
+    "apkg": (export_apkg, False)
+}
+
+
+def export_cards(cards: DeckCards, filename: str, export_format: str) -> int:
+    """
+    Export cards to a file in one of the EXPORT_FORMATS.
+    :param cards: The (deck name, card) pairs to export, which are read one at a time
+    :param filename: The file to export to
+    :param export_format: The name of the format
+    :return: The number of cards exported
+    """
+    exporter, is_text = EXPORT_FORMATS[export_format]
+    if not is_text:
+        return exporter(cards, filename)
+    with open(filename, mode='w', newline='', encoding='utf-8') as file:
+        return exporter(cards, file)
@@ -0,0 +1,93 @@
+from concurrent.futures import ThreadPoolExecutor, Future
+
+from PySide6.QtCore import QObject, Signal
+
+# noinspection PyUnresolvedReferences
+from __feature__ import snake_case, true_property
+
+from services.Importers import open_anki_package, count_anki_cards, iter_anki_cards
+
+
+class ImportSignals(QObject):
+    """ This class defines the signals emitted by the ImportService while a package is imported. """
+    # A batch of (deck name, card) pairs, and the number of cards read so far out of the total
+    batch_read = Signal(list, int, int)
+    finished = Signal(int)
+    failed = Signal(str)
+
+
+class ImportService(QObject):
+    """
+    This class reads Anki packages on a background thread and hands the cards to the GUI thread in batches, so even
+    collections of hundreds of thousands of cards import without blocking the GUI. Only one package is read at a time.
+    """
+    signals = ImportSignals()
+
+    def __init__(self):
+        """
+        Initialize the ImportService, the worker thread is only started by the first import.
+        """
+        super().__init__()
+        self.executor = None
+        self.future = None
+        self.is_stopped = False
+
+    def is_running(self) -> bool:
+        """
+        Check whether an import is in progress.
+        :return: True if an import is in progress, False otherwise
+        """
+        return self.future is not None and not self.future.done()
+
+    def start(self, filename: str) -> bool:
+        """
+        Start reading a package, unless an import is already in progress.
+        :param filename: The .apkg or .colpkg file to import
+        :return: True if the import was started, False otherwise
+        """
+        if self.is_running():
+            return False
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ImportWorker")
+        self.future = self.executor.submit(self.read_package, filename)
+        self.future.add_done_callback(self.emit_result)
+        return True
+
+    def read_package(self, filename: str) -> int:
+        """
+        Read a package and emit its cards in batches, called on the worker thread.
+        :param filename: The package to read
+        :return: The number of cards read
+        """
+        read_count = 0
+        with open_anki_package(filename) as connection:
+            total = count_anki_cards(connection)
+            for batch in iter_anki_cards(connection):
+                if self.is_stopped:
+                    break
+                read_count += len(batch)
+                self.signals.batch_read.emit(batch, read_count, total)
+        return read_count
+
+    def emit_result(self, future: Future) -> None:
+        """
+        Report the end of an import to the GUI thread, called on the worker thread.
+        :param future: The finished import
+        :return: None
+        """
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            self.signals.failed.emit(str(future.exception()))
+        else:
+            self.signals.finished.emit(future.result())
+
+    def shutdown(self) -> None:
+        """
+        Stop the worker thread after the current batch, abandoning an import in progress.
+        :return: None
+        """
+        self.is_stopped = True
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
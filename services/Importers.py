@@ -0,0 +1,184 @@
+import os
+import re
+import json
+import shutil
+import sqlite3
+import zipfile
+import tempfile
+import contextlib
+from datetime import datetime, timedelta
+from typing import Iterator
+
+from models.Deck import Deck
+from models.Flashcard import Flashcard
+from models.Scheduler import MIN_EASINESS_FACTOR
+
+# zstandard is optional, it's only needed for collections exported by Anki 2.1.50 and later without the "support older
+# Anki versions" option
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# The collection files an Anki package may hold, newest format first. Newer packages also hold a collection.anki2 that
+# only tells older versions of Anki to update
+ANKI_COLLECTION_FILES = ("collection.anki21b", "collection.anki21", "collection.anki2")
+# Anki's card types, and the queues that differ from them
+ANKI_NEW, ANKI_LEARNING, ANKI_REVIEW, ANKI_RELEARNING = 0, 1, 2, 3
+ANKI_QUEUE_SUSPENDED, ANKI_QUEUE_LEARNING, ANKI_QUEUE_DAY_LEARNING = -1, 1, 3
+# The separators of note fields, and of the parts of deck names in newer collections
+ANKI_FIELD_SEPARATOR = "\x1f"
+# The number of cards read from the collection at a time
+IMPORT_BATCH_SIZE = 1000
+
+ANKI_CARDS_QUERY = """
+SELECT c.id, CASE WHEN c.odid THEN c.odid ELSE c.did END AS deck_id, c.ord, c.type, c.queue,
+       CASE WHEN c.odid THEN c.odue ELSE c.due END, c.ivl, c.factor, c.reps, c.lapses, c.data, n.guid, n.flds, n.tags
+FROM cards c JOIN notes n ON c.nid = n.id
+ORDER BY deck_id, c.id
+"""
+
+
+def deck_name_from_anki(name: str) -> str:
+    """
+    Turn the name of an Anki deck into a name that's a valid deck filename. Subdecks are flattened into their full name.
+    :param name: The Anki deck name, with "::" or the unit separator between parent and child decks
+    :return: The deck name
+    """
+    name = name.replace(ANKI_FIELD_SEPARATOR, " - ").replace("::", " - ")
+    return " ".join(re.sub(r"[^\w\s-]+", " ", name).split()) or "Imported"
+
+
+@contextlib.contextmanager
+def open_anki_package(filename: str):
+    """
+    Open the collection inside an Anki package (.apkg or .colpkg). The collection is copied out of the zip file to a
+    temporary file in chunks, as SQLite can only read a file on disk, and the file is deleted when the context exits.
+    :param filename: The package to open
+    :return: A context manager of an SQLite connection to the collection
+    """
+    with zipfile.ZipFile(filename) as package, tempfile.TemporaryDirectory() as temp_directory:
+        names = set(package.namelist())
+        member = next((name for name in ANKI_COLLECTION_FILES if name in names), None)
+        if member is None:
+            raise ValueError(f"{filename} is not an Anki package")
+        database_filename = os.path.join(temp_directory, "collection.db")
+        with package.open(member) as source, open(database_filename, "wb") as target:
+            if member.endswith("b"):
+                if zstandard is None:
+                    raise ValueError("This package was exported by a newer version of Anki, install zstandard to "
+                                     "import it, or export it again with \"Support older Anki versions\"")
+                zstandard.ZstdDecompressor().copy_stream(source, target)
+            else:
+                shutil.copyfileobj(source, target)
+        connection = sqlite3.connect(database_filename)
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+
+def get_anki_deck_names(connection: sqlite3.Connection) -> dict:
+    """
+    Get the names of the decks of an Anki collection, which newer collections keep in a table of their own.
+    :param connection: The connection to the collection
+    :return: The deck IDs mapped to deck names
+    """
+    has_decks_table = connection.execute(
+        "SELECT count(*) FROM sqlite_master WHERE type = 'table' AND name = 'decks'").fetchone()[0]
+    if has_decks_table:
+        return {deck_id: deck_name_from_anki(name) for deck_id, name in connection.execute("SELECT id, name FROM decks")}
+    decks = json.loads(connection.execute("SELECT decks FROM col").fetchone()[0] or "{}")
+    return {int(deck_id): deck_name_from_anki(deck["name"]) for deck_id, deck in decks.items()}
+
+
+def count_anki_cards(connection: sqlite3.Connection) -> int:
+    """
+    Count the cards of an Anki collection, to report progress while importing it.
+    :param connection: The connection to the collection
+    :return: The number of cards
+    """
+    return connection.execute("SELECT count(*) FROM cards").fetchone()[0]
+
+
+def card_from_anki_row(row: tuple, today: int, now: datetime) -> Flashcard:
+    """
+    Convert an Anki card and its note into a Flashcard. The first two fields of the note become the front and back,
+    swapped for the reverse card of a note. Review cards keep their interval, ease and due date, and cards that are
+    still being learned start over as new cards.
+    :param row: A row of ANKI_CARDS_QUERY
+    :param today: The number of days since the collection was created, which review due dates count from
+    :param now: The time of the import
+    :return: The card
+    """
+    card_id, deck_id, card_ord, card_type, queue, due, interval, factor, reps, lapses, data, guid, fields, tags = row
+    fields = fields.split(ANKI_FIELD_SEPARATOR)
+    question = fields[0]
+    answer = fields[1] if len(fields) > 1 else ""
+    if card_ord == 1 and len(fields) > 1:
+        question, answer = answer, question
+
+    card = Flashcard(question, answer, id=guid if card_ord == 0 else f"{guid}-{card_ord}", next_review_date=now,
+                     tags=tags.split(), lapses=lapses, suspended=queue == ANKI_QUEUE_SUSPENDED)
+    if factor:
+        card.easiness_factor = max(factor / 1000, MIN_EASINESS_FACTOR)
+    if card_type == ANKI_REVIEW:
+        card.repetitions = max(reps, 1)
+        card.interval = max(interval, 1)
+        card.next_review_date = now + timedelta(days=due - today)
+    elif card_type == ANKI_RELEARNING:
+        card.interval = max(interval, 1)
+        if queue == ANKI_QUEUE_LEARNING:
+            card.next_review_date = datetime.fromtimestamp(due)
+        elif queue == ANKI_QUEUE_DAY_LEARNING:
+            card.next_review_date = now + timedelta(days=due - today)
+    # Newer versions of Anki keep the FSRS memory state in the card's data
+    if data and data.startswith("{"):
+        memory_state = json.loads(data)
+        card.stability = memory_state.get("s")
+        card.difficulty = memory_state.get("d")
+    return card
+
+
+def iter_anki_cards(connection: sqlite3.Connection, batch_size: int = IMPORT_BATCH_SIZE) -> Iterator[list]:
+    """
+    Read the cards of an Anki collection in batches, grouped by deck, so only one batch is held in memory at a time.
+    :param connection: The connection to the collection
+    :param batch_size: The number of cards in each batch
+    :return: An iterator of lists of (deck name, card) pairs
+    """
+    deck_names = get_anki_deck_names(connection)
+    created = connection.execute("SELECT crt FROM col").fetchone()[0]
+    now = datetime.now()
+    today = int((now.timestamp() - created) // 86400)
+    cursor = connection.execute(ANKI_CARDS_QUERY)
+    while rows := cursor.fetchmany(batch_size):
+        yield [(deck_names.get(row[1], "Imported"), card_from_anki_row(row, today, now)) for row in rows]
+
+
+def add_cards_to_decks(decks: list[Deck], deck_cards: list, card_lookup: dict) -> int:
+    """
+    Add a batch of imported cards to the decks, creating decks that don't exist yet. Cards that are already in the
+    collection, e.g. from importing the same package before, are updated instead of being added again.
+    :param decks: The list of decks, shared with the rest of the app
+    :param deck_cards: The (deck name, card) pairs to add
+    :param card_lookup: The IDs of the cards in the collection mapped to the cards, which the new cards are added to
+    :return: The number of cards that were added rather than updated
+    """
+    deck_lookup = {deck.name: deck for deck in decks}
+    new_cards = {}
+    for deck_name, card in deck_cards:
+        existing_card = card_lookup.get(card.id)
+        if existing_card is not None:
+            existing_card.update_from(card)
+            continue
+        card_lookup[card.id] = card
+        new_cards.setdefault(deck_name, []).append(card)
+
+    for deck_name, cards in new_cards.items():
+        deck = deck_lookup.get(deck_name)
+        if deck is None:
+            deck = Deck(deck_name, [])
+            decks.append(deck)
+        deck.append_cards(cards)
+    return sum(len(cards) for cards in new_cards.values())
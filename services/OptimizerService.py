@@ -0,0 +1,77 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, Future
+
+from PySide6.QtCore import QObject, Signal
+
+# noinspection PyUnresolvedReferences
+from __feature__ import snake_case, true_property
+
+from models.FSRSOptimizer import optimize_fsrs_weights
+
+
+class OptimizerSignals(QObject):
+    """ This class defines the signals emitted by the OptimizerService once a fit has finished. """
+    # The fitted weights, and the average log loss before and after fitting
+    finished = Signal(list, float, float)
+    failed = Signal(str)
+
+
+class OptimizerService(QObject):
+    """
+    This class fits the FSRS weights to the review history on a background process, so the fit neither blocks the GUI
+    nor competes with it for the interpreter lock. Only one fit runs at a time.
+    """
+    signals = OptimizerSignals()
+
+    def __init__(self):
+        """
+        Initialize the OptimizerService, the worker process is only started by the first fit.
+        """
+        super().__init__()
+        self.executor = None
+        self.future = None
+
+    def is_running(self) -> bool:
+        """
+        Check whether a fit is in progress.
+        :return: True if a fit is in progress, False otherwise
+        """
+        return self.future is not None and not self.future.done()
+
+    def start(self, history_filename: str, weights: list[float]) -> bool:
+        """
+        Start fitting the FSRS weights, unless a fit is already in progress.
+        :param history_filename: The SQLite database file of the ReviewHistory, which should be flushed first
+        :param weights: The weights to start from
+        :return: True if the fit was started, False otherwise
+        """
+        if self.is_running():
+            return False
+        if self.executor is None:
+            # The worker process is spawned rather than forked, as forking a process running Qt threads isn't safe
+            self.executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+        self.future = self.executor.submit(optimize_fsrs_weights, history_filename, weights)
+        self.future.add_done_callback(self.emit_result)
+        return True
+
+    def emit_result(self, future: Future) -> None:
+        """
+        Hand the result of a fit to the GUI thread, called on the executor's thread.
+        :param future: The finished fit
+        :return: None
+        """
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            self.signals.failed.emit(str(future.exception()))
+        else:
+            self.signals.finished.emit(*future.result())
+
+    def shutdown(self) -> None:
+        """
+        Stop the worker process, abandoning a fit in progress.
+        :return: None
+        """
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
@@ -0,0 +1,294 @@
+import os
+import gzip
+import json
+import hashlib
+import tempfile
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+import requests
+
+import utils
+import tracing
+from models.Deck import Deck
+
+# The columns of a card sent to the sync server, the columns of a deck file without the deck columns
+SYNC_COLUMNS = utils.CSV_HEADER[2:]
+# The maximum number of changes sent or received in one request
+SYNC_BATCH_SIZE = 500
+# The number of seconds to wait for the server before giving up
+SYNC_TIMEOUT = 30
+
+
+def card_snapshot(decks: list[Deck]) -> list[tuple[str, list]]:
+    """
+    Take a snapshot of every card as the strings sent to the server. The snapshot doesn't reference the cards, so it
+    can be compared with the sync state on another thread while the decks keep changing.
+    :param decks: The decks to take a snapshot of
+    :return: A list of (deck name, card columns) tuples
+    """
+    return [(deck.name, [str(value) for value in utils.card_to_row(card)]) for deck in decks for card in deck.cards]
+
+
+def card_digest(deck_name: str, row: list) -> str:
+    """
+    Get a digest of a card's columns and deck, which is stored in the sync state to tell which cards changed since the
+    last sync. Unlike utils.card_fingerprint, the digest is the same in every process.
+    :param deck_name: The name of the card's deck
+    :param row: The card's columns, as strings
+    :return: The digest
+    """
+    return hashlib.blake2b("\x1f".join([deck_name] + row).encode("utf-8"), digest_size=12).hexdigest()
+
+
+def last_review_time(row: list) -> datetime:
+    """
+    Get the time a card was last reviewed, its due date minus its interval, which decides conflicts between versions.
+    :param row: The card's columns, as strings
+    :return: The time of the last review, or datetime.min for a card that was never reviewed
+    """
+    values = dict(zip(SYNC_COLUMNS, row))
+    if int(values["Repetitions"]) == 0 and int(values["Interval"]) == 0:
+        return datetime.min
+    return datetime.fromisoformat(values["Next Review Date"]) - timedelta(days=int(values["Interval"]))
+
+
+def version_key(row: list, device: str) -> tuple:
+    """
+    Get the key that orders two versions of a card changed on different devices since they last synced, where the
+    greater key wins. A version that still exists beats a deletion, so a card edited on one device and deleted on the
+    other is kept, then the version that was reviewed more recently wins, and the device ID settles the rest, so every
+    device resolves a conflict the same way.
+    :param row: The version's columns, or None if the version is a deletion
+    :param device: The ID of the device that made the version
+    :return: The key
+    """
+    if row is None:
+        return False, datetime.min, device
+    return True, last_review_time(row), device
+
+
+class SyncState:
+    """
+    A class to remember what was last synced: a digest and the server's revision of each card, and the server revision
+    up to which changes were received. Cards whose digest changed are sent with the next sync, and cards missing from
+    the decks are sent as deletions. The state is kept in a JSON file.
+    """
+
+    def __init__(self, filename: str = None):
+        """
+        Constructor for the SyncState class, which loads the state from the file if there is one
+        :param filename: The JSON file to keep the state in, or None to only keep it in memory
+        """
+        self.filename = filename
+        self.device_id = str(uuid4())
+        self.server_url = ""
+        self.server_revision = 0
+        # Card IDs mapped to [digest, server revision]
+        self.cards = {}
+        if filename is not None and os.path.exists(filename):
+            self.load()
+
+    def load(self) -> None:
+        """
+        Load the state from the file, starting over with a full sync if it can't be read.
+        :return: None
+        """
+        try:
+            with open(self.filename, encoding='utf-8') as file:
+                data = json.load(file)
+            self.device_id = data["device_id"]
+            self.server_url = data.get("server_url", "")
+            self.server_revision = int(data["server_revision"])
+            self.cards = data["cards"]
+        except (OSError, ValueError, KeyError, TypeError) as error:
+            tracing.event("sync_state.load_failed", f"Could not load the sync state from {self.filename}: {error}", "io",
+                          filename=self.filename, error=str(error))
+
+    def save(self) -> None:
+        """
+        Write the state to the file atomically, via a temporary file that replaces it.
+        :return: None
+        """
+        if self.filename is None:
+            return
+        directory = os.path.dirname(os.path.abspath(self.filename))
+        file_descriptor, temp_filename = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(self.filename)}.",
+                                                          suffix='.tmp')
+        try:
+            with open(file_descriptor, mode='w', encoding='utf-8') as file:
+                json.dump({"device_id": self.device_id, "server_url": self.server_url,
+                           "server_revision": self.server_revision, "cards": self.cards}, file)
+            os.replace(temp_filename, self.filename)
+        except BaseException:
+            if os.path.exists(temp_filename):
+                os.remove(temp_filename)
+            raise
+
+    def reset_for_server(self, server_url: str) -> None:
+        """
+        Forget what was synced if the server changed, so every card is sent to the new server.
+        :param server_url: The URL of the server about to be synced with
+        :return: None
+        """
+        if server_url != self.server_url:
+            self.server_url = server_url
+            self.server_revision = 0
+            self.cards = {}
+
+    def collect_changes(self, snapshot: list[tuple[str, list]]) -> tuple[list[dict], dict]:
+        """
+        Find the cards that were added, changed or deleted since the last sync.
+        :param snapshot: The cards, as taken by card_snapshot
+        :return: The changes to send, and the digest of each changed card, to remember once the server accepted it
+        """
+        changes = []
+        digests = {}
+        current_ids = set()
+        for deck_name, row in snapshot:
+            card_id = row[0]
+            current_ids.add(card_id)
+            digest = card_digest(deck_name, row)
+            digest_and_revision = self.cards.get(card_id)
+            if digest_and_revision is None or digest_and_revision[0] != digest:
+                base_revision = digest_and_revision[1] if digest_and_revision else 0
+                changes.append({"id": card_id, "deck": deck_name, "base_revision": base_revision, "row": row})
+                digests[card_id] = digest
+        for card_id, (digest, revision) in self.cards.items():
+            if card_id not in current_ids:
+                changes.append({"id": card_id, "deck": None, "base_revision": revision, "row": None})
+                digests[card_id] = None
+        return changes, digests
+
+
+class SyncClient:
+    """
+    A class to sync cards with a sync server over HTTP. Local changes are sent first, in batches, and then the changes
+    other devices made are received, in batches, so only cards that changed since the last sync are transferred.
+    Request and response bodies are gzip compressed JSON.
+    """
+
+    def __init__(self, server_url: str, device_id: str, session: requests.Session = None):
+        """
+        Constructor for the SyncClient class
+        :param server_url: The URL of the sync server, e.g. http://127.0.0.1:8765
+        :param device_id: The ID of this device, which the server uses to skip sending a device its own changes
+        :param session: The requests session to use, a new one by default
+        """
+        self.server_url = server_url.rstrip("/")
+        self.device_id = device_id
+        self.session = session or requests.Session()
+
+    def post(self, path: str, payload: dict) -> dict:
+        """
+        Send a compressed JSON request to the server.
+        :param path: The path of the endpoint
+        :param payload: The request
+        :return: The server's response
+        """
+        body = gzip.compress(json.dumps(payload).encode("utf-8"))
+        response = self.session.post(f"{self.server_url}{path}", data=body, timeout=SYNC_TIMEOUT,
+                                     headers={"Content-Type": "application/json", "Content-Encoding": "gzip",
+                                              "Accept-Encoding": "gzip"})
+        response.raise_for_status()
+        # requests decompresses the response if it's gzip encoded
+        return response.json()
+
+    def sync(self, snapshot: list[tuple[str, list]], state: SyncState) -> dict:
+        """
+        Send the local changes and receive the changes of other devices. The state isn't changed, as it belongs to the
+        GUI thread, instead everything needed to update it is returned, see apply_sync_result.
+        :param snapshot: The cards, as taken by card_snapshot
+        :param state: The sync state, which is only read
+        :return: A dictionary with the digests of the changes sent, the server's revisions of the changes it accepted,
+            the changes received and the server revision they were received up to
+        """
+        changes, digests = state.collect_changes(snapshot)
+        accepted = {}
+        received = []
+        for start in range(0, len(changes), SYNC_BATCH_SIZE):
+            response = self.post("/push", {"device": self.device_id, "changes": changes[start:start + SYNC_BATCH_SIZE]})
+            accepted.update(response["revisions"])
+            # The server's version of a card wins some conflicts, and is sent back in place of the local change
+            received.extend(response["rejected"])
+
+        server_revision = state.server_revision
+        while True:
+            response = self.post("/pull", {"device": self.device_id, "since": server_revision,
+                                           "limit": SYNC_BATCH_SIZE})
+            received.extend(response["changes"])
+            server_revision = response["revision"]
+            if not response["more"]:
+                break
+        return {"digests": digests, "accepted": accepted, "received": received, "server_revision": server_revision}
+
+
+def apply_sync_result(decks: list[Deck], state: SyncState, result: dict) -> int:
+    """
+    Apply the result of SyncClient.sync to the decks and the sync state, on the thread that owns the decks. A received
+    change to a card that was changed locally while syncing is skipped, so the local change is sent with the next sync.
+    The card keeps the base revision it had, so the server resolves the conflict between the two changes then.
+    :param decks: The list of decks, shared with the rest of the app, which decks may be added to
+    :param state: The sync state to update
+    :param result: The result of SyncClient.sync
+    :return: The number of cards that were added, changed or deleted
+    """
+    digests = result["digests"]
+    for card_id, revision in result["accepted"].items():
+        if digests[card_id] is None:
+            state.cards.pop(card_id, None)
+        else:
+            state.cards[card_id] = [digests[card_id], revision]
+
+    deck_lookup = {deck.name: deck for deck in decks}
+    card_lookup = {card.id: (deck, card) for deck in decks for card in deck.cards}
+    changed_count = 0
+    for change in result["received"]:
+        card_id = change["id"]
+        deck_and_card = card_lookup.get(card_id)
+        # The version of the card when the sync started, which is the version sent if it was sent
+        known = state.cards.get(card_id)
+        synced_digest = digests[card_id] if card_id in digests else known and known[0]
+        if deck_and_card is not None and synced_digest is not None:
+            deck, card = deck_and_card
+            if card_digest(deck.name, [str(value) for value in utils.card_to_row(card)]) != synced_digest:
+                # Changed locally while syncing, the local change is sent with the next sync. Its base revision is left
+                # before the received change, so the server sees the conflict rather than the local change overwriting it
+                continue
+
+        if change["row"] is None:
+            if deck_and_card is not None:
+                deck, card = deck_and_card
+                deck.cards.remove(card)
+                deck.is_modified = True
+                del card_lookup[card_id]
+                changed_count += 1
+            state.cards.pop(card_id, None)
+            continue
+
+        remote_card = utils.card_from_row(dict(zip(SYNC_COLUMNS, change["row"])))
+        deck = deck_lookup.get(change["deck"])
+        if deck is None:
+            deck = Deck(change["deck"], [])
+            decks.append(deck)
+            deck_lookup[deck.name] = deck
+        if deck_and_card is None:
+            deck.cards.append(remote_card)
+            card_lookup[card_id] = (deck, remote_card)
+        else:
+            old_deck, card = deck_and_card
+            card.update_from(remote_card)
+            if old_deck is not deck:
+                old_deck.cards.remove(card)
+                old_deck.is_modified = True
+                deck.cards.append(card)
+                card_lookup[card_id] = (deck, card)
+        deck.is_modified = True
+        card = card_lookup[card_id][1]
+        state.cards[card_id] = [card_digest(deck.name, [str(value) for value in utils.card_to_row(card)]),
+                                change["revision"]]
+        changed_count += 1
+
+    state.server_revision = max(state.server_revision, result["server_revision"])
+    state.save()
+    return changed_count
@@ -0,0 +1,201 @@
+"""
+A small sync server that keeps the cards of several devices in step, see services/SyncClient.py for the client.
+
+Usage: python -m services.SyncServer [--host HOST] [--port PORT] [--database FILE]
+
+Every change to a card gets the next server revision, so a device only has to ask for the changes after the last
+revision it received. The server only listens on localhost by default, pass --host 0.0.0.0 to sync over a local network.
+"""
+import sys
+import gzip
+import json
+import sqlite3
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from services.SyncClient import version_key
+
+# The most changes sent in one response, whatever the client asks for
+MAX_PULL_LIMIT = 5000
+
+
+class SyncStore:
+    """
+    A class to store the latest version of every card in an SQLite database, with the revision it was last changed in
+    and the device that changed it. Deleted cards are kept as tombstones without columns, so other devices learn about
+    the deletion.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS cards (
+            id TEXT PRIMARY KEY,
+            deck TEXT,
+            row TEXT,
+            revision INTEGER NOT NULL,
+            device TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS cards_by_revision ON cards (revision);
+    """
+
+    def __init__(self, filename: str):
+        """
+        Constructor for the SyncStore class, which creates the database if needed
+        :param filename: The SQLite database file, or ":memory:" for a store that's only kept in memory
+        """
+        self.connection = sqlite3.connect(filename, check_same_thread=False)
+        self.connection.executescript(self.SCHEMA)
+        # Requests are handled on separate threads, but the connection is used by one request at a time, which also gives
+        # every change its own revision
+        self.lock = threading.Lock()
+
+    def get_revision(self) -> int:
+        """
+        Get the latest revision.
+        :return: The revision, 0 if nothing was synced yet
+        """
+        return self.connection.execute("SELECT coalesce(max(revision), 0) FROM cards").fetchone()[0]
+
+    def push(self, device: str, changes: list[dict]) -> tuple[dict, list[dict]]:
+        """
+        Apply the changes a device made. A change to a card that no other device changed since the device last received
+        it is applied as is, otherwise the version with the greater version_key wins.
+        :param device: The ID of the device
+        :param changes: The changes, each with the card's ID, deck, columns (None for a deletion) and the revision of
+            the card the device last received
+        :return: The new revision of each accepted change, and the server's version of each card whose change lost
+        """
+        accepted = {}
+        rejected = []
+        with self.lock, self.connection:
+            revision = self.get_revision()
+            for change in changes:
+                current = self.connection.execute("SELECT deck, row, revision, device FROM cards WHERE id = ?",
+                                                  (change["id"],)).fetchone()
+                if current is not None and current[2] > change["base_revision"]:
+                    current_row = json.loads(current[1]) if current[1] is not None else None
+                    if version_key(current_row, current[3]) >= version_key(change["row"], device):
+                        rejected.append({"id": change["id"], "deck": current[0], "row": current_row,
+                                         "revision": current[2]})
+                        continue
+                revision += 1
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO cards (id, deck, row, revision, device) VALUES (?, ?, ?, ?, ?)",
+                    (change["id"], change["deck"], json.dumps(change["row"]) if change["row"] is not None else None,
+                     revision, device))
+                accepted[change["id"]] = revision
+        return accepted, rejected
+
+    def pull(self, device: str, since: int, limit: int) -> tuple[list[dict], int, bool]:
+        """
+        Get the changes after a revision, leaving out the device's own changes.
+        :param device: The ID of the device
+        :param since: The revision the device last received changes up to
+        :param limit: The most changes to look at
+        :return: The changes, the revision they go up to, and whether there are more changes after it
+        """
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT id, deck, row, revision, device FROM cards WHERE revision > ? ORDER BY revision LIMIT ?",
+                (since, limit + 1)).fetchall()
+        more = len(rows) > limit
+        rows = rows[:limit]
+        changes = [{"id": card_id, "deck": deck, "row": json.loads(row) if row is not None else None,
+                    "revision": revision} for card_id, deck, row, revision, changed_by in rows if changed_by != device]
+        return changes, rows[-1][3] if rows else since, more
+
+    def close(self) -> None:
+        """
+        Close the database.
+        :return: None
+        """
+        self.connection.close()
+
+
+class SyncRequestHandler(BaseHTTPRequestHandler):
+    """
+    This class handles the requests of the sync protocol, POST /push and POST /pull, with gzip compressed JSON bodies.
+    """
+    # Set on the subclass created by create_sync_server
+    store = None
+
+    def do_POST(self):
+        """ Handle a sync request. """
+        try:
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if self.headers.get("Content-Encoding") == "gzip":
+                body = gzip.decompress(body)
+            request = json.loads(body)
+            if self.path == "/push":
+                accepted, rejected = self.store.push(request["device"], request["changes"])
+                response = {"revisions": accepted, "rejected": rejected}
+            elif self.path == "/pull":
+                limit = min(int(request.get("limit", MAX_PULL_LIMIT)), MAX_PULL_LIMIT)
+                changes, revision, more = self.store.pull(request["device"], int(request["since"]), limit)
+                response = {"changes": changes, "revision": revision, "more": more}
+            else:
+                self.send_error(404)
+                return
+        except (ValueError, KeyError, TypeError, OSError) as error:
+            self.send_error(400, str(error))
+            return
+
+        data = json.dumps(response).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            data = gzip.compress(data)
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        """ Log requests to stderr only when the server was started from the command line. """
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def create_sync_server(database: str, host: str = "127.0.0.1", port: int = 8765,
+                       verbose: bool = False) -> ThreadingHTTPServer:
+    """
+    Create a sync server. It can be run in a thread of another process with serve_forever, e.g. to sync against a
+    stand-in server on localhost, where port 0 picks a free port, found in server.server_address.
+    :param database: The SQLite database file to store the cards in, or ":memory:"
+    :param host: The address to listen on
+    :param port: The port to listen on
+    :param verbose: Whether to log every request
+    :return: The server, which isn't serving yet
+    """
+    handler = type("BoundSyncRequestHandler", (SyncRequestHandler,), {"store": SyncStore(database)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.verbose = verbose
+    return server
+
+
+def main(argv: list[str] = None) -> int:
+    """
+    Run the sync server until it's interrupted
+    :param argv: The command line arguments, taken from sys.argv by default
+    :return: The exit code
+    """
+    parser = argparse.ArgumentParser(prog="python -m services.SyncServer", description="Sync server for JLPyT Flashcards.")
+    parser.add_argument("--host", default="127.0.0.1", help="the address to listen on, localhost by default")
+    parser.add_argument("--port", type=int, default=8765, help="the port to listen on")
+    parser.add_argument("--database", default="sync_server.sqlite3", help="the database file to store the cards in")
+    args = parser.parse_args(argv)
+
+    server = create_sync_server(args.database, args.host, args.port, verbose=True)
+    print(f"Syncing on http://{args.host}:{server.server_address[1]}, press Ctrl+C to stop")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.RequestHandlerClass.store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+from concurrent.futures import ThreadPoolExecutor, Future
+
+from PySide6.QtCore import QObject, Signal
+
+# noinspection PyUnresolvedReferences
+from __feature__ import snake_case, true_property
+
+from models.Deck import Deck
+from services.SyncClient import SyncClient, SyncState, card_snapshot, apply_sync_result
+
+
+class SyncSignals(QObject):
+    """ This class defines the signals emitted by the SyncService once a sync has finished. """
+    # The number of cards sent and the number of cards changed by other devices
+    finished = Signal(int, int)
+    failed = Signal(str)
+    # Emitted from the worker thread to hand the result back to the GUI thread
+    result_received = Signal(object)
+
+
+class SyncService(QObject):
+    """
+    This class syncs the decks with a sync server on a background thread, so the network never blocks the GUI. The
+    cards are copied on the GUI thread when a sync starts, and the changes received are applied on the GUI thread when
+    it ends. Only one sync runs at a time.
+    """
+
+    def __init__(self, decks: list[Deck], state: SyncState):
+        """
+        Initialize the SyncService, the worker thread is only started by the first sync.
+        :param decks: The list of decks to sync, shared with the rest of the app
+        :param state: The state of the last sync
+        """
+        super().__init__()
+        self.signals = SyncSignals()
+        self.decks = decks
+        self.state = state
+        self.executor = None
+        self.future = None
+        self.signals.result_received.connect(self.apply_result)
+
+    def is_running(self) -> bool:
+        """
+        Check whether a sync is in progress.
+        :return: True if a sync is in progress, False otherwise
+        """
+        return self.future is not None and not self.future.done()
+
+    def start(self, server_url: str) -> bool:
+        """
+        Start syncing, unless a sync is already in progress.
+        :param server_url: The URL of the sync server
+        :return: True if the sync was started, False otherwise
+        """
+        if self.is_running():
+            return False
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="SyncWorker")
+        self.state.reset_for_server(server_url)
+        client = SyncClient(server_url, self.state.device_id)
+        self.future = self.executor.submit(client.sync, card_snapshot(self.decks), self.state)
+        self.future.add_done_callback(self.emit_result)
+        return True
+
+    def emit_result(self, future: Future) -> None:
+        """
+        Hand the result of a sync to the GUI thread, called on the worker thread.
+        :param future: The finished sync
+        :return: None
+        """
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            self.signals.failed.emit(str(future.exception()))
+        else:
+            self.signals.result_received.emit(future.result())
+
+    def apply_result(self, result: dict) -> None:
+        """
+        Apply the changes received from the server to the decks, on the GUI thread.
+        :param result: The result of SyncClient.sync
+        :return: None
+        """
+        changed_count = apply_sync_result(self.decks, self.state, result)
+        self.signals.finished.emit(len(result["digests"]), changed_count)
+
+    def shutdown(self) -> None:
+        """
+        Stop the worker thread, abandoning a sync in progress. Nothing is applied, so the next sync sends the same
+        changes again.
+        :return: None
+        """
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
@@ -0,0 +1,241 @@
+"""
+Opt-in tracing of the app's hot paths, e.g. loading and saving decks, reviews and rebuilding widgets, to find out what
+the app was doing when it stalled.
+
+Set the JLPYT_TRACE environment variable, or trace_file in settings.ini, to the file to write the trace to when the app
+exits. The trace is in the Chrome trace event format, which can be opened in chrome://tracing or https://ui.perfetto.dev,
+and a table of the time spent in each span is printed as well. When tracing is off, an instrumented function only costs
+a check of a global variable.
+"""
+import os
+import sys
+import json
+import time
+import atexit
+import functools
+import threading
+from collections import deque
+
+# The most events kept in memory, the oldest events are dropped once there are more
+TRACE_BUFFER_SIZE = 200000
+
+# The collector spans and events are recorded by, None when tracing is off
+collector = None
+
+
+class TraceCollector:
+    """
+    A class to collect spans, the time a function or block took, and events, things that happened at a point in time, in
+    a ring buffer, so a long session only keeps its most recent events. The time spent in each span is also added up
+    for the summary, which counts every span, including the ones dropped from the buffer. Spans are recorded from any
+    thread, e.g. the autosave worker.
+    """
+
+    def __init__(self, capacity: int = TRACE_BUFFER_SIZE):
+        """
+        Constructor for the TraceCollector class
+        :param capacity: The most events kept
+        """
+        # Events are (phase, name, category, start, duration, thread ID, args) tuples, with times in nanoseconds since
+        # the collector was created. Appending to a deque is thread safe
+        self.events = deque(maxlen=capacity)
+        self.origin = time.perf_counter_ns()
+        self.pid = os.getpid()
+        self.thread_names = {}
+        # Span names mapped to [count, total nanoseconds, longest nanoseconds]
+        self.totals = {}
+        self.lock = threading.Lock()
+
+    def add_span(self, name: str, category: str, start: int, end: int, args: dict = None) -> None:
+        """
+        Record a span.
+        :param name: The name of the span, e.g. the qualified name of the function
+        :param category: The category of the span, e.g. "io" or "ui"
+        :param start: The time the span started, from time.perf_counter_ns
+        :param end: The time the span ended, from time.perf_counter_ns
+        :param args: Details to show with the span, if any
+        :return: None
+        """
+        thread_id = threading.get_ident()
+        if thread_id not in self.thread_names:
+            self.thread_names[thread_id] = threading.current_thread().name
+        duration = end - start
+        self.events.append(("X", name, category, start - self.origin, duration, thread_id, args))
+        with self.lock:
+            totals = self.totals.get(name)
+            if totals is None:
+                self.totals[name] = [1, duration, duration]
+            else:
+                totals[0] += 1
+                totals[1] += duration
+                totals[2] = max(totals[2], duration)
+
+    def add_event(self, name: str, category: str, args: dict = None) -> None:
+        """
+        Record an event that happened now.
+        :param name: The name of the event, e.g. "deck.save"
+        :param category: The category of the event
+        :param args: Details of the event, if any
+        :return: None
+        """
+        thread_id = threading.get_ident()
+        if thread_id not in self.thread_names:
+            self.thread_names[thread_id] = threading.current_thread().name
+        self.events.append(("i", name, category, time.perf_counter_ns() - self.origin, 0, thread_id, args))
+
+    def to_chrome_trace(self) -> dict:
+        """
+        Convert the events in the buffer to the Chrome trace event format, with times in microseconds.
+        :return: The trace, as a dictionary to be written as JSON
+        """
+        trace_events = [{"ph": "M", "name": "thread_name", "pid": self.pid, "tid": thread_id, "args": {"name": name}}
+                        for thread_id, name in list(self.thread_names.items())]
+        for phase, name, category, start, duration, thread_id, args in list(self.events):
+            trace_event = {"ph": phase, "name": name, "cat": category, "ts": start / 1000, "pid": self.pid,
+                           "tid": thread_id}
+            if phase == "X":
+                trace_event["dur"] = duration / 1000
+            else:
+                # Instant events are drawn across their thread
+                trace_event["s"] = "t"
+            if args:
+                trace_event["args"] = args
+            trace_events.append(trace_event)
+        return {"traceEvents": trace_events, "displayTimeUnit": "ms"}
+
+    def export(self, filename: str) -> None:
+        """
+        Write the events in the buffer to a file in the Chrome trace event format.
+        :param filename: The file to write to
+        :return: None
+        """
+        with open(filename, mode='w', encoding='utf-8') as file:
+            # Values that JSON can't hold, e.g. dates passed as args, are written as strings
+            json.dump(self.to_chrome_trace(), file, default=str)
+
+    def summary(self) -> list[tuple[str, int, float, float, float]]:
+        """
+        Get the time spent in each span, the span that took the most time in total first.
+        :return: A list of (name, count, total milliseconds, mean milliseconds, longest milliseconds) tuples
+        """
+        with self.lock:
+            totals = [(name, count, total, longest) for name, (count, total, longest) in self.totals.items()]
+        return sorted(((name, count, total / 1e6, total / count / 1e6, longest / 1e6)
+                       for name, count, total, longest in totals), key=lambda row: row[2], reverse=True)
+
+    def format_summary(self) -> str:
+        """
+        Format the summary as a table.
+        :return: The table
+        """
+        rows = self.summary()
+        width = max([len(row[0]) for row in rows] + [4])
+        lines = [f"{'Span':<{width}}  {'Count':>7}  {'Total ms':>10}  {'Mean ms':>9}  {'Max ms':>9}"]
+        lines += [f"{name:<{width}}  {count:>7}  {total:>10.1f}  {mean:>9.2f}  {longest:>9.2f}"
+                  for name, count, total, mean, longest in rows]
+        return "\n".join(lines)
+
+
+def enable(trace_file: str = None, capacity: int = TRACE_BUFFER_SIZE) -> TraceCollector:
+    """
+    Start tracing. If a file is given, the trace is written to it and the summary is printed when the process exits.
+    :param trace_file: The file to write the trace to, or None to only collect it
+    :param capacity: The most events kept
+    :return: The collector
+    """
+    global collector
+    collector = TraceCollector(capacity)
+    if trace_file:
+        atexit.register(finish, collector, trace_file)
+    return collector
+
+
+def disable() -> None:
+    """
+    Stop tracing, the events collected so far are kept by the collector.
+    :return: None
+    """
+    global collector
+    collector = None
+
+
+def finish(trace_collector: TraceCollector, trace_file: str) -> None:
+    """
+    Write a trace to a file and print its summary to stderr.
+    :param trace_collector: The collector
+    :param trace_file: The file to write the trace to
+    :return: None
+    """
+    try:
+        trace_collector.export(trace_file)
+    except OSError as error:
+        print(f"Could not write the trace to {trace_file}: {error}", file=sys.stderr)
+    else:
+        print(f"Trace written to {trace_file}", file=sys.stderr)
+    print(trace_collector.format_summary(), file=sys.stderr)
+
+
+def span(name: str = None, category: str = "app"):
+    """
+    Decorate a function to record a span every time it's called while tracing is on. Slots connected to signals with
+    arguments the slot doesn't take should use trace_span instead, as Qt passes every argument to the wrapper.
+    :param name: The name of the span, the qualified name of the function by default
+    :param category: The category of the span, e.g. "io" or "ui"
+    :return: The decorator
+    """
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            trace_collector = collector
+            if trace_collector is None:
+                return func(*args, **kwargs)
+            start = time.perf_counter_ns()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                trace_collector.add_span(span_name, category, start, time.perf_counter_ns())
+        return wrapper
+    return decorator
+
+
+class trace_span:
+    """
+    A context manager that records a span for a block while tracing is on, with details of the block, e.g.
+    with trace_span("rebuild", "ui", cards=len(cards)): ...
+    """
+
+    __slots__ = ("name", "category", "args", "collector", "start")
+
+    def __init__(self, name: str, category: str = "app", **args):
+        self.name = name
+        self.category = category
+        self.args = args
+        self.collector = collector
+
+    def __enter__(self):
+        if self.collector is not None:
+            self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.collector is not None:
+            self.collector.add_span(self.name, self.category, self.start, time.perf_counter_ns(), self.args)
+        return False
+
+
+def event(name: str, message: str, category: str = "app", **args) -> None:
+    """
+    Report something that happened, e.g. a deck being saved. The message is printed as before tracing existed, and the
+    event is recorded with its details while tracing is on.
+    :param name: The name of the event, e.g. "deck.save"
+    :param message: The message to print
+    :param category: The category of the event
+    :param args: Details of the event
+    :return: None
+    """
+    print(message)
+    trace_collector = collector
+    if trace_collector is not None:
+        trace_collector.add_event(name, category, dict(args, message=message))
@@ -2,28 +2,59 @@ import os
 import re
 import csv
 import configparser
+import time
+import glob
+import shutil
+import tempfile
+import hashlib
+import io
+import gzip
+import contextlib
+import itertools
 from uuid import uuid4
 
 import requests
 
-from typing import List
-
-from PySide6.QtGui import QShortcut, QKeySequence
-from PySide6.QtWidgets import QWidget
+from typing import List, Iterable, Iterator, Callable, TYPE_CHECKING
 
 from models.Deck import Deck
 from models.Flashcard import Flashcard
+from models.Scheduler import DEFAULT_SCHEDULER
+import tracing
+
+if TYPE_CHECKING:
+    from PySide6.QtCore import QObject, QTimer
+    from PySide6.QtWidgets import QWidget
+
+# zstandard is optional, deck files can be compressed with gzip without it
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 
 def is_valid_filename(filename: str) -> bool:
     """
     Check if a filename is valid. A valid filename can only include alphanumeric characters, dashes, and hyphens, and
-    must end with .csv
+    must end with .csv, or .csv.gz or .csv.zst for compressed decks
     :param filename: The filename to check
     :return: True if the filename is valid, False otherwise
     """
-    # Filename can only include alphanumeric characters, dashes, and hyphens, and must end with .csv
-    return re.match(r'^[\w\s-]+\.csv$', filename) is not None
+    # Filename can only include alphanumeric characters, dashes, and hyphens, and must end with a deck file extension
+    return re.match(r'^[\w\s-]+\.csv(\.gz|\.zst)?$', filename) is not None
+
+
+def split_deck_filename(filename: str) -> (str, str):
+    """
+    Split a deck file's name into the deck name and the extension, which includes the compression suffix, if any
+    :param filename: The deck file's name or path
+    :return: The deck name and the extension, e.g. ("JLPT N5", ".csv.gz")
+    """
+    basename = os.path.basename(filename)
+    for extension in COMPRESSED_DECK_EXTENSIONS:
+        if basename.endswith(extension):
+            return basename[:-len(extension)], extension
+    return os.path.splitext(basename)
 
 
 def is_valid_path(basedir, path, follow_symlinks=True):
@@ -47,6 +78,454 @@ def is_valid_path(basedir, path, follow_symlinks=True):
     return abs_path.startswith(os.path.join(basedir, ''))
 
 
+# How many older versions of each deck are kept next to it, and how often a new backup generation is started
+BACKUP_GENERATIONS = 3
+BACKUP_INTERVAL_SECONDS = 600
+# The hidden directory inside the decks directory that the lock files of deck files are kept in
+LOCK_DIRECTORY = '.locks'
+
+CSV_HEADER = ['Deck ID', 'Deck Name', 'Card ID', 'Question', 'Answer', 'Next Review Date', 'Repetitions',
+              'Easiness Factor', 'Interval', 'Tags', 'Scheduler', 'Stability', 'Difficulty', 'Lapses', 'Suspended']
+# Columns added after the first version of the deck format, with the value they have in files written before that
+CSV_COLUMN_DEFAULTS = {'Scheduler': DEFAULT_SCHEDULER, 'Stability': '', 'Difficulty': '', 'Lapses': '0',
+                       'Suspended': '0'}
+# The formats deck files can be saved in, mapped to their extensions
+DECK_FILE_FORMATS = {'csv': '.csv', 'gzip': '.csv.gz', 'zstd': '.csv.zst'}
+COMPRESSED_DECK_EXTENSIONS = ('.csv.gz', '.csv.zst')
+# The bytes compressed files start with, so deck files are read correctly whatever they're named, e.g. backups
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+# The errors raised when reading a damaged deck file
+DECK_FILE_ERRORS = (ValueError, KeyError, csv.Error, EOFError, gzip.BadGzipFile) + \
+                   ((zstandard.ZstdError,) if zstandard else ())
+
+
+def deck_file_extension(file_format: str) -> str:
+    """
+    Get the extension of a deck file format, falling back to gzip for zstd when zstandard isn't installed
+    :param file_format: The name of the format, one of DECK_FILE_FORMATS
+    :return: The extension
+    """
+    if file_format == 'zstd' and zstandard is None:
+        tracing.event("deck_file.zstd_missing", "zstandard is not installed, compressing decks with gzip instead")
+        file_format = 'gzip'
+    return DECK_FILE_FORMATS.get(file_format, '.csv')
+
+
+def open_deck_reader(file):
+    """
+    Wrap a deck file opened in binary mode, so reading it returns the decompressed CSV data. The compression is detected
+    from the first bytes of the file.
+    :param file: The deck file, opened with mode 'rb'
+    :return: A binary file-like object to read from, which is the file itself if it isn't compressed
+    """
+    magic = file.peek(len(ZSTD_MAGIC))[:len(ZSTD_MAGIC)]
+    if magic.startswith(GZIP_MAGIC):
+        return gzip.GzipFile(fileobj=file, mode='rb')
+    if magic == ZSTD_MAGIC:
+        if zstandard is None:
+            raise ValueError(f"{file.name} is compressed with zstd, install zstandard to read it")
+        return zstandard.ZstdDecompressor().stream_reader(file, read_across_frames=True, closefd=False)
+    return file
+
+
+@contextlib.contextmanager
+def open_deck_writer(file, filename: str):
+    """
+    Wrap a deck file opened in binary mode, so the CSV data written to it is compressed. The compressed stream is
+    finished when the context exits, but the file itself is left open, so it can still be flushed and fsync'd.
+    :param file: The deck file, opened with mode 'wb'
+    :param filename: The deck file's name, whose extension tells how to compress it
+    :return: A context manager of a binary file-like object to write to
+    """
+    if filename.endswith('.gz'):
+        # A fixed modification time keeps the output the same for the same content. The csv module writes a row at a
+        # time, so the rows are buffered rather than compressed one by one
+        with gzip.GzipFile(fileobj=file, mode='wb', compresslevel=3, mtime=0) as writer, \
+                io.BufferedWriter(writer, buffer_size=1 << 16) as buffered_writer:
+            yield buffered_writer
+    elif filename.endswith('.zst'):
+        if zstandard is None:
+            raise ValueError(f"{filename} is compressed with zstd, install zstandard to write it")
+        with zstandard.ZstdCompressor(level=9).stream_writer(file, closefd=False) as writer:
+            yield writer
+    else:
+        yield file
+
+
+def ensure_directory(directory: str) -> None:
+    """
+    Create a directory, and any missing parent directories, if it doesn't exist yet
+    :param directory: The directory to create
+    :return: None
+    """
+    os.makedirs(directory, exist_ok=True)
+
+
+def deck_filepath(deck: Deck, directory: str) -> str:
+    """
+    Get the path of the CSV file a deck is saved to
+    :param deck: The deck to get the path for
+    :param directory: The directory the deck is saved in
+    :return: The path of the deck's CSV file
+    """
+    return deck_filepath_from_filename(directory, f"{deck.name}{deck.file_extension}")
+
+
+def deck_filepath_from_filename(directory: str, filename: str) -> str:
+    """
+    Get the path of a deck file in the decks directory, in the same form as deck_filepath, so paths can be compared
+    :param directory: The decks directory
+    :param filename: The name of the deck file
+    :return: The path of the deck file
+    """
+    return f"{directory}/{filename}"
+
+
+def card_to_row(card: Flashcard) -> list:
+    """
+    Convert a card to its CSV columns, without the deck columns
+    :param card: The card to convert
+    :return: The card's columns, in the order of CSV_HEADER
+    """
+    return [card.id, card.question, card.answer, card.next_review_date, card.repetitions, card.easiness_factor,
+            card.interval, ' '.join(card.tags), card.scheduler, optional_value(card.stability),
+            optional_value(card.difficulty), card.lapses, int(card.suspended)]
+
+
+def optional_value(value) -> object:
+    """
+    Get the CSV value of an optional field, where None is written as an empty string, as the csv module does
+    :param value: The value of the field
+    :return: The value to write
+    """
+    return '' if value is None else value
+
+
+def row_value(row: dict, column: str) -> str:
+    """
+    Get a column of a row read by csv.DictReader, falling back to the column's default for files written before the
+    column was added
+    :param row: The row
+    :param column: The name of the column
+    :return: The column's value
+    """
+    value = row.get(column)
+    return CSV_COLUMN_DEFAULTS.get(column, '') if value is None else value
+
+
+def card_fingerprint(values) -> int:
+    """
+    Get a fingerprint of a card's CSV columns, used to tell which cards changed since the deck file was last read
+    :param values: The card's columns, either as written by card_to_row or as strings read from the CSV file
+    :return: The fingerprint of the card
+    """
+    return hash(tuple(str(value) for value in values))
+
+
+@tracing.span(category="io")
+def deck_to_rows(deck: Deck) -> list:
+    """
+    Take a snapshot of a deck as a list of CSV rows, including the header. The snapshot doesn't reference any of the
+    deck's cards, so it can safely be written from another thread while the deck keeps changing.
+    :param deck: The deck to take a snapshot of
+    :return: A list of rows, where the first row is the header
+    """
+    rows = [CSV_HEADER]
+    for card in deck.cards:
+        rows.append([deck.id, deck.name] + card_to_row(card))
+    return rows
+
+
+def rows_fingerprints(rows: list) -> dict:
+    """
+    Get the fingerprints of the cards in a snapshot taken by deck_to_rows
+    :param rows: The rows to get the fingerprints of, including the header
+    :return: A dictionary mapping each card's ID to its fingerprint
+    """
+    return {row[2]: card_fingerprint(row[2:]) for row in rows[1:]}
+
+
+def file_signature(filename: str, digest: str = None):
+    """
+    Get the signature of a deck file, made of its modification time, size and content hash. The hash is taken of the
+    decompressed content of compressed deck files, so it's the same whichever way a deck is stored.
+    :param filename: The file to get the signature of
+    :param digest: The sha256 digest of the file's content, if it is already known
+    :return: A (modification time, size, sha256 digest) tuple, or None if the file doesn't exist
+    """
+    try:
+        if digest is None:
+            with open(filename, mode='rb') as file:
+                reader = open_deck_reader(file)
+                file_hash = hashlib.sha256()
+                for chunk in iter(lambda: reader.read(1 << 20), b''):
+                    file_hash.update(chunk)
+                digest = file_hash.hexdigest()
+                stat = os.fstat(file.fileno())
+        else:
+            stat = os.stat(filename)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size, digest
+
+
+def has_changed_on_disk(filename: str, signature) -> bool:
+    """
+    Check whether a deck file was changed since it was last read or written. The modification time and size are
+    compared first, so the file is only hashed when those differ, e.g. after a sync tool touched it.
+    :param filename: The deck file to check
+    :param signature: The signature recorded when the file was last read or written, or None if it never was
+    :return: True if the file exists and its content differs from the signature, False otherwise
+    """
+    if not os.path.exists(filename):
+        return False
+    if signature is None:
+        return True
+    stat = os.stat(filename)
+    if (stat.st_mtime_ns, stat.st_size) == signature[:2]:
+        return False
+    current_signature = file_signature(filename)
+    return current_signature is not None and current_signature[2] != signature[2]
+
+
+def lock_filename(filename: str) -> str:
+    """
+    Get the filename of the file a deck file's lock is taken on. Lock files are kept in a hidden directory inside the
+    decks directory, so they don't pile up next to the decks or change the decks directory itself every time one is
+    created.
+    :param filename: The deck file
+    :return: The filename of the lock file
+    """
+    directory, basename = os.path.split(filename)
+    return os.path.join(directory, LOCK_DIRECTORY, f"{basename}.lock")
+
+
+@contextlib.contextmanager
+def deck_file_lock(filename: str, timeout: float = 10):
+    """
+    Hold an advisory lock on a deck file, so that instances of the app sharing a decks directory don't write the same
+    deck at the same time. The lock is taken on a separate lock file, as the deck file itself is replaced on save.
+    :param filename: The deck file to lock
+    :param timeout: The number of seconds to wait for the lock before giving up
+    :return: A context manager that holds the lock
+    """
+    lock_path = lock_filename(filename)
+    ensure_directory(os.path.dirname(lock_path))
+    lock_file = open(lock_path, mode='a+b')
+    deadline = time.monotonic() + timeout
+    try:
+        while True:
+            try:
+                if os.name == 'nt':
+                    import msvcrt
+                    lock_file.seek(0)
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+                else:
+                    import fcntl
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"Timed out waiting for the lock on {filename}")
+                time.sleep(0.05)
+        yield
+    finally:
+        # Closing the file releases the lock
+        lock_file.close()
+
+
+@tracing.span(category="io")
+def merge_deck_from_csv(deck: Deck, filename: str) -> bool:
+    """
+    Merge the changes another instance of the app made to a deck's file into the deck, see merge_deck
+    :param deck: The deck to merge the changes into
+    :param filename: The deck's file
+    :return: True if the deck was changed by the merge, False otherwise
+    """
+    return merge_deck(deck, load_deck_from_csv(filename))
+
+
+def merge_deck(deck: Deck, disk_deck: Deck) -> bool:
+    """
+    Merge the changes another instance of the app made to a deck's file into the deck, card by card. Cards are
+    compared against the fingerprints recorded when the file was last read or written: cards only changed on disk are
+    updated in place, cards added on disk are appended, and cards deleted on disk are removed unless they were changed
+    locally. When a card was changed on both sides, the local version wins.
+    :param deck: The deck to merge the changes into
+    :param disk_deck: The deck as it was just loaded from its file
+    :return: True if the deck was changed by the merge, False otherwise
+    """
+    disk_cards = {card.id: card for card in disk_deck.cards}
+    base_fingerprints = deck.disk_fingerprints
+    local_cards = {card.id: card for card in deck.cards}
+    is_changed = False
+
+    for card_id, disk_fingerprint in disk_deck.disk_fingerprints.items():
+        base_fingerprint = base_fingerprints.get(card_id)
+        if base_fingerprint == disk_fingerprint:
+            continue  # Not changed on disk
+
+        local_card = local_cards.get(card_id)
+        if local_card is None:
+            if base_fingerprint is None:
+                # Added on disk
+                deck.cards.append(disk_cards[card_id])
+                is_changed = True
+            # Otherwise it was deleted locally, so it stays deleted
+        elif base_fingerprint is None or card_fingerprint(card_to_row(local_card)) == base_fingerprint:
+            local_card.update_from(disk_cards[card_id])
+            is_changed = True
+
+    deleted_ids = {card_id for card_id, base_fingerprint in base_fingerprints.items()
+                   if card_id not in disk_deck.disk_fingerprints and card_id in local_cards
+                   and card_fingerprint(card_to_row(local_cards[card_id])) == base_fingerprint}
+    if deleted_ids:
+        deck.cards[:] = [card for card in deck.cards if card.id not in deleted_ids]
+        is_changed = True
+
+    # Local changes that were kept are still covered by the deck's is_modified flag, so they will be written later
+    deck.disk_signature = disk_deck.disk_signature
+    deck.disk_fingerprints = disk_deck.disk_fingerprints
+    return is_changed
+
+
+def backup_filename(filename: str, generation: int) -> str:
+    """
+    Get the filename of one of a deck file's backups
+    :param filename: The deck file that was backed up
+    :param generation: The generation of the backup, where 1 is the most recent
+    :return: The filename of the backup
+    """
+    return f"{filename}.bak{generation}"
+
+
+def temp_filename_pattern(filename: str) -> str:
+    """
+    Get a glob pattern matching the temporary files used while writing a deck file
+    :param filename: The deck file being written
+    :return: A glob pattern for the deck file's temporary files
+    """
+    directory, basename = os.path.split(filename)
+    return os.path.join(glob.escape(directory), f".{glob.escape(basename)}.*.tmp")
+
+
+def rotate_backups(filename: str) -> bool:
+    """
+    Move a deck file into the most recent backup slot, shifting the older backups down and dropping the oldest. A new
+    generation is only started once the most recent backup is older than BACKUP_INTERVAL_SECONDS, so frequent saves
+    don't push every useful backup out.
+    :param filename: The deck file to back up
+    :return: True if the file was moved into the backups, False if it was left in place
+    """
+    newest_backup = backup_filename(filename, 1)
+    if not os.path.exists(filename):
+        return False
+    if os.path.exists(newest_backup) and time.time() - os.path.getmtime(newest_backup) < BACKUP_INTERVAL_SECONDS:
+        return False
+
+    for generation in range(BACKUP_GENERATIONS, 1, -1):
+        older_backup = backup_filename(filename, generation - 1)
+        if os.path.exists(older_backup):
+            os.replace(older_backup, backup_filename(filename, generation))
+    os.replace(filename, newest_backup)
+    # Stamp the backup with the time it was made, rather than the time the deck was last written
+    os.utime(newest_backup)
+    return True
+
+
+def fsync_directory(directory: str) -> None:
+    """
+    Flush a directory's entries to disk, so a rename inside it survives a crash. Windows doesn't allow opening
+    directories, and already persists renames, so this does nothing there.
+    :param directory: The directory to flush
+    :return: None
+    """
+    if os.name == 'nt':
+        return
+    file_descriptor = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(file_descriptor)
+    finally:
+        os.close(file_descriptor)
+
+
+class HashingWriter:
+    """
+    A file-like object for the csv module that encodes the text written to it as UTF-8 and passes it on to a binary file,
+    hashing it along the way, so a file's signature can be computed while it is streamed to disk.
+    """
+
+    def __init__(self, file):
+        """
+        Constructor for the HashingWriter class
+        :param file: The binary file to write to
+        """
+        self.file = file
+        self.digest = hashlib.sha256()
+
+    def write(self, text: str) -> None:
+        """
+        Encode, hash and write text to the file
+        :param text: The text to write
+        :return: None
+        """
+        data = text.encode('utf-8')
+        self.digest.update(data)
+        self.file.write(data)
+
+
+def write_rows_to_csv(rows: Iterable[list], filename: str, keep_backups: bool = True):
+    """
+    Write rows to a CSV file atomically. The rows are streamed and fsync'd to a temporary file in the same directory,
+    which then replaces the destination, so the destination is never left half-written. Compressed deck files leave out
+    the Deck ID and Deck Name columns, which are the same on every row, as the deck's name is taken from the filename.
+    :param rows: The rows to write, including the header, which can be a generator to keep memory use flat
+    :param filename: The file to write the rows to
+    :param keep_backups: Whether to move the previous version of the file into its rolling backups
+    :return: The signature of the written file, see file_signature
+    """
+    directory = os.path.dirname(filename) or '.'
+    file_descriptor, temp_filename = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(filename)}.",
+                                                      suffix='.tmp')
+    if filename.endswith(COMPRESSED_DECK_EXTENSIONS):
+        rows = (row[2:] for row in rows)
+    try:
+        with open(file_descriptor, mode='wb') as file:
+            with open_deck_writer(file, filename) as writer:
+                hashing_writer = HashingWriter(writer)
+                csv.writer(hashing_writer).writerows(rows)
+            file.flush()
+            os.fsync(file.fileno())
+        if keep_backups:
+            rotate_backups(filename)
+        os.replace(temp_filename, filename)
+    except BaseException:
+        if os.path.exists(temp_filename):
+            os.remove(temp_filename)
+        raise
+    fsync_directory(directory)
+    return file_signature(filename, hashing_writer.digest.hexdigest())
+
+
+@tracing.span(category="io")
+def write_deck_snapshot(rows: list, filename: str, expected_signature):
+    """
+    Write a snapshot taken by deck_to_rows while holding the deck file's lock, unless another instance of the app
+    changed the file since it was last read or written. The deck isn't touched, so the snapshot can be written on
+    another thread, and the caller records the new signature on the deck.
+    :param rows: The snapshot to write
+    :param filename: The deck's file
+    :param expected_signature: The signature of the file when it was last read or written, or None if it never was
+    :return: The signature of the written file, or None if the file was changed on disk and has to be merged first
+    """
+    with deck_file_lock(filename):
+        if has_changed_on_disk(filename, expected_signature):
+            return None
+        return write_rows_to_csv(rows, filename)
+
+
+@tracing.span(category="io")
 def save_deck_to_csv(deck: Deck, directory: str) -> None:
     """
     Save a deck to a CSV file in the specified directory
@@ -55,22 +534,23 @@ def save_deck_to_csv(deck: Deck, directory: str) -> None:
     :return: None
     """
     if not deck.is_modified:
-        print(f"Deck {deck.name} has not been modified")
+        tracing.event("deck.save_skipped", f"Deck {deck.name} has not been modified", "io", deck=deck.name)
         return  # Skip saving if the deck hasn't been modified
 
-    if not os.path.exists(directory):
-        os.makedirs(directory)
-
-    filename = f"{directory}/{deck.name}.csv"
-    print(f"Saving deck to {filename}")
-    with open(filename, mode='w', newline='', encoding='utf-8') as file:
-        writer = csv.writer(file)
-        writer.writerow(['Deck ID', 'Deck Name', 'Card ID', 'Question', 'Answer', 'Next Review Date', 'Repetitions',
-                         'Easiness Factor', 'Interval', 'Tags'])
-        for card in deck.cards:
-            writer.writerow(
-                [deck.id, deck.name, card.id, card.question, card.answer, card.next_review_date, card.repetitions,
-                 card.easiness_factor, card.interval, ' '.join(card.tags)])
+    ensure_directory(directory)
+
+    filename = deck_filepath(deck, directory)
+    tracing.event("deck.save", f"Saving deck to {filename}", "io", deck=deck.name, filename=filename)
+    while True:
+        rows = deck_to_rows(deck)
+        signature = write_deck_snapshot(rows, filename, deck.disk_signature)
+        if signature is not None:
+            break
+        tracing.event("deck.merge_before_save", f"Deck {deck.name} was changed on disk, merging the changes before saving",
+                      "io", deck=deck.name)
+        merge_deck_from_csv(deck, filename)
+    deck.disk_signature = signature
+    deck.disk_fingerprints = rows_fingerprints(rows)
     deck.is_modified = False  # Reset the modified flag after saving
 
 
@@ -85,50 +565,241 @@ def save_decks_to_csv(decks: List[Deck], directory: str) -> None:
         save_deck_to_csv(deck, directory)
 
 
+def card_from_row(row: dict) -> Flashcard:
+    """
+    Create a card from a row of a deck file
+    :param row: The row, as read by csv.DictReader
+    :return: The Flashcard instance
+    """
+    return Flashcard(
+        question=row['Question'],
+        answer=row['Answer'],
+        next_review_date=row['Next Review Date'],
+        repetitions=int(row['Repetitions']),
+        easiness_factor=float(row['Easiness Factor']),
+        interval=int(row['Interval']),
+        id=row['Card ID'],
+        tags=row['Tags'].split(' '),
+        scheduler=row_value(row, 'Scheduler'),
+        stability=float(row_value(row, 'Stability')) if row_value(row, 'Stability') else None,
+        difficulty=float(row_value(row, 'Difficulty')) if row_value(row, 'Difficulty') else None,
+        lapses=int(row_value(row, 'Lapses')),
+        suspended=row_value(row, 'Suspended') == '1'
+    )
+
+
+def iter_cards_from_csv(filename: str) -> Iterator[Flashcard]:
+    """
+    Read the cards of a deck file one at a time, so even very large decks can be processed with flat memory use
+    :param filename: The deck file to read
+    :return: An iterator over the deck's cards
+    """
+    with open(filename, mode='rb') as file:
+        reader = io.TextIOWrapper(open_deck_reader(file), newline='', encoding='utf-8')
+        for row in csv.DictReader(reader):
+            yield card_from_row(row)
+
+
+def rewrite_deck_file(filename: str, transform: Callable[[Flashcard], bool], extra_cards: Iterable = ()) -> int:
+    """
+    Stream every card of a deck file through a transform and write the result back atomically, while holding the deck
+    file's lock. Only one card is held in memory at a time.
+    :param filename: The deck file to rewrite
+    :param transform: A function that changes a card in place, and returns True if it changed anything
+    :param extra_cards: Cards to append to the end of the deck, which are also passed through the transform
+    :return: The number of cards the transform changed
+    """
+    deck_name = split_deck_filename(filename)[0]
+    changed_cards = 0
+
+    def transformed_rows():
+        nonlocal changed_cards
+        yield CSV_HEADER
+        deck_id = str(uuid4())
+        cards = iter_cards_from_csv(filename) if os.path.exists(filename) else iter(())
+        for card in itertools.chain(cards, extra_cards):
+            if transform(card):
+                changed_cards += 1
+            yield [deck_id, deck_name] + card_to_row(card)
+
+    with deck_file_lock(filename):
+        write_rows_to_csv(transformed_rows(), filename)
+    return changed_cards
+
+
+@tracing.span(category="io")
 def load_deck_from_csv(filename: str) -> Deck:
     """
     Load a deck from a CSV file
     :param filename: The filename to load the deck from, including the directory
     :return: A Deck instance with the cards loaded from the CSV file
     """
-    with open(filename, mode='r', newline='', encoding='utf-8') as file:
-        reader = csv.DictReader(file)
-        cards = []
-        deck_name = filename.split('\\')[-1].split('.')[0]
-        print(f"Loading deck {deck_name}")
-        for row in reader:
-            card = Flashcard(
-                question=row['Question'],
-                answer=row['Answer'],
-                next_review_date=row['Next Review Date'],
-                repetitions=int(row['Repetitions']),
-                easiness_factor=float(row['Easiness Factor']),
-                interval=int(row['Interval']),
-                id=row['Card ID'],
-                tags=row['Tags'].split(' ')
-            )
-            cards.append(card)
-        deck = Deck(name=deck_name, cards=cards)
-        return deck
-
-
+    with open(filename, mode='rb') as file:
+        data = open_deck_reader(file).read()
+        stat = os.fstat(file.fileno())
+
+    reader = csv.DictReader(io.StringIO(data.decode('utf-8'), newline=''))
+    cards = []
+    fingerprints = {}
+    deck_name, extension = split_deck_filename(filename)
+    tracing.event("deck.load", f"Loading deck {deck_name}", "io", deck=deck_name, bytes=len(data))
+    for row in reader:
+        card = card_from_row(row)
+        cards.append(card)
+        fingerprints[card.id] = card_fingerprint(row_value(row, column) for column in CSV_HEADER[2:])
+    deck = Deck(name=deck_name, cards=cards)
+    deck.file_extension = extension
+    deck.disk_signature = (stat.st_mtime_ns, stat.st_size, hashlib.sha256(data).hexdigest())
+    deck.disk_fingerprints = fingerprints
+    return deck
+
+
+def is_complete_deck_file(filename: str) -> bool:
+    """
+    Quickly check whether a deck file looks completely written. Every row written by the csv module ends with a line
+    terminator, so a file that is empty or doesn't end with one was cut off mid-write. Compressed files are checked by
+    decompressing them, which fails if they were cut off.
+    :param filename: The deck file to check
+    :return: True if the file looks complete, False otherwise
+    """
+    with open(filename, mode='rb') as file:
+        reader = open_deck_reader(file)
+        if reader is not file:
+            try:
+                last_chunk = b''
+                for chunk in iter(lambda: reader.read(1 << 20), b''):
+                    last_chunk = chunk
+                return last_chunk.endswith(b'\n')
+            except DECK_FILE_ERRORS:
+                return False
+        file.seek(0, os.SEEK_END)
+        if file.tell() == 0:
+            return False
+        file.seek(-1, os.SEEK_END)
+        return file.read(1) == b'\n'
+
+
+@tracing.span(category="io")
+def recover_deck_file(filename: str) -> bool:
+    """
+    Replace a missing or damaged deck file with the most recent intact copy, trying temporary files left behind by an
+    interrupted save first, then the backups from newest to oldest. A temporary file has to be completely written, as
+    it may have been cut off by the crash, while a backup only has to parse, as it was a deck file that was in use and
+    may have been edited by hand. A damaged file is kept with a .corrupt suffix.
+    :param filename: The deck file to recover
+    :return: True if the deck file was recovered, False if no intact copy was found
+    """
+    temp_filenames = sorted(glob.glob(temp_filename_pattern(filename)), key=os.path.getmtime, reverse=True)
+    backups = [backup_filename(filename, generation) for generation in range(1, BACKUP_GENERATIONS + 1)]
+
+    for candidate in temp_filenames + [backup for backup in backups if os.path.exists(backup)]:
+        try:
+            if candidate in temp_filenames and not is_complete_deck_file(candidate):
+                continue
+            load_deck_from_csv(candidate)
+        except (OSError,) + DECK_FILE_ERRORS:
+            continue
+
+        tracing.event("deck_file.recover", f"Recovering {filename} from {candidate}", "io", filename=filename,
+                      source=candidate)
+        if os.path.exists(filename):
+            os.replace(filename, f"{filename}.corrupt")
+        if candidate in temp_filenames:
+            os.replace(candidate, filename)
+        else:
+            shutil.copy2(candidate, filename)
+        for temp_filename in glob.glob(temp_filename_pattern(filename)):
+            os.remove(temp_filename)
+        return True
+
+    tracing.event("deck_file.recover_failed", f"Could not recover {filename}", "io", filename=filename)
+    return False
+
+
+def recover_decks_directory(directory: str) -> None:
+    """
+    Clean up after saves that were interrupted by a crash. Decks that went missing while their previous version was
+    being moved into the backups are restored, and temporary files left next to intact decks are removed, as are lock
+    files left next to the decks by earlier versions, which kept them there rather than in LOCK_DIRECTORY.
+    :param directory: The decks directory to check
+    :return: None
+    """
+    for old_lock_filename in glob.glob(os.path.join(glob.escape(directory), '*.lock')):
+        if is_valid_filename(os.path.basename(old_lock_filename)[:-len('.lock')]):
+            try:
+                os.remove(old_lock_filename)
+            except OSError:
+                pass
+
+    for temp_filename in glob.glob(os.path.join(glob.escape(directory), '.*.tmp')):
+        # Temporary files are named ".<deck filename>.<random>.tmp"
+        deck_filename = os.path.join(directory, os.path.basename(temp_filename)[1:].rsplit('.', 2)[0])
+        if not is_valid_filename(os.path.basename(deck_filename)):
+            continue
+        if not os.path.exists(deck_filename):
+            recover_deck_file(deck_filename)
+        elif os.path.exists(temp_filename):
+            os.remove(temp_filename)
+
+
+@tracing.span(category="io")
 def load_decks_from_csv(directory: str) -> List[Deck]:
     """
-    Load all decks from a directory
+    Load all decks from a directory, recovering any deck files that were left damaged by a crash. Only a file that can't
+    be parsed is recovered, so a deck that was edited by hand, e.g. without a line break at the end, is never replaced
+    by an older copy. A ValueError is raised for a file that can't be parsed or recovered, rather than leaving it out.
     :param directory: The directory to load the decks from, will be validated by is_valid_path
     :return: A list of Deck instances with the cards loaded from the CSV files
     """
+    recover_decks_directory(directory)
+
     decks = []
     for filename in os.listdir(directory):
         filepath = os.path.join(directory, filename)
         if is_valid_path(directory, filepath) and is_valid_filename(filename):
-            deck = load_deck_from_csv(filepath)
+            try:
+                deck = load_deck_from_csv(filepath)
+            except DECK_FILE_ERRORS as error:
+                if not recover_deck_file(filepath):
+                    raise ValueError(f"Could not load {filepath}, and no intact copy was found to recover it from: "
+                                     f"{error}") from error
+                deck = load_deck_from_csv(filepath)
             deck.is_modified = False
             decks.append(deck)
     return decks
 
 
+def parse_cards_from_text(text: str, delimiter: str = '\t') -> (list, list):
+    """
+    Parse pasted text into cards, one card per line as front, back and optionally space-separated tags. Single
+    character delimiters are read with the csv module, so quoted fields may contain the delimiter, as in TSV and CSV
+    files exported from spreadsheets. Longer delimiters simply split each line.
+    :param text: The text to parse
+    :param delimiter: The string between the columns of a line
+    :return: The parsed cards, and a message for each line that couldn't be parsed
+    """
+    if len(delimiter) == 1:
+        rows = csv.reader(io.StringIO(text, newline=''), delimiter=delimiter)
+    else:
+        rows = (line.split(delimiter) for line in text.splitlines())
+
+    cards = []
+    errors = []
+    for line_number, row in enumerate(rows, start=1):
+        if not any(column.strip() for column in row):
+            continue
+        question = row[0].strip()
+        if not question:
+            errors.append(f"Line {line_number}: the front is blank")
+            continue
+        answer = row[1].strip() if len(row) > 1 else ''
+        tags = row[2].split() if len(row) > 2 else []
+        cards.append(Flashcard(question, answer, tags=tags))
+    return cards, errors
+
+
 # TODO: Consider making this more generic so it could be used with other APIs
+@tracing.span(category="io")
 def download_deck_from_url(url: str, deck_name: str, directory: str) -> None:
     """
     Download a deck from a URL and save it to a directory. Note that this was written for a specific API, located at https://jlpt-vocab-api.vercel.app and may need
@@ -155,28 +826,66 @@ def download_deck_from_url(url: str, deck_name: str, directory: str) -> None:
         deck = Deck(deck_name, cards)
         save_deck_to_csv(deck, directory)
     else:
-        print(f"Failed to download deck from {url}")
+        tracing.event("deck.download_failed", f"Failed to download deck from {url}", "io", url=url,
+                      status=response.status_code)
 
 
-def setup_shortcuts(widget: QWidget, shortcuts: dict) -> None:
+def setup_shortcuts(widget: "QWidget", shortcuts: dict) -> None:
     """
     Set up keyboard shortcuts for a widget
     :param widget: The widget to set up the shortcuts for
     :param shortcuts: A dictionary of shortcuts, where the key is the shortcut as a string and the value is the method to call
     :return: None
     """
+    # Imported here so that the storage functions in this module can be used without PySide6, e.g. by the CLI
+    from PySide6.QtGui import QShortcut, QKeySequence
+
     for key_sequence, action in shortcuts.items():
         shortcut = QShortcut(QKeySequence(key_sequence), widget)
         shortcut.activated.connect(action)
 
 
+def make_single_shot_timer(parent: "QObject", interval: int, slot: Callable) -> "QTimer":
+    """
+    Create a timer that calls a slot once after it's started, e.g. to wait for typing or file changes to settle, where
+    starting it again before it fires pushes the call back. The properties are passed to the constructor, as with the
+    snake_case feature QTimer.single_shot is the static method that starts a one-off timer rather than the singleShot
+    property, so assigning to it leaves the timer repeating.
+    :param parent: The object the timer belongs to
+    :param interval: The number of milliseconds to wait, can be overridden by passing a number to start
+    :param slot: The slot to call when the timer fires
+    :return: The timer, which isn't started yet
+    """
+    from PySide6.QtCore import QTimer
+
+    timer = QTimer(parent, singleShot=True, interval=interval)
+    timer.timeout.connect(slot)
+    return timer
+
+
 # CONFIGURATION
 default_config = configparser.ConfigParser()
 default_config['DEFAULT'] = {
     'decks_directory': 'decks',
     'daily_reviews_limit': 100,
     'new_card_limit': 20,
-    'theme': 'blue_dark'
+    'theme': 'blue_dark',
+    'autosave_interval': 2000,
+    'review_history_file': 'review_history.sqlite3',
+    'fsrs_weights': '',
+    'desired_retention': 0.9,
+    'daily_counters_file': 'daily_counters.json',
+    'day_start_hour': 4,
+    'leech_threshold': 8,
+    'suspend_leeches': True,
+    'deck_file_format': 'csv',
+    'sync_server_url': '',
+    'sync_state_file': 'sync_state.json',
+    'undo_limit': 100,
+    'trace_file': '',
+    'freeze_monitor': False,
+    'freeze_threshold': 250,
+    'freeze_log_file': 'freezes.log'
 }
 
 
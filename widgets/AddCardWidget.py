@@ -7,6 +7,7 @@ from __feature__ import snake_case, true_property
 
 import utils
 from models.Flashcard import Flashcard
+from models.DuplicateIndex import DuplicateIndex
 from theme import default_text_font
 
 
@@ -19,16 +20,19 @@ class AddCardWidget(QWidget):
 
     signals = AddCardWidgetSignals()
 
-    def __init__(self, app_decks):
+    def __init__(self, app_decks, duplicate_index: DuplicateIndex = None):
         """
         Initialize the AddCardWidget with a list of decks.
         :param app_decks: The list of decks to choose from, to add the card to
+        :param duplicate_index: The index used to warn about cards with the same front, if any
         """
         super().__init__()
         self.layout = QVBoxLayout()
         self.window_title = "Add Card"
 
         self.decks = app_decks
+        self.deck_lookup = {deck.name: deck for deck in self.decks}
+        self.duplicate_index = duplicate_index
         self.deck_label = QLabel("Deck:")
         self.deck_label.font = default_text_font
         self.layout.add_widget(self.deck_label)
@@ -43,8 +47,16 @@ class AddCardWidget(QWidget):
         self.question_input = QLineEdit()
         self.question_input.font = default_text_font
         self.question_input.returnPressed.connect(self.add_card)
+        self.question_input.textChanged.connect(self.check_duplicates)
         self.layout.add_widget(self.question_input)
 
+        # Warns about cards that already have the same front, checked as the front is typed
+        self.duplicate_label = QLabel()
+        self.duplicate_label.font = default_text_font
+        self.duplicate_label.word_wrap = True
+        self.duplicate_label.hide()
+        self.layout.add_widget(self.duplicate_label)
+
         self.answer_label = QLabel("Back:")
         self.answer_label.font = default_text_font
         self.layout.add_widget(self.answer_label)
@@ -72,6 +84,17 @@ class AddCardWidget(QWidget):
         self.resize(400, 300)
         self.show()
 
+    @Slot(str)
+    def check_duplicates(self, question: str):
+        """This method shows which decks already have a card with the same front as the one being typed"""
+        duplicates = self.duplicate_index.find(question) if self.duplicate_index and question.strip() else []
+        if duplicates:
+            deck_names = ", ".join(sorted({deck_name for deck_name, card in duplicates}))
+            self.duplicate_label.text = f"A card with this front already exists in: {deck_names}"
+            self.duplicate_label.show()
+        else:
+            self.duplicate_label.hide()
+
     @Slot()
     def add_card(self):
         """This method adds a new card to the selected deck"""
@@ -90,10 +113,12 @@ class AddCardWidget(QWidget):
         answer = self.answer_input.plain_text
         tags = self.tags_input.text.split(' ')
 
-        for deck in self.decks:
-            if deck.name == deck_name:
-                deck.append_card(Flashcard(question, answer, tags=tags))
-                break
+        deck = self.deck_lookup.get(deck_name)
+        if deck is not None:
+            card = Flashcard(question, answer, tags=tags)
+            deck.append_card(card)
+            if self.duplicate_index:
+                self.duplicate_index.add(card, deck.name)
 
         self.signals.card_added.emit()
         self.close()
@@ -0,0 +1,77 @@
+from PySide6.QtGui import QPainter, QPalette, QColor
+from PySide6.QtWidgets import QWidget
+from PySide6.QtCore import Qt, QRectF
+
+# noinspection PyUnresolvedReferences
+from __feature__ import snake_case, true_property
+
+from theme import filter_list_item_font
+
+
+class BarChartWidget(QWidget):
+    """ This widget paints a simple bar chart, used by the StatisticsWidget and the ForecastWidget. """
+
+    def __init__(self, title: str):
+        """
+        Initialize the BarChartWidget with a title and no data.
+        :param title: The title shown above the chart
+        """
+        super().__init__()
+        self.title = title
+        self.values = []
+        self.upper_values = []
+        self.labels = []
+        self.font = filter_list_item_font
+        self.minimum_height = 180
+
+    def set_data(self, values: list, labels: list[str], upper_values: list = None) -> None:
+        """
+        Replace the values shown in the chart.
+        :param values: The height of each bar
+        :param labels: The label of each bar, only some of which are drawn if there are many bars
+        :param upper_values: The upper end of a band around each value, drawn as a fainter bar behind it
+        :return: None
+        """
+        self.values = [float(value) for value in values]
+        self.upper_values = [float(value) for value in upper_values] if upper_values is not None else []
+        self.labels = labels
+        self.update()
+
+    def paint_event(self, event) -> None:
+        """
+        Paint the title, the bars, and the labels of the bars.
+        :param event: The paint event
+        :return: None
+        """
+        painter = QPainter(self)
+        palette = self.palette
+        text_color = palette.color(QPalette.ColorRole.WindowText)
+        bar_color = palette.color(QPalette.ColorRole.Highlight)
+        band_color = QColor(bar_color)
+        band_color.set_alpha(90)
+        line_height = painter.font_metrics().height()
+
+        painter.set_pen(text_color)
+        maximum = max(self.values + self.upper_values, default=0)
+        painter.draw_text(QRectF(0, 0, self.width, line_height), Qt.AlignLeft,
+                          f"{self.title} (max {maximum:g})" if self.values else f"{self.title} (no data)")
+        if not self.values:
+            return
+
+        chart_top = line_height + 4
+        chart_height = self.height - chart_top - line_height - 4
+        bar_width = self.width / len(self.values)
+        # Only label every n-th bar, so labels don't overlap
+        label_every = max(1, int(painter.font_metrics().horizontal_advance("00-00 ") // max(bar_width, 1)) + 1)
+
+        for index, value in enumerate(self.upper_values):
+            band_height = chart_height * value / maximum if maximum else 0
+            painter.fill_rect(QRectF(index * bar_width + 1, chart_top + chart_height - band_height,
+                                     max(bar_width - 2, 1), band_height), band_color)
+        for index, value in enumerate(self.values):
+            bar_height = chart_height * value / maximum if maximum else 0
+            painter.fill_rect(QRectF(index * bar_width + 1, chart_top + chart_height - bar_height,
+                                     max(bar_width - 2, 1), bar_height), bar_color)
+            if index % label_every == 0 and index < len(self.labels):
+                painter.draw_text(QRectF(index * bar_width, chart_top + chart_height + 2, bar_width * label_every,
+                                         line_height), Qt.AlignLeft, self.labels[index])
@@ -0,0 +1,214 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from PySide6.QtWidgets import QLabel, QWidget, QPushButton, QVBoxLayout, QHBoxLayout, QLineEdit, QComboBox, \
+    QPlainTextEdit, QTreeWidget, QTreeWidgetItem
+from PySide6.QtCore import Slot, QObject, Signal
+
+# noinspection PyUnresolvedReferences
+from __feature__ import snake_case, true_property
+
+import utils
+from models.Deck import Deck
+from models.DuplicateIndex import DuplicateIndex
+from theme import default_text_font, card_list_item_font
+
+
+class BulkAddWidgetSignals(QObject):
+    # The number of cards that were added
+    cards_added = Signal(int)
+    # Emitted from the worker thread to hand parsed text back to the GUI thread
+    text_parsed = Signal(int, object)
+
+
+class BulkAddWidget(QWidget):
+    """
+    This widget adds many cards at once from pasted text, such as a vocabulary list copied from a spreadsheet. The text
+    is parsed on a worker thread shortly after it stops changing, a preview of the parsed cards is shown, and the cards
+    are added to the deck in a single batch.
+    """
+
+    DELIMITERS = {"Tab": "\t", "Comma": ",", "Semicolon": ";", "Pipe": "|", "Custom": None}
+    # The number of parsed cards shown in the preview, as showing tens of thousands of rows would be slow
+    PREVIEW_ROWS = 200
+
+    def __init__(self, app_decks: list[Deck], duplicate_index: DuplicateIndex = None, delay: int = 200):
+        """
+        Initialize the BulkAddWidget with a list of decks.
+        :param app_decks: The list of decks to choose from, to add the cards to
+        :param duplicate_index: The index used to count cards that already exist, and to add the new cards to, if any
+        :param delay: The number of milliseconds to wait after a change before parsing the text again
+        """
+        super().__init__()
+        self.signals = BulkAddWidgetSignals()
+        self.window_title = "Bulk Add Cards"
+        self.decks = app_decks
+        self.deck_lookup = {deck.name: deck for deck in self.decks}
+        self.duplicate_index = duplicate_index
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.parsed_cards = []
+        # Parses are numbered, so a parse finishing after the text changed again is ignored
+        self.parse_number = 0
+        self.layout = QVBoxLayout()
+
+        options_layout = QHBoxLayout()
+        self.deck_label = QLabel("Deck:")
+        self.deck_label.font = default_text_font
+        options_layout.add_widget(self.deck_label)
+        self.deck_dropdown = QComboBox()
+        self.deck_dropdown.font = default_text_font
+        self.deck_dropdown.add_items([deck.name for deck in self.decks])
+        options_layout.add_widget(self.deck_dropdown)
+
+        self.delimiter_label = QLabel("Delimiter:")
+        self.delimiter_label.font = default_text_font
+        options_layout.add_widget(self.delimiter_label)
+        self.delimiter_dropdown = QComboBox()
+        self.delimiter_dropdown.font = default_text_font
+        self.delimiter_dropdown.add_items(list(self.DELIMITERS))
+        self.delimiter_dropdown.currentIndexChanged.connect(self.handle_delimiter_change)
+        options_layout.add_widget(self.delimiter_dropdown)
+        self.custom_delimiter_input = QLineEdit()
+        self.custom_delimiter_input.font = default_text_font
+        self.custom_delimiter_input.placeholder_text = "e.g. ::"
+        self.custom_delimiter_input.textChanged.connect(self.handle_text_change)
+        self.custom_delimiter_input.hide()
+        options_layout.add_widget(self.custom_delimiter_input)
+        self.layout.add_layout(options_layout)
+
+        self.text_label = QLabel("One card per line, as front, back and optionally tags (seperate tags by spaces):")
+        self.text_label.font = default_text_font
+        self.layout.add_widget(self.text_label)
+        self.text_input = QPlainTextEdit()
+        self.text_input.font = default_text_font
+        self.text_input.textChanged.connect(self.handle_text_change)
+        self.layout.add_widget(self.text_input)
+
+        self.tags_label = QLabel("Tags added to every card (seperate by spaces):")
+        self.tags_label.font = default_text_font
+        self.layout.add_widget(self.tags_label)
+        self.tags_input = QLineEdit()
+        self.tags_input.font = default_text_font
+        self.layout.add_widget(self.tags_input)
+
+        self.preview_tree = QTreeWidget()
+        self.preview_tree.font = card_list_item_font
+        self.preview_tree.set_header_labels(["Front", "Back", "Tags"])
+        self.preview_tree.set_column_width(0, 160)
+        self.preview_tree.set_column_width(1, 240)
+        self.layout.add_widget(self.preview_tree)
+
+        self.summary_label = QLabel()
+        self.summary_label.font = default_text_font
+        self.summary_label.word_wrap = True
+        self.layout.add_widget(self.summary_label)
+
+        self.add_cards_button = QPushButton("Add Cards")
+        self.add_cards_button.enabled = False
+        self.add_cards_button.clicked.connect(self.add_cards)
+        self.layout.add_widget(self.add_cards_button)
+
+        self.timer = utils.make_single_shot_timer(self, delay, self.parse_text)
+        self.signals.text_parsed.connect(self.show_preview)
+
+        utils.setup_shortcuts(self, shortcuts={
+            "Esc": self.close
+        })
+        self.set_layout(self.layout)
+        self.resize(700, 600)
+        self.show()
+
+    def get_delimiter(self) -> str:
+        """
+        Get the delimiter selected in the dropdown, or typed in if it's a custom delimiter.
+        :return: The delimiter, which may be empty if no custom delimiter was typed yet
+        """
+        delimiter = self.DELIMITERS[self.delimiter_dropdown.current_text]
+        return self.custom_delimiter_input.text if delimiter is None else delimiter
+
+    @Slot()
+    def handle_text_change(self):
+        """ This method discards the cards parsed from the old text or delimiter, and parses the text again shortly """
+        # Parses still running are for the old text, and the button stays disabled until the new text is parsed
+        self.parse_number += 1
+        self.parsed_cards = []
+        self.add_cards_button.enabled = False
+        self.timer.start()
+
+    @Slot()
+    def handle_delimiter_change(self):
+        """ This method shows the custom delimiter input if needed, and parses the text again with the new delimiter """
+        self.custom_delimiter_input.visible = self.DELIMITERS[self.delimiter_dropdown.current_text] is None
+        self.handle_text_change()
+
+    @Slot()
+    def parse_text(self):
+        """ This method starts parsing the text on the worker thread """
+        self.parse_number += 1
+        parse_number = self.parse_number
+        delimiter = self.get_delimiter()
+        if not delimiter:
+            self.summary_label.text = "Type a delimiter"
+            return
+        self.summary_label.text = "Reading cards..."
+        future = self.executor.submit(utils.parse_cards_from_text, self.text_input.plain_text, delimiter)
+        future.add_done_callback(lambda finished: self.signals.text_parsed.emit(parse_number, finished))
+
+    @Slot(int, object)
+    def show_preview(self, parse_number: int, future: Future):
+        """ This method shows the first parsed cards and a summary, unless the text changed again since """
+        if parse_number != self.parse_number:
+            return
+        if future.exception() is not None:
+            self.summary_label.text = f"Could not read the cards: {future.exception()}"
+            return
+        self.parsed_cards, errors = future.result()
+
+        self.preview_tree.clear()
+        items = []
+        for card in self.parsed_cards[:self.PREVIEW_ROWS]:
+            item = QTreeWidgetItem()
+            item.set_text(0, card.question)
+            item.set_text(1, card.answer)
+            item.set_text(2, " ".join(card.tags))
+            items.append(item)
+        self.preview_tree.add_top_level_items(items)
+
+        summary = f"{len(self.parsed_cards)} cards"
+        if len(self.parsed_cards) > self.PREVIEW_ROWS:
+            summary += f" (showing the first {self.PREVIEW_ROWS})"
+        if self.duplicate_index:
+            existing_count = sum(1 for card in self.parsed_cards if self.duplicate_index.find(card.question))
+            if existing_count:
+                summary += f", {existing_count} with a front that already exists"
+        if errors:
+            summary += f". {len(errors)} lines were skipped: " + "; ".join(errors[:5])
+        self.summary_label.text = summary
+        self.add_cards_button.text = f"Add {len(self.parsed_cards)} Cards"
+        self.add_cards_button.enabled = bool(self.parsed_cards)
+
+    @Slot()
+    def add_cards(self):
+        """ This method adds the parsed cards to the selected deck in a single batch """
+        deck = self.deck_lookup.get(self.deck_dropdown.current_text)
+        if deck is None or not self.parsed_cards:
+            return
+        common_tags = self.tags_input.text.split()
+        if common_tags:
+            for card in self.parsed_cards:
+                card.tags = card.tags + [tag for tag in common_tags if tag not in card.tags]
+
+        deck.append_cards(self.parsed_cards)
+        if self.duplicate_index:
+            self.duplicate_index.add_cards(self.parsed_cards, deck.name)
+        self.signals.cards_added.emit(len(self.parsed_cards))
+        self.close()
+
+    def close_event(self, event) -> None:
+        """
+        Stop the worker thread when the widget is closed.
+        :param event: The close event
+        :return: None
+        """
+        self.timer.stop()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        super().close_event(event)
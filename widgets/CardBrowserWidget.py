@@ -1,13 +1,19 @@
 from PySide6.QtWidgets import QWidget, QHBoxLayout, QListWidget, QListWidgetItem, \
     QTreeWidget, QTreeWidgetItem, QSplitter
-from PySide6.QtCore import Qt, Slot, Signal, QObject, QEvent
+from PySide6.QtCore import Qt, Slot, Signal, QObject, QEvent, QModelIndex
+from PySide6.QtGui import QBrush
 
 # noinspection PyUnresolvedReference
 from __feature__ import snake_case, true_property
 
 import utils
+import tracing
 from models.Deck import Deck
 from models.Flashcard import Flashcard
+from models.LeechIndex import LeechIndex
+from models.DuplicateIndex import DuplicateIndex
+from models.UndoStack import UndoStack, CardChangeCommand, RemoveCardCommand, RemoveDeckCommand, CompoundCommand, \
+    state_value
 from widgets.CardEditWidget import CardEditWidget
 from theme import filter_list_item_font, card_list_item_font
 
@@ -21,12 +27,28 @@ class CardBrowserWidget(QWidget):
     """ This class defines the CardBrowserWidget, which will allow the user to browse the cards in the application. """
     signals = CardBrowserSignals()
 
-    def __init__(self, app_decks: list[Deck]):
+    LEECHES_FILTER = "-- Leeches --"
+    DUPLICATES_FILTER = "-- Duplicates --"
+
+    def __init__(self, app_decks: list[Deck], leech_index: LeechIndex = None, duplicate_index: DuplicateIndex = None,
+                 undo_stack: UndoStack = None):
         """
         Initializes the CardBrowserWidget with the given list of decks.
         :param app_decks: The list of decks to display cards from
+        :param leech_index: The index of leeches the leeches filter shows, if any
+        :param duplicate_index: The index of cards by front the duplicates filter shows, if any
+        :param undo_stack: The undo stack edits and deletions are recorded on, whose observers keep the app's indexes up
+            to date. A new one that updates the given indexes by default
         """
         super().__init__()
+        self.leech_index = leech_index
+        self.duplicate_index = duplicate_index
+        if undo_stack is None:
+            undo_stack = UndoStack()
+            undo_stack.observers.extend(index.record_change for index in (leech_index, duplicate_index) if index)
+        self.undo_stack = undo_stack
+        # The tag index is updated one card at a time as changes are made and undone, while the browser is open
+        self.undo_stack.observers.append(self.record_change)
 
         self.window_title = "Browse Cards"
         self.layout_container = QHBoxLayout()
@@ -37,14 +59,18 @@ class CardBrowserWidget(QWidget):
         # Starts with all decks
         self.all_cards = [card for deck in app_decks for card in deck.cards]
         self.current_card_list = self.all_cards
+        self.current_filter = "-- All Decks --"
 
         self.deck_lookup = {deck.name: deck for deck in self.all_decks}
         self.build_tag_index()
-        self.tag_list = self.generate_tag_list(app_decks)
+        self.tag_list = sorted(self.tag_to_cards)
         self.filter_cache = {}
         for tag in self.tag_list:
             self.filter_cache[tag] = self.filter_cards_by_tag(tag)
         self.focused_widget = None
+        # The cards shown in the card list mapped by identity to their row numbers, so a changed card's row is updated in
+        # place. Rows of deleted cards are hidden rather than removed, so the numbers stay valid until the list is rebuilt
+        self.card_rows = {}
 
         # Note: when filtering, you should update the current_deck_list to some subset of app_decks, so they stay in sync
         self.filter_list_widget = QListWidget()
@@ -74,7 +100,10 @@ class CardBrowserWidget(QWidget):
 
         utils.setup_shortcuts(self, shortcuts={
             "Esc": self.close,
-            "Del": self.handle_delete_shortcut
+            "Del": self.handle_delete_shortcut,
+            "Ctrl+J": self.toggle_suspended,
+            "Ctrl+Z": self.undo,
+            "Ctrl+Shift+Z": self.redo
         })
 
         # Handle closeEvents
@@ -83,18 +112,6 @@ class CardBrowserWidget(QWidget):
         self.resize(840, 400)
         self.show()
 
-    def generate_tag_list(self, app_decks: list[Deck]) -> list[str]:
-        """
-        Generates a list of all tags in the decks
-        :param app_decks: The list of decks to generate tags from
-        :return: A sorted list of tags
-        """
-        tags = set()
-        for deck in app_decks:
-            for card in deck.cards:
-                tags.update(card.tags)
-        return sorted(list(tags))
-
     def select_filter(self, item: QListWidgetItem):
         """
         Filters the card list based on the selected item. If the item is a deck name, only cards from that deck will be shown.
@@ -102,10 +119,29 @@ class CardBrowserWidget(QWidget):
         :param item: The item that was double-clicked in the QListWidget
         :return: None
         """
-        item_text = item.text()
+        self.apply_filter(item.text())
 
+    @tracing.span(category="ui")
+    def apply_filter(self, item_text: str):
+        """
+        Filters the card list by a deck name, a tag or one of the special filters, and remembers the filter so it can be
+        applied again after the cards change.
+        :param item_text: The text of the filter
+        :return: None
+        """
+        self.current_filter = item_text
         if item_text in ("-- All Decks --", "-- All Tags --"):
             self.current_card_list = self.all_cards
+        elif item_text == self.LEECHES_FILTER:
+            # The leeches come from the index, which is kept up to date after every review, and are never cached
+            self.current_card_list = self.leech_index.get_leeches() if self.leech_index else []
+            self.update_card_list(self.current_card_list)
+            return
+        elif item_text == self.DUPLICATES_FILTER:
+            # Cards with the same front are listed next to each other
+            self.current_card_list = self.duplicate_index.get_duplicates() if self.duplicate_index else []
+            self.update_card_list(self.current_card_list)
+            return
         else:
             # Check if the item is a deck name or a tag
             if item_text in self.deck_lookup:
@@ -132,6 +168,8 @@ class CardBrowserWidget(QWidget):
             if self.card_edit_widget:
                 self.card_edit_widget.close()
                 self.card_edit_widget.delete_later()
+            if self.record_change in self.undo_stack.observers:
+                self.undo_stack.observers.remove(self.record_change)
             self.signals.closed.emit()
             super().close()
         return False
@@ -151,50 +189,157 @@ class CardBrowserWidget(QWidget):
         self.card_edit_widget.signals.card_edited.connect(self.handle_card_update)
         self.splitter.add_widget(self.card_edit_widget)
 
-    @Slot(Flashcard)
-    def handle_card_update(self, updated_card, old_card):
+    @Slot(Flashcard, dict)
+    def handle_card_update(self, card: Flashcard, changes: dict):
         """
-        Updates the card in the deck and refreshes the card list.
-        :param updated_card: The updated card
+        Applies the changes made in the card editor in a way that can be undone, and refreshes the card list.
+        :param card: The edited card
+        :param changes: The edited fields mapped to (old value, new value)
         :return: None
         """
-        # The card will automatically be updated in the deck, as the card is passed by reference,
-        # but we need to make sure the deck it belongs to is marked as modified
-        affected_filters = set(updated_card.tags)
-        affected_filters.update(old_card.tags)
-        for deck in self.all_decks:
-            if updated_card in deck.cards:
-                deck.is_modified = True
-                break
+        deck = self.find_deck(card)
+        if deck is not None:
+            self.undo_stack.push(CardChangeCommand(deck, card, changes))
+            self.refresh_changed_cards()
 
-        # Update cache accordingly
-        self.update_filter_cache(affected_filters)
-
-        if updated_card.tags != old_card.tags:
-            self.build_tag_index()
+    def record_change(self, card: Flashcard, deck: Deck, before: dict, after: dict):
+        """
+        Updates the row of a card that changed, and moves it between the tags of the tag-to-card index after a change
+        was made or undone, e.g. here or in a review. The signature matches the observers of the UndoStack.
+        :param card: The card that changed
+        :param deck: The deck of the card
+        :param before: The changed fields' values before the change, or None if the card was added
+        :param after: The changed fields' values after the change, or None if the card was removed
+        :return: None
+        """
+        if before is not None and after is not None:
+            row = self.card_rows.get(id(card))
+            if row is not None:
+                self.update_card_item(self.card_tree_widget.top_level_item(row), card)
+            if "tags" not in after:
+                return
+        old_tags = state_value(card, before, "tags") if before is not None else []
+        new_tags = state_value(card, after, "tags") if after is not None else []
+        for tag in old_tags:
+            cards = self.tag_to_cards.get(tag)
+            if cards is not None:
+                cards.discard(card)
+                if not cards:
+                    del self.tag_to_cards[tag]
+        for tag in new_tags:
+            self.tag_to_cards.setdefault(tag, set()).add(card)
+        self.update_filter_cache(set(old_tags) | set(new_tags))
+
+    def find_deck(self, card: Flashcard) -> Deck:
+        """
+        Finds the deck a card belongs to.
+        :param card: The card
+        :return: The deck, or None if the card isn't in any deck
+        """
+        for deck in self.all_decks:
+            if card in deck.cards:
+                return deck
+        return None
 
-        # Handle if a new tag was added
-        new_tag_exists = False
-        for tag in updated_card.tags:
-            if tag not in self.tag_list:
-                new_tag_exists = True
-                self.tag_list.append(tag)
+    @tracing.span(category="ui")
+    def refresh(self):
+        """
+        Shows the decks, tags and cards again after a change was made, undone or redone, with the same filter applied.
+        :return: None
+        """
+        self.all_cards = [card for deck in self.all_decks for card in deck.cards]
+        self.deck_lookup = {deck.name: deck for deck in self.all_decks}
+        self.update_filter_list(self.all_decks)
+        self.apply_filter(self.current_filter)
 
-        if new_tag_exists:
+    @tracing.span(category="ui")
+    def refresh_changed_cards(self):
+        """
+        Shows the tags and cards again after the fields of some cards were changed, undone or redone. The rows of the
+        cards were already updated by record_change, so the card list is only filtered again when the filter depends on
+        the fields, i.e. for a tag, the leeches or the duplicates.
+        :return: None
+        """
+        if sorted(self.tag_to_cards) != self.tag_list:
             self.update_filter_list(self.all_decks)
+        if self.current_filter not in self.deck_lookup and self.current_filter not in ("-- All Decks --",
+                                                                                        "-- All Tags --"):
+            self.apply_filter(self.current_filter)
+
+    @tracing.span(category="ui")
+    def refresh_removed_cards(self, cards: list[Flashcard], is_removed: bool):
+        """
+        Shows the decks, tags and cards again after cards were deleted, or their deletion was undone or redone. The rows
+        of the cards are hidden or shown again rather than showing every card again, unless the filter depends on the
+        other cards, or a card that's back doesn't have a row, e.g. as another filter was applied since it was deleted.
+        :param cards: The cards that were deleted or put back
+        :param is_removed: True if the cards were deleted, False if they were put back
+        :return: None
+        """
+        self.all_cards = [card for deck in self.all_decks for card in deck.cards]
+        self.deck_lookup = {deck.name: deck for deck in self.all_decks}
+        self.update_filter_list(self.all_decks)
+        rows = [self.card_rows.get(id(card)) for card in cards]
+        if self.current_filter in (self.LEECHES_FILTER, self.DUPLICATES_FILTER) or (not is_removed and None in rows):
+            self.apply_filter(self.current_filter)
+            return
+        if self.current_filter in ("-- All Decks --", "-- All Tags --"):
+            self.current_card_list = self.all_cards
+        # Rows are hidden by number, as hiding an item has to search the list for its row
+        for row in rows:
+            if row is not None:
+                self.card_tree_widget.set_row_hidden(row, QModelIndex(), is_removed)
+        current_index = self.card_tree_widget.current_index()
+        if current_index.is_valid() and self.card_tree_widget.is_row_hidden(current_index.row(), QModelIndex()):
+            self.card_tree_widget.set_current_item(None)
+
+    def refresh_after(self, command, is_undone: bool):
+        """
+        Refreshes the card list after a command was undone or redone, only updating the rows of the cards it changed,
+        added or removed when possible.
+        :param command: The command that was undone or redone
+        :param is_undone: True if the command was undone, False if it was redone
+        :return: None
+        """
+        commands = command.commands if isinstance(command, CompoundCommand) else [command]
+        if all(isinstance(card_command, CardChangeCommand) for card_command in commands):
+            self.refresh_changed_cards()
+        elif isinstance(command, RemoveCardCommand):
+            self.refresh_removed_cards([command.card], not is_undone)
+        elif isinstance(command, RemoveDeckCommand):
+            self.refresh_removed_cards(command.deck.cards, not is_undone)
+        else:
+            self.refresh()
 
-        self.update_card_list(self.current_card_list)
+    def undo(self):
+        """
+        Undoes the most recent change, here or in a review, and refreshes the card list.
+        :return: None
+        """
+        command = self.undo_stack.undo()
+        if command is not None:
+            self.refresh_after(command, True)
+
+    def redo(self):
+        """
+        Redoes the most recently undone change, and refreshes the card list.
+        :return: None
+        """
+        command = self.undo_stack.redo()
+        if command is not None:
+            self.refresh_after(command, False)
 
     def update_filter_cache(self, affected_filters):
         """
-        Updates the filter cache with the given set of affected filters.
+        Drops the cached cards of the given set of affected filters, which are filtered again when they're applied.
         :param affected_filters: The set of filters that have been affected
         :return: None
         """
+        # Filtering them again here would go through every card of a tag for each card of a deleted deck
         for filter in affected_filters:
-            if filter in self.filter_cache:
-                self.filter_cache[filter] = self.filter_cards_by_tag(filter)
+            self.filter_cache.pop(filter, None)
 
+    @tracing.span(category="ui")
     def update_card_list(self, current_card_list):
         """
         Updates the card list widget with the cards from the current deck list, and sets the selected index to the last card selected.
@@ -207,29 +352,50 @@ class CardBrowserWidget(QWidget):
             selected_card = self.card_tree_widget.current_item().data(0, Qt.UserRole)
 
         self.card_tree_widget.clear()
+        self.card_rows = {}
 
-        for card in current_card_list:
+        card_items = []
+        for row, card in enumerate(current_card_list):
             card_item = QTreeWidgetItem()
             card_item.set_text(0, card.question)
             card_item.set_text(1, card.answer)
             card_item.set_text(2, ", ".join(card.tags))
             card_item.set_data(0, Qt.UserRole, card)
-            self.card_tree_widget.add_top_level_item(card_item)
+            if card.suspended:
+                for column in range(3):
+                    card_item.set_foreground(column, QBrush(Qt.gray))
+            self.card_rows[id(card)] = row
+            card_items.append(card_item)
+        # The rows are added in one go, which is much faster than adding them one at a time
+        self.card_tree_widget.add_top_level_items(card_items)
 
         # Select the last selected card
         if selected_card:
-
-            for i in range(self.card_tree_widget.top_level_item_count):
-                item = self.card_tree_widget.top_level_item(i)
-                if item.data(0, Qt.UserRole).id == selected_card.id:
-                    self.card_tree_widget.set_current_item(item)
-                    break
+            row = self.card_rows.get(id(selected_card))
+            if row is not None:
+                self.card_tree_widget.set_current_item(self.card_tree_widget.top_level_item(row))
         else:
             # Select the first card
             self.card_tree_widget.set_current_item(self.card_tree_widget.top_level_item(0))
         # NOTE: This could pose a problem when we allow deleting cards, as the index could be out of bounds
         # This could also be a problem when filtering
 
+    def update_card_item(self, card_item: QTreeWidgetItem, card: Flashcard):
+        """
+        Shows the current fields of a card in its row of the card list.
+        :param card_item: The row of the card
+        :param card: The card
+        :return: None
+        """
+        card_item.set_text(0, card.question)
+        card_item.set_text(1, card.answer)
+        card_item.set_text(2, ", ".join(card.tags))
+        for column in range(3):
+            if card.suspended:
+                card_item.set_foreground(column, QBrush(Qt.gray))
+            else:
+                card_item.set_data(column, Qt.ForegroundRole, None)
+
     def build_tag_index(self):
         """
         Builds a reverse index from tags to cards.
@@ -275,28 +441,34 @@ class CardBrowserWidget(QWidget):
 
     def delete_card(self):
         """
-        Deletes the selected card from the deck and refreshes the card list.
+        Deletes the selected card from the deck in a way that can be undone, and refreshes the card list.
         :return: None
         """
         selected_item = self.card_tree_widget.current_item()
         if selected_item:
             selected_card = selected_item.data(0, Qt.UserRole)
-            for deck in self.all_decks:
-                if selected_card in deck.cards:
-                    deck.cards.remove(selected_card)
-                    deck.is_modified = True
+            deck = self.find_deck(selected_card)
+            if deck is not None:
+                # The indexes are updated by the undo stack's observers, and the filter list is rebuilt in case the card
+                # deleted was the only one with a certain tag
+                self.undo_stack.push(RemoveCardCommand(deck, selected_card))
+                self.refresh_removed_cards([selected_card], True)
 
-                    # Cards seemingly have to be removed from the all_cards list as well as the current_card_list
-                    self.all_cards.remove(selected_card)
-                    if selected_card in self.current_card_list:
-                        self.current_card_list.remove(selected_card)
-
-            self.update_card_list(self.current_card_list)
-            # Update the filter list just in case the card deleted was the only one with a certain tag
-            self.update_filter_list(self.all_decks)
-            # Update the filter cache and tag-to-card index to remove the card from any tag filters
-            self.update_filter_cache(selected_card.tags)
-            self.build_tag_index()
+    def toggle_suspended(self):
+        """
+        Suspends the selected card, so it's left out of reviews, or unsuspends it if it's suspended, and refreshes the
+        card list.
+        :return: None
+        """
+        selected_item = self.card_tree_widget.current_item()
+        if selected_item:
+            selected_card = selected_item.data(0, Qt.UserRole)
+            deck = self.find_deck(selected_card)
+            if deck is not None:
+                suspended = not selected_card.suspended
+                self.undo_stack.push(CardChangeCommand(deck, selected_card, {"suspended": (not suspended, suspended)},
+                                                       "Suspend card" if suspended else "Unsuspend card"))
+                self.refresh_changed_cards()
 
     def delete_filter(self):
         """
@@ -315,48 +487,28 @@ class CardBrowserWidget(QWidget):
 
     def delete_deck(self, selected_filter, selected_item):
         """
-        Deletes the selected deck from the deck list and refreshes the card list.
+        Deletes the selected deck from the deck list in a way that can be undone, and refreshes the card list.
         :param selected_filter: The deck name to delete, taken from the filter list
         :param selected_item: The QListWidgetItem to delete, whose text should match the selected_filter
         :return: None
         """
-        # Remove the deck from the filter list
-        self.filter_list_widget.remove_item_widget(selected_item)
-
-        # Remove the deck from the all_decks list, the deck_lookup, and update the current_card_list
         deck = self.deck_lookup[selected_filter]
-        self.all_cards = [card for card in self.all_cards if card not in deck.cards]
-        self.current_card_list = [card for card in self.current_card_list if card not in deck.cards]
-        self.all_decks.remove(deck)
-        self.deck_lookup.pop(selected_filter)
-
-        # Update the card list, filter cache and tag-to-card index to remove the cards from any tag filters
-        self.update_card_list(self.current_card_list)
-        self.update_filter_list(self.all_decks)
-        self.build_tag_index()
+        self.undo_stack.push(RemoveDeckCommand(self.all_decks, deck))
+        self.refresh_removed_cards(deck.cards, True)
 
     def delete_tag(self, selected_filter, selected_item):
         """
-        Deletes the selected tag from the tag list and refreshes the card list.
+        Deletes the selected tag from every card in a way that can be undone, and refreshes the card list.
         :param selected_filter: The tag to delete, taken from the filter list
         :param selected_item: The QListWidgetItem to delete, whose text should match the selected_filter
         :return: None
         """
-        # Remove the tag from the filter list and tag list
-        self.tag_list.remove(selected_filter)
-        self.filter_list_widget.remove_item_widget(selected_item)
-
-        # Remove the tag from all cards and make sure the decks that have cards with the tag are marked as modified
-        for deck in self.all_decks:
-            for card in deck.cards:
-                if selected_filter in card.tags:
-                    card.tags.remove(selected_filter)
-                    deck.is_modified = True
-
-        # Update the card list, filter cache and tag-to-card index to remove the cards from the tag filter
-        self.build_tag_index()
-        self.update_card_list(self.current_card_list)
-        self.update_filter_list(self.all_decks)
+        # Only the tags of the cards that have the tag are recorded, and their decks are marked as modified
+        commands = [CardChangeCommand(deck, card, {"tags": (list(card.tags),
+                                                             [tag for tag in card.tags if tag != selected_filter])})
+                    for deck in self.all_decks for card in deck.cards if selected_filter in card.tags]
+        self.undo_stack.push(CompoundCommand(commands, f"Delete tag {selected_filter}"))
+        self.refresh_changed_cards()
 
     def update_filter_list(self, app_decks):
         """
@@ -366,8 +518,13 @@ class CardBrowserWidget(QWidget):
         """
         self.filter_list_widget.clear()
         self.filter_list_widget.add_item("-- All Decks --")
+        if self.leech_index:
+            self.filter_list_widget.add_item(self.LEECHES_FILTER)
+        if self.duplicate_index:
+            self.filter_list_widget.add_item(self.DUPLICATES_FILTER)
         for deck in app_decks:
             self.filter_list_widget.add_item(deck.name)
         self.filter_list_widget.add_item("-- All Tags --")
-        self.tag_list = self.generate_tag_list(app_decks)
+        # The tag index is kept up to date as cards change, so the cards don't have to be searched for their tags
+        self.tag_list = sorted(self.tag_to_cards)
         self.filter_list_widget.add_items(self.tag_list)
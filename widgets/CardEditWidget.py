@@ -5,20 +5,21 @@ from PySide6.QtCore import Slot, Signal, QObject
 from __feature__ import snake_case, true_property
 
 from models.Flashcard import Flashcard
+from models.UndoStack import changes_to
 from theme import default_text_font
 
 
 class CardEditSignals(QObject):
     """ This class manages the signals for the CardEditWidget. """
-    card_edited = Signal(Flashcard, Flashcard)
+    card_edited = Signal(Flashcard, dict)
 
 
 class CardEditWidget(QWidget):
     """ This class manages the card editor in the DeckListWidget. """
-    signals = CardEditSignals()
-
     def __init__(self, card: Flashcard = None) -> None:
         super().__init__()
+        # Every editor has its own signals, so closing an editor disconnects it from the browser
+        self.signals = CardEditSignals()
         self.layout = QVBoxLayout()
         self.card = card
 
@@ -62,11 +63,12 @@ class CardEditWidget(QWidget):
 
     @Slot()
     def save_card(self):
-        """ This method sends the updated card to the DeckListWidget. """
-        old_card = Flashcard(question=self.card.question, answer=self.card.answer, tags=self.card.tags)
-        self.card.question = self.front_input.plain_text
-        self.card.answer = self.back_input.plain_text
-        self.card.tags = self.tags_input.text.split()
-
-        self.signals.card_edited.emit(self.card, old_card)
+        """
+        This method sends the fields that were edited to the CardBrowserWidget, as (old value, new value) pairs, which
+        changes the card in a way that can be undone.
+        """
+        changes = changes_to(self.card, {"question": self.front_input.plain_text, "answer": self.back_input.plain_text,
+                                         "tags": self.tags_input.text.split()})
+        if changes:
+            self.signals.card_edited.emit(self.card, changes)
         self.close()
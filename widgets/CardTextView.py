@@ -0,0 +1,97 @@
+from PySide6.QtGui import QPainter, QPalette, QTextDocument, QTextOption, QAbstractTextDocumentLayout, QFont
+from PySide6.QtWidgets import QWidget
+from PySide6.QtCore import Qt, QSize
+
+# noinspection PyUnresolvedReferences
+from __feature__ import snake_case, true_property
+
+
+def build_card_document(html: str, font: QFont, width: int) -> QTextDocument:
+    """
+    Parse a card's HTML into a QTextDocument and lay it out, which is the slow part of showing a card with a long answer,
+    so it can be done before the card is shown.
+    :param html: The HTML to show
+    :param font: The default font of the text
+    :param width: The width to lay the text out for
+    :return: The laid out document
+    """
+    document = QTextDocument()
+    document.default_font = font
+    text_option = QTextOption()
+    text_option.alignment = Qt.AlignCenter
+    text_option.wrap_mode = QTextOption.WrapAtWordBoundaryOrAnywhere
+    document.default_text_option = text_option
+    # The default text option doesn't align HTML blocks, so the text is centered by a block of its own
+    document.set_html(f'<div align="center">{html}</div>')
+    document.text_width = width
+    # Asking for the size lays the whole document out
+    document.size
+    return document
+
+
+class CardTextView(QWidget):
+    """
+    This widget draws a QTextDocument, centered, in place of a QLabel. Setting a document that was built in advance by
+    build_card_document only repaints the widget, whereas setting a QLabel's text parses and lays out the HTML again.
+    """
+
+    def __init__(self):
+        """
+        Initialize the CardTextView with no document.
+        """
+        super().__init__()
+        self.document = None
+
+    def set_document(self, document: QTextDocument) -> None:
+        """
+        Show a document, laying it out again only if it was built for another width.
+        :param document: The document to show, or None to show nothing
+        :return: None
+        """
+        self.document = document
+        if document is not None and document.text_width != self.width:
+            document.text_width = self.width
+        self.update_geometry()
+        self.update()
+
+    def size_hint(self) -> QSize:
+        """
+        Get the size of the document, so layouts make room for it.
+        :return: The size
+        """
+        if self.document is None:
+            return QSize(0, 0)
+        return self.document.size.to_size()
+
+    def minimum_size_hint(self) -> QSize:
+        """
+        Get the height of the document, so the text isn't cut off, as with a QLabel. The text wraps to any width.
+        :return: The minimum size
+        """
+        return QSize(0, self.size_hint().height())
+
+    def resize_event(self, event) -> None:
+        """
+        Lay the document out again if the width changed, which is the only dimension the layout depends on.
+        :param event: The resize event
+        :return: None
+        """
+        if self.document is not None and self.document.text_width != event.size().width():
+            self.document.text_width = event.size().width()
+            self.update_geometry()
+
+    def paint_event(self, event) -> None:
+        """
+        Paint the document, centered vertically, in the widget's text color.
+        :param event: The paint event
+        :return: None
+        """
+        if self.document is None:
+            return
+        painter = QPainter(self)
+        painter.translate(0, max((self.height - self.document.size.height()) / 2, 0))
+        palette = QPalette(self.palette)
+        palette.set_color(QPalette.ColorRole.Text, palette.color(QPalette.ColorRole.WindowText))
+        context = QAbstractTextDocumentLayout.PaintContext()
+        context.palette = palette
+        self.document.document_layout().draw(painter, context)
@@ -1,42 +1,52 @@
-from datetime import datetime
+from collections import deque
 
-from PySide6.QtWidgets import QLabel, QWidget, QPushButton, QVBoxLayout, QHBoxLayout
-from PySide6.QtCore import Qt, Slot, QObject, Signal
+from PySide6.QtWidgets import QWidget, QPushButton, QVBoxLayout, QHBoxLayout
+from PySide6.QtCore import Slot, QObject, Signal
 
 # noinspection PyUnresolvedReference
 from __feature__ import snake_case, true_property
 
-from models.Deck import Deck
 import utils
+import tracing
 from models.Flashcard import Flashcard
+from models.ReviewSession import ReviewSession
+from models.UndoStack import UndoStack
+from widgets.CardTextView import CardTextView, build_card_document
 from theme import card_text_font, PaletteFactory, palettes
 
 
 class CardWidgetSignals(QObject):
     card_passed = Signal(Flashcard)
+    card_reviewed = Signal(Flashcard)
 
 
 class CardWidget(QWidget):
     """
     This widget displays a flashcard for the user to review. The user can click a button to reveal the answer, and then
     click one of two buttons to indicate whether they passed or failed the card. The card is then updated with the
-    appropriate review date and the next card is displayed.
+    appropriate review date and the next card of the review session is displayed.
     """
 
     signals = CardWidgetSignals()
 
-    def __init__(self, deck: Deck):
+    # The number of cards after the current one that are laid out ahead of time
+    PREFETCH_COUNT = 3
+
+    def __init__(self, session: ReviewSession, undo_stack: UndoStack = None):
         """
-        Initialize the CardWidget with a deck of flashcards.
-        :param deck: The deck of flashcards to review
+        Initialize the CardWidget with a review session, which decides which cards are shown and in what order.
+        :param session: The review session of one or more decks
+        :param undo_stack: The undo stack reviews are recorded on, so a mis-graded card can be reviewed again, if any
         """
         super().__init__()
-        self.deck = deck
-        self.cards = self.deck.cards
+        self.session = session
+        self.undo_stack = undo_stack
         self.answer_shown = False
-
-        # Ensure that the only cards in the list are those that need to be reviewed, and sort them by review date
-        self.update_card_list()
+        # A ring buffer of (card, question HTML, answer HTML, question document, answer document) for the current card
+        # and the next few, so showing a card or its answer never has to lay out HTML
+        self.prepared_cards = deque(maxlen=self.PREFETCH_COUNT + 1)
+        # Cards are prepared one at a time whenever the event loop has nothing else to do
+        self.prefetch_timer = utils.make_single_shot_timer(self, 0, self.prefetch_next_card)
 
         vbox = QVBoxLayout()
         settings = utils.load_config("settings.ini")
@@ -45,16 +55,12 @@ class CardWidget(QWidget):
         pass_btn_style = f"background-color: {palette['background_300'].name()}; color: {palette['pass'].name()};"
         fail_btn_style = f"background-color: {palette['background_300'].name()}; color: {palette['fail'].name()};"
 
-        # Question and Answer Labels
-        self.question_label = QLabel("")
-        self.question_label.font = card_text_font
-        self.question_label.alignment = Qt.AlignCenter
-        vbox.add_widget(self.question_label)
+        # Question and Answer views
+        self.question_view = CardTextView()
+        vbox.add_widget(self.question_view)
 
-        self.answer_label = QLabel()
-        self.answer_label.font = card_text_font
-        self.answer_label.alignment = Qt.AlignCenter
-        vbox.add_widget(self.answer_label)
+        self.answer_view = CardTextView()
+        vbox.add_widget(self.answer_view)
 
         # Buttons (Show Answer, Fail, Pass)
         button_box = QHBoxLayout()
@@ -95,11 +101,11 @@ class CardWidget(QWidget):
         Show the answer to the current flashcard.
         :return: None
         """
-        if len(self.cards) == 0:
+        card = self.session.current_card()
+        if card is None:
             return
-        self.answer_label.text = ("<hr style=\"color: #fff; width: 50%;\">Back: " +
-                                  self.cards[0].answer)
-        self.answer_label.show()
+        self.answer_view.set_document(self.prepare_card(card)[4])
+        self.answer_view.show()
         self.show_answer_btn.hide()
         self.pass_btn.show()
         self.fail_btn.show()
@@ -112,48 +118,81 @@ class CardWidget(QWidget):
         :param grade: The grade of the review (0-5)
         :return: None
         """
-        if not self.answer_shown or len(self.cards) == 0:
+        card = self.session.current_card()
+        if not self.answer_shown or card is None:
             return
 
         if grade >= 3:
-            self.signals.card_passed.emit(self.cards[0])
-        self.cards[0].review(grade)
-        # When a card is reviewed, the deck is modified, for the save function to know to save this particular deck
-        self.deck.is_modified = True
-        self.update_card_list()
-
+            self.signals.card_passed.emit(card)
+        command = self.session.answer(grade)
+        if self.undo_stack is not None and command is not None:
+            self.undo_stack.record(command)
+        self.signals.card_reviewed.emit(card)
+        self.show_question()
+
+    def show_question(self):
+        """
+        Show the front of the session's current card, e.g. after a review was undone and the card is shown again.
+        :return: None
+        """
         self.show_answer_btn.show()
         self.pass_btn.hide()
         self.fail_btn.hide()
         self.update_card()
         self.answer_shown = False
 
-    def update_card_list(self):
-        """
-        Update the list of cards to only include those that are due for review.
-        :return:  None
-        """
-        self.cards = [card for card in self.cards if card.next_review_date <= datetime.now()]
-        # Sort the cards by next review
-        self.cards = sorted(self.cards, key=lambda card: card.next_review_date)
-
+    @tracing.span(category="ui")
     def update_card(self):
         """
         Update the current card being displayed.
         :return: None
         """
         # If there are no cards left, display a message
-        if len(self.cards) == 0:
-            self.question_label.text = "No more cards to review"
-            self.answer_label.hide()
+        card = self.session.current_card()
+        if card is None:
+            self.question_view.set_document(
+                build_card_document("No more cards to review", card_text_font, self.question_view.width))
+            self.answer_view.hide()
             self.show_answer_btn.hide()
             self.pass_btn.hide()
             self.fail_btn.hide()
         else:
             # Otherwise, display the front of the card
-            card = self.cards[0]
-            self.question_label.text = "Front: " + card.question
-            self.answer_label.text = ""
+            self.question_view.set_document(self.prepare_card(card)[3])
+            self.answer_view.set_document(None)
+            # Prepare the next cards once the current one has been painted
+            self.prefetch_timer.start(0)
+
+    @tracing.span(category="ui")
+    def prepare_card(self, card: Flashcard) -> tuple:
+        """
+        Get the laid out documents of a card from the ring buffer, preparing them now if the card wasn't prefetched or
+        was edited since.
+        :param card: The card to prepare
+        :return: The card, its question HTML, its answer HTML, its question document and its answer document
+        """
+        question_html = "Front: " + card.question
+        answer_html = "<hr style=\"color: #fff; width: 50%;\">Back: " + card.answer
+        for prepared in self.prepared_cards:
+            if prepared[0] is card and prepared[1] == question_html and prepared[2] == answer_html:
+                return prepared
+        width = self.question_view.width
+        prepared = (card, question_html, answer_html, build_card_document(question_html, card_text_font, width),
+                    build_card_document(answer_html, card_text_font, width))
+        self.prepared_cards.append(prepared)
+        return prepared
+
+    @Slot()
+    def prefetch_next_card(self):
+        """
+        Prepare the first of the next few cards that isn't prepared yet, and check again once the event loop is idle.
+        :return: None
+        """
+        for card in self.session.upcoming_cards(self.PREFETCH_COUNT):
+            if not any(prepared[0] is card for prepared in self.prepared_cards):
+                self.prepare_card(card)
+                self.prefetch_timer.start(0)
+                return
 
     def handle_space_bar(self):
         """
@@ -1,14 +1,18 @@
 from typing import List
 
-from PySide6.QtWidgets import QLabel, QWidget, QPushButton, QVBoxLayout, QHBoxLayout, QStackedWidget
+from PySide6.QtWidgets import QLabel, QWidget, QPushButton, QVBoxLayout, QHBoxLayout, QStackedWidget, QComboBox
 from PySide6.QtCore import Qt, Slot
 
 # noinspection PyUnresolvedReferences
 from __feature__ import snake_case, true_property
 
 import utils
+import tracing
 from models.Deck import Deck
 from models.Flashcard import Flashcard
+from models.ReviewSession import ReviewSession
+from models.Scheduler import schedulers
+from models.UndoStack import UndoStack, Command, ReviewCommand
 from widgets.CardWidget import CardWidget
 from theme import deck_list_item_font, default_text_font, palettes
 
@@ -19,12 +23,16 @@ class DeckListWidget(QWidget):
     displayed in a CardWidget for review.
     """
 
-    def __init__(self, decks: List[Deck]):
+    @tracing.span(category="ui")
+    def __init__(self, decks: List[Deck], undo_stack: UndoStack = None):
         """
         Initialize the DeckListWidget with a list of decks.
         :param decks: The list of decks to display
+        :param undo_stack: The undo stack reviews are recorded on, if any
         """
         super().__init__()
+        self.undo_stack = undo_stack
+        self.card_widget = None
         self.settings = utils.load_config("settings.ini")
         palette = palettes[self.settings.get("USER", "theme", fallback="dark_blue")]
         self.max_reviews = self.settings.getint("USER", "daily_reviews_limit", fallback=100)
@@ -32,13 +40,18 @@ class DeckListWidget(QWidget):
         self.remaining_card_count = None
 
         self.decks = decks
-        self.current_deck = None
         self.layout = QVBoxLayout()
         self.deck_list_widget = QWidget()
         self.deck_list_widget.font = deck_list_item_font
         self.deck_list = QVBoxLayout(self.deck_list_widget)
         # Create a stacked widget to switch between the deck list and the card view
         self.stacked_widget = QStackedWidget()
+        # Review the due cards of every deck in one session
+        if self.decks:
+            review_all_btn = QPushButton("Review All")
+            review_all_btn.tool_tip = "Review the due cards of every deck together"
+            review_all_btn.clicked.connect(self.review_all)
+            self.deck_list.add_widget(review_all_btn)
         # Create a button for each deck
         for deck in self.decks:
             btn_name_layout = QHBoxLayout()
@@ -50,6 +63,17 @@ class DeckListWidget(QWidget):
             view_deck_btn = QPushButton("View Deck")
             view_deck_btn.clicked.connect(lambda clicked, current_deck=deck: self.view_deck(current_deck))
             btn_name_layout.add_widget(view_deck_btn)
+
+            # Each deck can use its own scheduling algorithm
+            scheduler_dropdown = QComboBox()
+            scheduler_dropdown.tool_tip = "Scheduling algorithm"
+            for scheduler in schedulers.values():
+                scheduler_dropdown.add_item(scheduler.title, scheduler.name)
+            scheduler_dropdown.current_index = max(scheduler_dropdown.find_data(deck.get_scheduler_name()), 0)
+            scheduler_dropdown.currentIndexChanged.connect(
+                lambda index, current_deck=deck, dropdown=scheduler_dropdown:
+                current_deck.set_scheduler_name(dropdown.item_data(index)))
+            btn_name_layout.add_widget(scheduler_dropdown)
             self.deck_list.add_layout(btn_name_layout)
         # Add the deck list widget to the stacked widget
         self.stacked_widget.add_widget(self.deck_list_widget)
@@ -74,21 +98,34 @@ class DeckListWidget(QWidget):
         :param deck: The deck to view
         :return: None
         """
-        palette = palettes[self.settings.get("USER", "theme", fallback="dark_blue")]
+        self.start_session(ReviewSession([deck], self.max_reviews, self.max_new))
 
-        self.current_deck = deck
-        filtered_cards, num_cards_remaining = deck.get_filtered_cards(self.max_reviews, self.max_new)
-        filtered_deck = Deck(deck.name, filtered_cards)
+    @Slot()
+    def review_all(self):
+        """
+        Switch to the CardWidget view for the due cards of every deck. The daily limits apply to each deck, and to all
+        the decks together.
+        :return: None
+        """
+        self.start_session(ReviewSession(self.decks, self.max_reviews, self.max_new, self.max_reviews, self.max_new))
 
-        self.remaining_card_count = num_cards_remaining
+    @tracing.span(category="ui")
+    def start_session(self, session: ReviewSession):
+        """
+        Switch to the CardWidget view for a review session.
+        :param session: The review session
+        :return: None
+        """
+        palette = palettes[self.settings.get("USER", "theme", fallback="dark_blue")]
+
+        self.remaining_card_count = session.count_remaining()
         self.remaining_card_count_label.text = f'Remaining cards: <span style="color: {palette["primary_400"].name()}">{self.remaining_card_count}</span>'
         self.remaining_card_count_label.show()
-        # Mark the deck as modified so that it is saved when the user exits the application
-        deck.is_modified = True
         # Create a new widget to house the card widget
         flashcard_layout_widget = QWidget()
         flashcard_layout = QVBoxLayout(flashcard_layout_widget)
-        card_widget = CardWidget(filtered_deck)
+        card_widget = CardWidget(session, self.undo_stack)
+        self.card_widget = card_widget
 
         # If a deck has already been viewed, disconnect the card_passed signal from the CardWidget and reconnect it to the handle_card_review method
         if self.stacked_widget.count > 1:
@@ -111,7 +148,23 @@ class DeckListWidget(QWidget):
         palette = palettes[self.settings.get("USER", "theme", fallback="dark_blue")]
         self.remaining_card_count -= 1
         self.remaining_card_count_label.text = f'Remaining cards: <span style="color: {palette["primary_400"].name()}">{self.remaining_card_count}</span>'
-        self.current_deck.handle_card_review(card.repetitions == 0)
+
+    def show_undone_review(self, command: Command, is_undone: bool):
+        """
+        Show the session's current card again after a review of the session was undone or redone, and count a passed
+        card as remaining again, or no longer.
+        :param command: The command that was undone or redone
+        :param is_undone: True if the command was undone, False if it was redone
+        :return: None
+        """
+        if self.card_widget is None or not isinstance(command, ReviewCommand) or \
+                command.session is not self.card_widget.session:
+            return
+        if command.quality >= 3:
+            palette = palettes[self.settings.get("USER", "theme", fallback="dark_blue")]
+            self.remaining_card_count += 1 if is_undone else -1
+            self.remaining_card_count_label.text = f'Remaining cards: <span style="color: {palette["primary_400"].name()}">{self.remaining_card_count}</span>'
+        self.card_widget.show_question()
 
     def handle_escape(self):
         self.remaining_card_count_label.hide()
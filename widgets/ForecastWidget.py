@@ -0,0 +1,132 @@
+from concurrent.futures import Future
+from datetime import date, timedelta
+
+from PySide6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QLabel, QComboBox
+from PySide6.QtCore import QObject, Signal, Slot
+
+# noinspection PyUnresolvedReferences
+from __feature__ import snake_case, true_property
+
+import utils
+from models.CollectionStats import CollectionStats
+from models.WorkloadSimulator import WorkloadForecaster, snapshot_collection, PERCENTILES
+from widgets.BarChartWidget import BarChartWidget
+from theme import default_text_font
+
+
+class ForecastWidgetSignals(QObject):
+    """ This class defines the signals used by the ForecastWidget. """
+    # Emitted from a worker thread to hand a finished forecast back to the GUI thread
+    forecast_finished = Signal(int, object)
+
+
+class ForecastWidget(QWidget):
+    """
+    This widget forecasts the daily number of reviews for a given new card limit and review limit, by running the
+    WorkloadSimulator on worker processes. It is embedded in the SettingsDialog, and re-runs the forecast whenever the
+    limits change, after a short delay so dragging a slider doesn't queue a forecast for every step.
+    """
+
+    HORIZONS = {"30 days": 30, "90 days": 90, "365 days": 365}
+
+    def __init__(self, stats: CollectionStats, new_card_limit: int, review_limit: int, delay: int = 150):
+        """
+        Initialize the ForecastWidget and start the first forecast.
+        :param stats: The statistics of the collection to forecast from
+        :param new_card_limit: The number of new cards per day to forecast with
+        :param review_limit: The maximum number of reviews per day to forecast with
+        :param delay: The number of milliseconds to wait after a change before re-running the forecast
+        """
+        super().__init__()
+        self.signals = ForecastWidgetSignals()
+        self.new_card_limit = new_card_limit
+        self.review_limit = review_limit
+        self.snapshot = snapshot_collection(stats)
+        self.forecaster = WorkloadForecaster()
+        self.future = None
+        # Forecasts are numbered, so a forecast finishing after the limits changed again is ignored
+        self.forecast_number = 0
+
+        self.layout = QVBoxLayout()
+        horizon_layout = QHBoxLayout()
+        self.horizon_label = QLabel("Forecast:")
+        self.horizon_label.font = default_text_font
+        horizon_layout.add_widget(self.horizon_label)
+        self.horizon_input = QComboBox(self)
+        self.horizon_input.font = default_text_font
+        self.horizon_input.add_items(list(self.HORIZONS))
+        self.horizon_input.currentIndexChanged.connect(lambda: self.timer.start())
+        horizon_layout.add_widget(self.horizon_input)
+        self.layout.add_layout(horizon_layout)
+
+        self.chart = BarChartWidget("Reviews per day (median, with the 95th percentile behind it)")
+        self.layout.add_widget(self.chart)
+        self.summary_label = QLabel()
+        self.summary_label.font = default_text_font
+        self.summary_label.word_wrap = True
+        self.layout.add_widget(self.summary_label)
+        self.set_layout(self.layout)
+
+        self.timer = utils.make_single_shot_timer(self, delay, self.run_forecast)
+        self.signals.forecast_finished.connect(self.show_forecast)
+        self.run_forecast()
+
+    def set_limits(self, new_card_limit: int, review_limit: int) -> None:
+        """
+        Change the limits to forecast with, and re-run the forecast after the delay.
+        :param new_card_limit: The number of new cards per day
+        :param review_limit: The maximum number of reviews per day
+        :return: None
+        """
+        self.new_card_limit = new_card_limit
+        self.review_limit = review_limit
+        self.timer.start()
+
+    @Slot()
+    def run_forecast(self) -> None:
+        """
+        Start a forecast with the current limits and horizon, cancelling the previous one if it's still running.
+        :return: None
+        """
+        if self.future is not None:
+            self.future.cancel()
+        self.forecast_number += 1
+        forecast_number = self.forecast_number
+        days = self.HORIZONS[self.horizon_input.current_text]
+        self.summary_label.text = "Simulating..."
+        self.future = self.forecaster.forecast(self.snapshot, self.new_card_limit, self.review_limit, days)
+        self.future.add_done_callback(
+            lambda future: None if future.cancelled() else self.signals.forecast_finished.emit(forecast_number, future))
+
+    @Slot(int, object)
+    def show_forecast(self, forecast_number: int, future: Future) -> None:
+        """
+        Show a finished forecast, unless a newer one was started since.
+        :param forecast_number: The number of the forecast
+        :param future: The finished forecast
+        :return: None
+        """
+        if forecast_number != self.forecast_number:
+            return
+        if future.exception() is not None:
+            self.summary_label.text = f"The forecast failed: {future.exception()}"
+            return
+
+        bands = dict(zip(PERCENTILES, future.result()))
+        median, upper = bands[50], bands[95]
+        today = date.today()
+        self.chart.set_data(median.tolist(), [(today + timedelta(days=offset)).strftime("%m-%d")
+                                              for offset in range(len(median))], upper.tolist())
+        self.summary_label.text = (f"In {len(median)} days: about {median[-1]:.0f} reviews per day "
+                                   f"(90% chance of {bands[5][-1]:.0f} to {upper[-1]:.0f}), "
+                                   f"with a peak of {median.max():.0f}")
+
+    def shutdown(self) -> None:
+        """
+        Cancel the running forecast and stop the worker processes, should be called when the widget is no longer needed.
+        :return: None
+        """
+        self.timer.stop()
+        if self.future is not None:
+            self.future.cancel()
+        self.forecaster.shutdown()
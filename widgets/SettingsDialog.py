@@ -2,18 +2,20 @@ from configparser import ConfigParser
 
 from PySide6.QtGui import QIntValidator
 from PySide6.QtWidgets import QLabel, QPushButton, QVBoxLayout, QHBoxLayout, QLineEdit, QDialog, QFileDialog, \
-    QComboBox, QApplication
+    QComboBox, QApplication, QSlider
 from PySide6.QtCore import Qt, Slot
 
 # noinspection PyUnresolvedReference
 from __feature__ import snake_case, true_property
 
 import utils
+from models.CollectionStats import CollectionStats
+from widgets.ForecastWidget import ForecastWidget
 from theme import default_text_font, PaletteFactory
 
 
 class SettingsDialog(QDialog):
-    def __init__(self, settings: ConfigParser):
+    def __init__(self, settings: ConfigParser, stats: CollectionStats = None):
         super().__init__()
         self.app = QApplication.instance()
         self.window_title = "Settings"
@@ -73,8 +75,36 @@ class SettingsDialog(QDialog):
         self.new_cards_limit_input.text = self.settings['USER'][
             'new_card_limit'] if 'USER' in self.settings.sections() else '20'
         new_cards_layout.add_widget(self.new_cards_limit_input)
+        self.new_cards_limit_slider = QSlider(Qt.Horizontal)
+        self.new_cards_limit_slider.set_range(0, 100)
+        self.new_cards_limit_slider.value = int(self.new_cards_limit_input.text or 0)
+        self.new_cards_limit_slider.valueChanged.connect(self.handle_new_cards_slider_change)
+        self.new_cards_limit_input.textEdited.connect(self.handle_limits_change)
+        self.review_limit_input.textEdited.connect(self.handle_limits_change)
+        new_cards_layout.add_widget(self.new_cards_limit_slider)
         self.layout.add_layout(new_cards_layout)
 
+        # The forecast of the review load is only shown if there are statistics to forecast from
+        self.forecast_widget = None
+        if stats is not None:
+            self.forecast_widget = ForecastWidget(stats, int(self.new_cards_limit_input.text or 0),
+                                                  int(self.review_limit_input.text or 0))
+            self.layout.add_widget(self.forecast_widget)
+            self.finished.connect(self.forecast_widget.shutdown)
+
+        autosave_layout = QHBoxLayout()
+        self.autosave_interval_label = QLabel("Autosave Interval (ms):")
+        self.autosave_interval_label.font = default_text_font
+        autosave_layout.add_widget(self.autosave_interval_label)
+        self.autosave_interval_input = QLineEdit()
+        self.autosave_interval_input.font = default_text_font
+        autosave_validator = QIntValidator()
+        autosave_validator.set_range(100, 600000)
+        self.autosave_interval_input.set_validator(autosave_validator)
+        self.autosave_interval_input.text = self.settings.get("USER", "autosave_interval", fallback="2000")
+        autosave_layout.add_widget(self.autosave_interval_input)
+        self.layout.add_layout(autosave_layout)
+
         self.save_button = QPushButton("Save")
         self.save_button.clicked.connect(self.save_settings)
         self.layout.add_widget(self.save_button)
@@ -83,7 +113,7 @@ class SettingsDialog(QDialog):
         self.warning_text.font = default_text_font
         self.layout.add_widget(self.warning_text)
 
-        self.resize(700, 250)
+        self.resize(700, 600 if self.forecast_widget else 250)
         self.set_layout(self.layout)
 
     @Slot()
@@ -94,10 +124,26 @@ class SettingsDialog(QDialog):
         self.settings['USER']['decks_directory'] = self.directory_input.text
         self.settings['USER']['daily_reviews_limit'] = self.review_limit_input.text
         self.settings['USER']['new_card_limit'] = self.new_cards_limit_input.text
+        self.settings['USER']['autosave_interval'] = self.autosave_interval_input.text or '2000'
         self.settings['USER']['theme'] = self.themes_input.current_text.lower().replace(' ', '_')
         utils.save_config(self.settings, "settings.ini")
         self.close()
 
+    @Slot()
+    def handle_new_cards_slider_change(self):
+        self.new_cards_limit_input.text = str(self.new_cards_limit_slider.value)
+        self.handle_limits_change()
+
+    @Slot()
+    def handle_limits_change(self):
+        # Keep the slider in sync with the text, without it setting the text back
+        self.new_cards_limit_slider.block_signals(True)
+        self.new_cards_limit_slider.value = int(self.new_cards_limit_input.text or 0)
+        self.new_cards_limit_slider.block_signals(False)
+        if self.forecast_widget:
+            self.forecast_widget.set_limits(int(self.new_cards_limit_input.text or 0),
+                                            int(self.review_limit_input.text or 0))
+
     @Slot()
     def get_directory(self):
         dialog = QFileDialog()
@@ -0,0 +1,89 @@
+from datetime import date, timedelta
+
+from PySide6.QtWidgets import QWidget, QGridLayout, QTreeWidget, QTreeWidgetItem
+from PySide6.QtCore import Qt
+
+# noinspection PyUnresolvedReferences
+from __feature__ import snake_case, true_property
+
+import utils
+from models.CollectionStats import CollectionStats
+from widgets.BarChartWidget import BarChartWidget
+from theme import card_list_item_font
+
+
+class StatisticsWidget(QWidget):
+    """
+    This widget shows statistics about the collection: the due forecast, the daily review counts, the distribution of
+    easiness factors, and the retention of each deck and tag. All numbers come from a CollectionStats instance, which
+    is kept up to date after each review, so opening the window doesn't loop over the cards.
+    """
+
+    FORECAST_DAYS = 30
+    HISTORY_DAYS = 30
+
+    def __init__(self, stats: CollectionStats):
+        """
+        Initialize the StatisticsWidget and show it.
+        :param stats: The statistics of the collection to show
+        """
+        super().__init__()
+        self.window_title = "Statistics"
+        self.stats = stats
+        self.layout = QGridLayout()
+
+        self.forecast_chart = BarChartWidget(f"Due in the next {self.FORECAST_DAYS} days")
+        self.layout.add_widget(self.forecast_chart, 0, 0)
+        self.daily_reviews_chart = BarChartWidget(f"Reviews in the last {self.HISTORY_DAYS} days")
+        self.layout.add_widget(self.daily_reviews_chart, 0, 1)
+        self.easiness_chart = BarChartWidget("Easiness factors")
+        self.layout.add_widget(self.easiness_chart, 1, 0)
+
+        self.retention_tree_widget = QTreeWidget()
+        self.retention_tree_widget.font = card_list_item_font
+        self.retention_tree_widget.set_header_labels(["Deck / Tag", "Reviews", "Retention"])
+        self.retention_tree_widget.set_column_width(0, 200)
+        self.layout.add_widget(self.retention_tree_widget, 1, 1)
+        self.layout.set_column_stretch(0, 1)
+        self.layout.set_column_stretch(1, 1)
+
+        self.refresh()
+
+        utils.setup_shortcuts(self, shortcuts={
+            "Esc": self.close,
+            "F5": self.refresh
+        })
+        self.set_layout(self.layout)
+        self.resize(1000, 600)
+        self.show()
+
+    def refresh(self) -> None:
+        """
+        Update the charts and the retention table from the collection statistics.
+        :return: None
+        """
+        self.stats.ensure_current()
+        today = date.today()
+
+        forecast = self.stats.due_forecast(self.FORECAST_DAYS)
+        self.forecast_chart.set_data(forecast.tolist(), [(today + timedelta(days=offset)).strftime("%m-%d")
+                                                         for offset in range(self.FORECAST_DAYS)])
+
+        reviews, passed = self.stats.daily_review_counts(self.HISTORY_DAYS)
+        first_day = today - timedelta(days=len(reviews) - 1)
+        self.daily_reviews_chart.set_data(reviews.tolist(), [(first_day + timedelta(days=offset)).strftime("%m-%d")
+                                                             for offset in range(len(reviews))])
+
+        counts, edges = self.stats.easiness_distribution()
+        self.easiness_chart.set_data(counts.tolist(), [f"{edge:.2f}" for edge in edges[:-1]])
+
+        self.retention_tree_widget.clear()
+        for title, rows in (("Decks", self.stats.retention_by_deck()), ("Tags", self.stats.retention_by_tag())):
+            group_item = QTreeWidgetItem([title])
+            for name, reviews, retention in rows:
+                item = QTreeWidgetItem([name, str(reviews), f"{retention:.0%}" if reviews else "-"])
+                item.set_text_alignment(1, Qt.AlignRight)
+                item.set_text_alignment(2, Qt.AlignRight)
+                group_item.add_child(item)
+            self.retention_tree_widget.add_top_level_item(group_item)
+            group_item.set_expanded(True)